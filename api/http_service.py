@@ -0,0 +1,449 @@
+# This is 'api/http_service.py'
+#
+# An HTTP/JSON front end for the backend modules, for the web catalog and
+# the self-checkout kiosks. Started with serve.py.
+#
+#   POST /login      {"username", "password"}              -> {"token"}
+#   POST /logout                                            (token)
+#   GET  /books?q=gatsby[&cursor=...][&limit=50]            search (cached)
+#   GET  /books/<id>
+#   POST /books      {"title", "author", "isbn", "genre", "quantity"}   (token)
+#   GET  /members?q=alice[&cursor=...]                      (token)
+#   POST /members    {"name", "email", "phone_number"}     (token)
+#   POST /loans      {"book_id", "member_id"}               issue   (token)
+#   POST /returns    {"book_id", "member_id"}               return  (token)
+#   POST /holds      {"book_id", "member_id"}               place a hold  (token)
+#   GET  /holds?member_id=7                                 a member's holds  (token)
+#   DELETE /holds/<id>                                      cancel a hold  (token)
+#   GET  /health, GET /metrics (Prometheus text)
+#
+# "(token)" endpoints need "Authorization: Bearer <token>" from /login.
+#
+# The server is plain asyncio. Each connection can pipeline requests:
+# they are all started as soon as they are read and answered in order.
+# The backend calls are the async versions in modules/async_operations.py,
+# so every request waiting on the database is just a suspended coroutine
+# and the event loop can keep the whole async pool (ASYNC_POOL_CONFIG)
+# busy. Password checks run on a small thread pool of their own, because
+# a login takes a deliberate fraction of a second (see utils/passwords.py).
+# Search responses are cached as encoded bytes for a couple of seconds,
+# and the cache is dropped when a book is added. Loans don't drop it: a
+# result's available count may be up to search_cache_ttl seconds old,
+# which is as stale as writes from the desktop app make it anyway, and
+# POST /loans checks availability in the database regardless. Holds
+# (modules/holds.py) are rare next to searches and loans, so they run the
+# regular functions on a worker thread rather than having async copies.
+
+import asyncio
+import datetime
+import decimal
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from database.async_db_connection import close_async_pool, get_async_pool
+from modules import async_operations as library, holds, login_system
+from modules.issue_return import NO_COPY, REFUSALS
+from utils.cache import LRUCache
+from utils.config import PAGE_SIZE
+from utils.log import get_logger
+from utils.metrics import registry
+
+log = get_logger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+MAX_PAGE = 500          # Largest ?limit= accepted
+IDLE_TIMEOUT = 60.0     # Seconds a keep-alive connection may sit unused
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 411: 'Length Required',
+           413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+_requests = registry.counter('lms_http_requests_total', "HTTP requests by route and status.", ('route', 'status'))
+_request_seconds = registry.histogram('lms_http_request_seconds', "HTTP request handling time.", ('route',))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body', 'version')
+
+    def __init__(self, method, target, version, headers, body):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path.rstrip('/') or '/'
+        self.query = dict(parse_qsl(parts.query))
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    @property
+    def token(self):
+        scheme, _, token = self.headers.get('authorization', '').partition(' ')
+        return token.strip() if scheme.lower() == 'bearer' else None
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b'{}')
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Body must be a JSON object.")
+        return data
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def _encode(payload):
+    return json.dumps(payload, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+def _fields(data, spec):
+    """Checks a JSON body against {name: type}; returns the values in order."""
+    values = []
+    for name, kind in spec.items():
+        value = data.get(name)
+        if kind is int and isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if value is None or not isinstance(value, kind) or isinstance(value, bool):
+            raise HTTPError(400, f"Field {name!r} is required and must be {kind.__name__}.")
+        values.append(value)
+    return values
+
+
+def _page_args(request):
+    term = request.query.get('q', '').strip()
+    if not term:
+        raise HTTPError(400, "Query parameter 'q' is required.")
+    try:
+        limit = min(MAX_PAGE, max(1, int(request.query.get('limit', PAGE_SIZE))))
+        cursor = json.loads(request.query['cursor']) if request.query.get('cursor') else None
+    except ValueError:
+        raise HTTPError(400, "Bad 'limit' or 'cursor'.")
+    # A cursor is whatever next_cursor was: an id, or a [score, id] pair
+    if not (cursor is None or _is_number(cursor) or
+            (isinstance(cursor, list) and len(cursor) == 2 and all(map(_is_number, cursor)))):
+        raise HTTPError(400, "Pass back 'next_cursor' from the previous page as 'cursor'.")
+    return term, cursor, limit
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class LibraryService:
+    """Routes HTTP requests to the backend modules."""
+
+    def __init__(self, login_workers=2, search_cache_ttl=2.0, max_pipeline=32):
+        self.max_pipeline = max_pipeline  # Requests in flight per connection
+        self._login_executor = ThreadPoolExecutor(max_workers=login_workers, thread_name_prefix="http-login")
+        self.search_cache = LRUCache(max_entries=10_000, max_bytes=32 * 1024 * 1024, ttl=search_cache_ttl)
+        self._routes = {
+            ('POST', '/login'): self.login,
+            ('POST', '/logout'): self.logout,
+            ('GET', '/books'): self.search_books,
+            ('POST', '/books'): self.add_book,
+            ('GET', '/members'): self.search_members,
+            ('POST', '/members'): self.register_member,
+            ('POST', '/loans'): self.issue_book,
+            ('POST', '/returns'): self.return_book,
+            ('POST', '/holds'): self.place_hold,
+            ('GET', '/holds'): self.member_holds,
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+        }
+        registry.register_collector('lms_http_search_cache', self.search_cache.stats)
+
+    def _session(self, request):
+        session = login_system.authenticate(request.token)
+        if session is None:
+            raise HTTPError(401, "Log in first: send 'Authorization: Bearer <token>' from POST /login.")
+        return session
+
+    # --- Routes; each returns (status, payload) or (status, bytes) ---
+
+    async def login(self, request):
+        username, password = _fields(request.json(), {'username': str, 'password': str})
+        token = await asyncio.get_running_loop().run_in_executor(
+            self._login_executor, login_system.login, username, password)
+        if token is None:
+            raise HTTPError(401, "Invalid username or password.")
+        return 200, {'token': token}
+
+    async def logout(self, request):
+        return 200, {'logged_out': login_system.logout(request.token or '')}
+
+    async def search_books(self, request):
+        term, cursor, limit = _page_args(request)
+        key = (term, request.query.get('cursor', ''), limit)
+        body = self.search_cache.get(key)
+        if body is None:
+            generation = self.search_cache.generation  # Drop the result if the catalog changes meanwhile
+            rows, next_cursor = await library.search_book_page(term, cursor, limit)
+            body = _encode({'results': rows, 'next_cursor': json.dumps(next_cursor) if next_cursor else None})
+            self.search_cache.put(key, body, if_generation=generation)
+        return 200, body
+
+    async def get_book(self, request, book_id):
+        book = await library.get_book(book_id)
+        if book is None:
+            raise HTTPError(404, f"No book with ID {book_id}.")
+        return 200, book
+
+    async def add_book(self, request):
+        self._session(request)
+        data = request.json()
+        title, author, quantity = _fields(data, {'title': str, 'author': str, 'quantity': int})
+        added = await library.add_book(title, author, data.get('isbn') or '', data.get('genre') or '', quantity)
+        if not added:
+            raise HTTPError(409, "Could not add the book (is the ISBN already in the catalog?).")
+        self.search_cache.clear()  # So the new title shows up in searches
+        return 201, {'added': True}
+
+    async def search_members(self, request):
+        self._session(request)
+        term, cursor, limit = _page_args(request)
+        rows, next_cursor = await library.view_member_details_page(term, cursor, limit)
+        return 200, {'results': rows, 'next_cursor': json.dumps(next_cursor) if next_cursor else None}
+
+    async def register_member(self, request):
+        self._session(request)
+        name, email, phone = _fields(request.json(), {'name': str, 'email': str, 'phone_number': str})
+        if not await library.register_member(name, email, phone):
+            raise HTTPError(409, "Could not register the member (is the email already registered?).")
+        return 201, {'registered': True}
+
+    async def issue_book(self, request):
+        self._session(request)
+        book_id, member_id = _fields(request.json(), {'book_id': int, 'member_id': int})
+        refusal = []
+        if not await library.issue_book(book_id, member_id, on_refused=lambda reason: refusal.append(reason)):
+            if not refusal:  # A database error, already logged
+                raise HTTPError(503, "Could not issue the book; try again.")
+            if refusal[0] != NO_COPY:
+                raise HTTPError(404, REFUSALS[refusal[0]])
+            raise HTTPError(409, f"Book ID {book_id} is not available for issue.")
+        return 201, {'issued': True, 'book_id': book_id, 'member_id': member_id}
+
+    async def return_book(self, request):
+        self._session(request)
+        book_id, member_id = _fields(request.json(), {'book_id': int, 'member_id': int})
+        if not await library.return_book(book_id, member_id):
+            raise HTTPError(409, f"No open loan of book ID {book_id} for member ID {member_id}.")
+        return 200, {'returned': True, 'book_id': book_id, 'member_id': member_id}
+
+    async def place_hold(self, request):
+        self._session(request)
+        book_id, member_id = _fields(request.json(), {'book_id': int, 'member_id': int})
+        result = await asyncio.to_thread(holds.place_hold, book_id, member_id)
+        if not result['success']:
+            raise HTTPError(409, result['message'])
+        return 201, result
+
+    async def member_holds(self, request):
+        self._session(request)
+        member_id = request.query.get('member_id', '')
+        if not member_id.isdigit():
+            raise HTTPError(400, "Query parameter 'member_id' is required.")
+        return 200, {'holds': await asyncio.to_thread(holds.member_holds, int(member_id))}
+
+    async def cancel_hold(self, request, hold_id):
+        self._session(request)
+        if not await asyncio.to_thread(holds.cancel_hold, hold_id):
+            raise HTTPError(404, f"No active hold with ID {hold_id}.")
+        return 200, {'cancelled': True, 'hold_id': hold_id}
+
+    async def health(self, request):
+        return 200, {'status': 'ok'}
+
+    async def metrics(self, request):
+        return 200, registry.to_prometheus().encode('utf-8')
+
+    # --- Dispatch ---
+
+    def _route(self, request):
+        """Returns (route name, coroutine) for a request, or raises HTTPError."""
+        handler = self._routes.get((request.method, request.path))
+        if handler is not None:
+            return request.path, handler(request)
+        if request.path.startswith('/books/') and request.method == 'GET':
+            book_id = request.path[len('/books/'):]
+            if book_id.isdigit():
+                return '/books/<id>', self.get_book(request, int(book_id))
+        if request.path.startswith('/holds/') and request.method == 'DELETE':
+            hold_id = request.path[len('/holds/'):]
+            if hold_id.isdigit():
+                return '/holds/<id>', self.cancel_hold(request, int(hold_id))
+        if any(path == request.path for _, path in self._routes):
+            raise HTTPError(405, f"{request.method} is not supported on {request.path}.")
+        raise HTTPError(404, f"No such endpoint: {request.path}")
+
+    async def respond(self, request):
+        """Handles one request; returns the complete response as bytes."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        route = request.path
+        try:
+            route, work = self._route(request)
+            status, payload = await work
+        except HTTPError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception as e:
+            log.error("Request failed", method=request.method, path=request.path, error=str(e))
+            status, payload = 500, {'error': "Internal server error."}
+        body = payload if isinstance(payload, bytes) else _encode(payload)
+        content_type = 'text/plain; version=0.0.4' if route == '/metrics' else 'application/json'
+        _requests.inc(route, status)
+        _request_seconds.observe(loop.time() - started, route)
+        return _response(status, body, content_type, request.keep_alive)
+
+    async def handle_connection(self, reader, writer):
+        """Reads requests off one connection and answers them in order."""
+        in_flight = asyncio.Queue(maxsize=self.max_pipeline)
+        responder = asyncio.create_task(self._write_responses(in_flight, writer))
+        try:
+            while not responder.done():  # It stops when the client goes away
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), IDLE_TIMEOUT)
+                except HTTPError as e:
+                    await _queue(in_flight, responder,
+                                 _completed(_response(e.status, _encode({'error': e.message}), close=True)))
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break  # The client closed the connection
+                # Start it now; the responder sends the answers in request order
+                task = asyncio.create_task(self.respond(request))
+                if not await _queue(in_flight, responder, task):
+                    task.add_done_callback(lambda t: t.exception())  # Its answer can't be sent
+                    break
+                if not request.keep_alive:
+                    break
+        finally:
+            await _queue(in_flight, responder, None)
+            await responder
+
+    async def _write_responses(self, in_flight, writer):
+        try:
+            while True:
+                task = await in_flight.get()
+                if task is None:
+                    break
+                response = await task
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Unsent answers are dropped; their backend calls still complete
+            while not in_flight.empty():
+                task = in_flight.get_nowait()
+                if task is not None:
+                    task.add_done_callback(lambda t: t.exception())
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, ready=None):
+        """Runs the server until cancelled."""
+        server = await asyncio.start_server(self.handle_connection, host, port,
+                                            limit=MAX_HEADER_BYTES, backlog=1024)
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        pool = get_async_pool()
+        await pool.warm()
+        log.info("Serving HTTP", address=addresses, pool_size=pool.max_size)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._login_executor.shutdown(wait=False, cancel_futures=True)
+            await close_async_pool()
+
+
+async def _queue(in_flight, responder, item):
+    """Hands item to the responder; False if the responder has stopped and never will take it."""
+    if responder.done():
+        return False
+    try:
+        in_flight.put_nowait(item)
+        return True
+    except asyncio.QueueFull:  # max_pipeline answers waiting: wait for room, or for the responder to stop
+        put = asyncio.ensure_future(in_flight.put(item))
+        await asyncio.wait((put, responder), return_when=asyncio.FIRST_COMPLETED)
+        if put.done():
+            return True
+        put.cancel()
+        return False
+
+
+def _completed(response):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(response)
+    return future
+
+
+def _response(status, body, content_type='application/json', keep_alive=True, close=False):
+    keep = keep_alive and not close
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n")
+    return head.encode('ascii') + body
+
+
+async def _read_request(reader):
+    """Parses one request from the stream; None at a clean end of stream."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Request headers are too large.")
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    if 'transfer-encoding' in headers:
+        raise HTTPError(411, "Send a Content-Length instead of a chunked body.")
+    length = headers.get('content-length')
+    if length:
+        if not length.isdigit():
+            raise HTTPError(400, "Bad Content-Length.")
+        if int(length) > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body is too large.")
+        body = await reader.readexactly(int(length))
+    return Request(method.upper(), target, version, headers, body)
@@ -0,0 +1,39 @@
+# This is 'assess_fines.py'
+# Nightly job: records the fine accrued so far on every open loan.
+#
+#   python assess_fines.py
+#   python assess_fines.py --as-of 2024-06-30 --grace-days 3 --cap 500 --dry-run
+
+import argparse
+import datetime
+import json
+import sys
+
+from modules.fine_assessment import assess_fines, CHUNK_SIZE
+from utils.config import FINE_GRACE_DAYS, FINE_CAP
+from utils.log import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assess accrued fines on all open loans.")
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat, help="Date to assess at (default: today)")
+    parser.add_argument('--grace-days', type=int, default=FINE_GRACE_DAYS)
+    parser.add_argument('--cap', type=float, default=FINE_CAP, help="Maximum fine per loan")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="Compute and report, but write nothing")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        summary = assess_fines(as_of=args.as_of, chunk_size=args.chunk_size, grace_days=args.grace_days,
+                               cap=args.cap, dry_run=args.dry_run)
+    except ConnectionError as e:
+        print(f"Fine assessment failed: {e}")
+        return 1
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
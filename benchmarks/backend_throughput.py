@@ -0,0 +1,57 @@
+# This is 'benchmarks/backend_throughput.py'
+#
+# Compares throughput of the backend functions between storage engines.
+#
+#   python -m benchmarks.backend_throughput --backend sqlite --path :memory:
+#   python -m benchmarks.backend_throughput --backend mysql
+
+import argparse
+import time
+
+from database.backends import create_backend
+from database.db_connection import set_backend
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+from modules import book_management, member_management, issue_return, login_system
+
+
+def timed(label, count, func):
+    """Runs func(i) for i in range(count) and prints ops/sec."""
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<16} {count:>7} ops  {count / elapsed:>10.1f} ops/sec")
+
+
+def run(count):
+    tag = int(time.time())
+    timed('add_book', count, lambda i: book_management.add_book(
+        f'Bench Title {tag}-{i}', f'Author {i % 97}', f'B{tag}{i:07d}', 'Bench', 2))
+    timed('register_member', count, lambda i: member_management.register_member(
+        f'Bench Member {i}', f'bench{tag}.{i}@example.com', f'555{i:07d}'))
+
+    books = book_management.search_book(f'Bench Title {tag}-')
+    members = member_management.view_member_details(f'bench{tag}.')
+    pairs = list(zip([b['book_id'] for b in books], [m['member_id'] for m in members]))
+
+    timed('search_book', count, lambda i: book_management.search_book(f'Author {i % 97}'))
+    timed('issue_book', len(pairs), lambda i: issue_return.issue_book(*pairs[i]))
+    timed('return_book', len(pairs), lambda i: issue_return.return_book(*pairs[i]))
+    # A login costs a deliberate password hash (see benchmarks/password_hashing.py), so fewer of them
+    timed('verify_login', max(1, count // 100), lambda i: login_system.verify_login('admin', 'admin'))
+    token = login_system.login('admin', 'admin')
+    timed('authenticate', count, lambda i: login_system.authenticate(token))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure backend throughput on one storage engine.")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default=':memory:', help="SQLite file, or :memory:")
+    parser.add_argument('--count', type=int, default=1000, help="Operations per function")
+    args = parser.parse_args()
+    configure_logging('WARNING')
+
+    set_backend(create_backend(args.backend, DB_CONFIG, args.path))
+    print(f"--- {args.backend} ({args.path if args.backend == 'sqlite' else DB_CONFIG['host']}) ---")
+    run(args.count)
@@ -0,0 +1,352 @@
+# This is 'benchmarks/circulation.py'
+#
+# End-to-end benchmark of the circulation desk workload. Seeds a synthetic
+# catalog and member base, replays a weighted mix of the calls the GUI
+# makes, and writes per-operation latency percentiles and ops/sec as JSON.
+#
+#   python -m benchmarks.circulation --path /tmp/bench.db --scale 100000 --output main.json
+#   python -m benchmarks.circulation --path /tmp/bench.db --reuse --compare main.json
+#   python -m benchmarks.circulation --backend mysql --scale 1000000 --ops 50000
+#
+# The same --seed gives the same data and the same sequence of calls, so
+# two branches can be compared run for run. With --compare, the exit code
+# is 1 if any operation's p95 got more than --threshold percent slower.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from database.backends import create_backend
+from database.db_connection import set_backend, pooled_connection
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+from utils.metrics import registry
+from modules import book_management, member_management, issue_return, login_system
+
+DEFAULT_MIX = {'search_book': 40, 'view_member_details': 20, 'issue_book': 15,
+               'return_book': 15, 'authenticate': 9, 'verify_login': 1}
+SEED_BATCH = 10_000
+
+WORDS = ("river night garden stone silver winter empire shadow ocean secret city fire light "
+         "house war peace journey island mountain forest dream song history king queen child "
+         "road storm star glass iron golden last first hidden lost broken wild quiet dark red "
+         "blue green black white summer autumn spring morning evening north south east west "
+         "letters tales voices echoes bridge tower castle harbor valley desert memory time").split()
+FIRST_NAMES = ("Anna Ben Chloe David Emma Farah Gita Hiro Ines Jon Kavya Liam Maya Nikhil Olga "
+               "Priya Quinn Ravi Sara Tomas Uma Vikram Wen Xavier Yara Zoe").split()
+LAST_NAMES = ("Patel Smith Garcia Chen Kumar Novak Silva Khan Okafor Rossi Tanaka Mueller Haddad "
+              "Ivanova Jensen Lopez Mensah Nguyen Oliveira Park Reyes Sato Weber Yilmaz").split()
+GENRES = ("Fiction", "Mystery", "Science", "History", "Poetry", "Children", "Reference", "Biography")
+
+
+# --- Seeding ---
+
+def _book_rows(count, rng):
+    for i in range(count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield (title, author, f"978{i:010d}", rng.choice(GENRES), 3, 3)
+
+
+def _member_rows(count, rng):
+    today = datetime.date.today()
+    for i in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield (name, f"member{i}@example.org", f"555{i:07d}", today - datetime.timedelta(days=rng.randint(0, 3650)))
+
+
+def _insert_batched(cursor, conn, query, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= SEED_BATCH:
+            cursor.executemany(query, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        cursor.executemany(query, batch)
+        conn.commit()
+
+
+def _id_range(cursor, table, key):
+    cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+    low, high = cursor.fetchone()
+    return (low, high) if low is not None else (0, -1)
+
+
+def seed(books, members, open_loans, rng):
+    """Fills an empty database; returns (book id range, member id range, open loans)."""
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM books")
+        if cursor.fetchone()[0]:
+            raise RuntimeError("The database already has books; use an empty one, or --reuse it.")
+
+        _insert_batched(cursor, conn, """
+            INSERT INTO books (title, author, isbn, genre, quantity, available_quantity)
+            VALUES (%s, %s, %s, %s, %s, %s)""", _book_rows(books, rng))
+        _insert_batched(cursor, conn, """
+            INSERT INTO members (name, email, phone_number, registration_date)
+            VALUES (%s, %s, %s, %s)""", _member_rows(members, rng))
+        book_range = _id_range(cursor, 'books', 'book_id')
+        member_range = _id_range(cursor, 'members', 'member_id')
+
+        # One open loan on each of the first `open_loans` books, some of them overdue
+        today = datetime.date.today()
+        loans = [(book_range[0] + i, rng.randint(*member_range)) for i in range(min(open_loans, books))]
+        rows = []
+        for book_id, member_id in loans:
+            issued = today - datetime.timedelta(days=rng.randint(0, 40))
+            rows.append((book_id, member_id, issued, issued + datetime.timedelta(days=issue_return.LOAN_DAYS)))
+        _insert_batched(cursor, conn, """
+            INSERT INTO transactions (book_id, member_id, issue_date, due_date, return_date, fine_amount)
+            VALUES (%s, %s, %s, %s, NULL, 0)""", rows)
+        cursor.execute("UPDATE books SET available_quantity = 2, on_loan = 1, lifetime_issues = 1 "
+                       "WHERE book_id BETWEEN %s AND %s", (book_range[0], book_range[0] + len(loans) - 1))
+        conn.commit()
+        cursor.close()
+    return book_range, member_range, loans
+
+
+def existing_data():
+    """Reads the id ranges and open loans of a database seeded earlier."""
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cursor = conn.cursor()
+        book_range = _id_range(cursor, 'books', 'book_id')
+        member_range = _id_range(cursor, 'members', 'member_id')
+        cursor.execute("SELECT book_id, member_id FROM transactions WHERE return_date IS NULL ORDER BY transaction_id")
+        loans = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+    return book_range, member_range, loans
+
+
+# --- The workload ---
+
+class Workload:
+    """Picks the next call and its arguments; keeps track of open loans."""
+
+    def __init__(self, book_range, member_range, loans, rng):
+        self.book_range = book_range
+        self.member_range = member_range
+        self.loans = list(loans)
+        self.rng = rng
+        self.token = None  # Session token, from the first authenticate()
+
+    def search_book(self):
+        roll = self.rng.random()
+        if roll < 0.6:
+            term = self.rng.choice(WORDS)                    # A title word
+        elif roll < 0.9:
+            term = self.rng.choice(LAST_NAMES)               # An author
+        else:
+            book_id = self.rng.randint(*self.book_range)     # An exact ISBN
+            term = f"978{book_id - self.book_range[0]:010d}"
+        book_management.search_book(term)  # No hits is still a valid answer
+        return True
+
+    def view_member_details(self):
+        if self.rng.random() < 0.5:
+            member_index = self.rng.randint(0, self.member_range[1] - self.member_range[0])
+            term = f"member{member_index}@"
+        else:
+            term = self.rng.choice(LAST_NAMES)
+        member_management.view_member_details(term)
+        return True
+
+    def issue_book(self):
+        book_id = self.rng.randint(*self.book_range)
+        member_id = self.rng.randint(*self.member_range)
+        if issue_return.issue_book(book_id, member_id):
+            self.loans.append((book_id, member_id))
+            return True
+        return False  # All copies out
+
+    def return_book(self):
+        if not self.loans:
+            return self.issue_book()
+        book_id, member_id = self.loans.pop(self.rng.randrange(len(self.loans)))
+        return issue_return.return_book(book_id, member_id)
+
+    def verify_login(self):
+        return login_system.verify_login('admin', 'admin')
+
+    def authenticate(self):
+        # A desk's requests after logging in: a session check, no password hash
+        if login_system.authenticate(self.token) is None:
+            self.token = login_system.login('admin', 'admin')
+        return self.token is not None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+def replay(workload, mix, ops, warmup, rng):
+    """Runs `warmup` unmeasured calls, then `ops` measured ones; returns results."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    calls = {name: getattr(workload, name) for name in names}
+    latencies = {name: [] for name in names}
+    failures = {name: 0 for name in names}
+
+    for name in rng.choices(names, weights, k=warmup):
+        calls[name]()
+    registry.reset()  # Only the measured calls go into --metrics
+
+    started = time.perf_counter()
+    for name in rng.choices(names, weights, k=ops):
+        t0 = time.perf_counter_ns()
+        ok = calls[name]()
+        latencies[name].append(time.perf_counter_ns() - t0)
+        if not ok:
+            failures[name] += 1
+    wall = time.perf_counter() - started
+
+    operations = {}
+    for name in names:
+        values = sorted(latencies[name])
+        busy = sum(values) / 1e9
+        operations[name] = {
+            'count': len(values),
+            'failures': failures[name],
+            'ops_per_sec': round(len(values) / busy, 1) if busy else 0.0,
+            'mean_ms': round(busy * 1000 / len(values), 4) if values else 0.0,
+            'p50_ms': round(percentile(values, 50) / 1e6, 4),
+            'p95_ms': round(percentile(values, 95) / 1e6, 4),
+            'p99_ms': round(percentile(values, 99) / 1e6, 4),
+            'max_ms': round(values[-1] / 1e6, 4) if values else 0.0,
+        }
+    return {'total_ops': ops, 'wall_seconds': round(wall, 3),
+            'ops_per_sec': round(ops / wall, 1) if wall else 0.0, 'operations': operations}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result, baseline, threshold):
+    """Prints per-operation changes against a baseline run; returns the regressions."""
+    regressions = []
+    print(f"{'operation':<22}{'p95 before':>12}{'p95 now':>12}{'change':>10}{'ops/s now':>12}")
+    for name, now in result['operations'].items():
+        before = baseline['operations'].get(name)
+        if not before or not before['p95_ms'] or not now['count']:
+            continue
+        change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        flag = '  REGRESSED' if change > threshold else ''
+        print(f"{name:<22}{before['p95_ms']:>12.3f}{now['p95_ms']:>12.3f}{change:>9.1f}%{now['ops_per_sec']:>12.1f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation {name.strip()!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end circulation benchmark.")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default='bench.db', help="SQLite file (recreated unless --reuse)")
+    parser.add_argument('--scale', type=int, default=10_000, help="Books to seed (10k .. 10M)")
+    parser.add_argument('--members', type=int, help="Members to seed (default: scale / 2)")
+    parser.add_argument('--open-loans', type=int, help="Open loans to seed (default: scale / 10)")
+    parser.add_argument('--reuse', action='store_true', help="Benchmark the existing data, don't seed")
+    parser.add_argument('--ops', type=int, default=20_000, help="Measured calls")
+    parser.add_argument('--warmup', type=int, default=1_000, help="Unmeasured calls first (builds caches)")
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help="Weights, e.g. search_book=50,issue_book=25,return_book=25")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON result here (default: stdout)")
+    parser.add_argument('--compare', help="A previous JSON result to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed p95 slowdown, percent")
+    parser.add_argument('--metrics', help="Also dump per-statement SQL timings here (.json or .prom)")
+    args = parser.parse_args(argv)
+    configure_logging('WARNING')  # Slow-query warnings only, on stderr
+
+    if args.backend == 'sqlite' and not args.reuse and args.path != ':memory:':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    set_backend(create_backend(args.backend, DB_CONFIG, args.path))
+
+    rng = random.Random(args.seed)
+    members = args.members if args.members is not None else max(1, args.scale // 2)
+    open_loans = args.open_loans if args.open_loans is not None else args.scale // 10
+    started = time.perf_counter()
+    if args.reuse:
+        book_range, member_range, loans = existing_data()
+    else:
+        book_range, member_range, loans = seed(args.scale, members, open_loans, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f"Data ready in {seed_seconds:.1f}s: books {book_range}, members {member_range}, "
+          f"{len(loans)} open loans.", file=sys.stderr)
+
+    workload = Workload(book_range, member_range, loans, rng)
+    result = replay(workload, args.mix, args.ops, args.warmup, rng)
+    result = {
+        'benchmark': 'circulation',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git('rev-parse', '--short', 'HEAD'),
+        'git_branch': _git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'books': book_range[1] - book_range[0] + 1,
+        'members': member_range[1] - member_range[0] + 1,
+        'seed': args.seed,
+        'warmup': args.warmup,
+        'mix': args.mix,
+        'seed_seconds': round(seed_seconds, 3),
+        **result,
+    }
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if args.metrics:
+        registry.dump(args.metrics)
+        print(f"Wrote {args.metrics}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"p95 regressed by more than {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# This is 'benchmarks/concurrency_stress.py'
+#
+# Fires thousands of parallel issue/return calls at a small, contended
+# catalog and then checks that availability still adds up. Members who
+# find a title out of copies place holds (--hold-rate), collect them
+# later, or cancel them.
+#
+#   python -m benchmarks.concurrency_stress --path /tmp/stress.db --threads 16 --ops 5000
+#   python -m benchmarks.concurrency_stress --backend mysql --threads 40
+#
+# Invariants checked afterwards (after a hold sweep), for every book:
+#   0 <= available_quantity <= quantity
+#   available_quantity + open loans + copies set aside for holds == quantity
+#   on_loan, held_copies and lifetime_issues match the loans and holds
+#   no copy on the shelf while a hold on the title is waiting
+# The exit code is 1 if any invariant is broken.
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from database.backends import create_backend
+from database.db_connection import set_backend, pooled_connection
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+from modules import issue_return, holds
+
+
+def seed(books, copies, members):
+    """Creates a fresh set of stress-test books and members; returns their ids."""
+    tag = f"stress-{int(time.time() * 1000)}"
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO books (title, author, isbn, genre, quantity, available_quantity) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [(f"Stress {i}", "Load", f"{tag}-{i}", "Stress", copies, copies) for i in range(books)])
+        cursor.executemany(
+            "INSERT INTO members (name, email, phone_number, registration_date) VALUES (%s, %s, %s, NULL)",
+            [(f"Stress {i}", f"{tag}-{i}@example.com", None) for i in range(members)])
+        conn.commit()
+        cursor.execute("SELECT book_id FROM books WHERE isbn LIKE %s", (f"{tag}-%",))
+        book_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT member_id FROM members WHERE email LIKE %s", (f"{tag}-%",))
+        member_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return book_ids, member_ids
+
+
+def worker(ops, book_ids, member_ids, hold_rate, counts, lock, rng):
+    """Randomly issues books, returns ones this worker holds, and places and collects holds."""
+    held = []     # (book_id, member_id) loans this worker has open
+    waiting = []  # (hold_id, book_id, member_id) holds this worker placed
+    local = dict.fromkeys(counts, 0)
+    for _ in range(ops):
+        roll = rng.random()
+        if held and roll < 0.45:
+            book_id, member_id = held.pop(rng.randrange(len(held)))
+            if issue_return.return_book(book_id, member_id):
+                local['returned'] += 1
+            else:
+                local['return_failed'] += 1
+        elif waiting and roll < 0.6:
+            hold_id, book_id, member_id = waiting[rng.randrange(len(waiting))]
+            if rng.random() < 0.1:
+                waiting.remove((hold_id, book_id, member_id))
+                local['holds_cancelled'] += holds.cancel_hold(hold_id)
+            elif issue_return.issue_book(book_id, member_id):  # Collects it once it is ready
+                waiting.remove((hold_id, book_id, member_id))
+                local['issued'] += 1
+                held.append((book_id, member_id))
+        else:
+            book_id, member_id = rng.choice(book_ids), rng.choice(member_ids)
+            if issue_return.issue_book(book_id, member_id):
+                local['issued'] += 1
+                held.append((book_id, member_id))
+            else:
+                local['unavailable'] += 1
+                if rng.random() < hold_rate:
+                    result = holds.place_hold(book_id, member_id)
+                    if result['success']:
+                        local['holds_placed'] += 1
+                        waiting.append((result['hold_id'], book_id, member_id))
+    with lock:
+        for key, value in local.items():
+            counts[key] += value
+
+
+def check_invariants(book_ids):
+    """Returns a list of human-readable invariant violations (empty if all good)."""
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT b.book_id, b.quantity, b.available_quantity, b.on_loan, b.held_copies, b.lifetime_issues,
+                   (SELECT COUNT(*) FROM transactions t
+                    WHERE t.book_id = b.book_id AND t.return_date IS NULL) AS open_loans,
+                   (SELECT COUNT(*) FROM transactions t WHERE t.book_id = b.book_id) AS loans_ever,
+                   (SELECT COUNT(*) FROM holds h
+                    WHERE h.book_id = b.book_id AND h.status = 'ready') AS set_aside,
+                   (SELECT COUNT(*) FROM holds h
+                    WHERE h.book_id = b.book_id AND h.status = 'waiting') AS waiting
+            FROM books b WHERE b.book_id IN ({placeholders})
+            """, tuple(book_ids))
+        rows = cursor.fetchall()
+        cursor.close()
+    problems = []
+    for book_id, quantity, available, on_loan, held, lifetime, open_loans, loans_ever, set_aside, waiting in rows:
+        if available < 0 or available > quantity:
+            problems.append(f"book {book_id}: available {available} outside 0..{quantity}")
+        if available + open_loans + set_aside != quantity:
+            problems.append(f"book {book_id}: available {available} + open loans {open_loans} "
+                            f"+ set aside {set_aside} != {quantity}")
+        if (on_loan, held, lifetime) != (open_loans, set_aside, loans_ever):
+            problems.append(f"book {book_id}: counters on loan {on_loan}, held {held}, lifetime {lifetime} "
+                            f"!= {open_loans}, {set_aside}, {loans_ever} counted")
+        if available and waiting:
+            problems.append(f"book {book_id}: {available} on the shelf while {waiting} holds wait")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent issue/return stress test.")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default='stress.db', help="SQLite file (must be a file to test concurrency)")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=5000, help="Total operations across all threads")
+    parser.add_argument('--books', type=int, default=10, help="Few books = heavy contention")
+    parser.add_argument('--copies', type=int, default=2)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--hold-rate', type=float, default=0.3,
+                        help="Chance a member places a hold when a title is out (0 = no holds)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    configure_logging('ERROR')  # Expected "not available" warnings would drown the summary
+
+    set_backend(create_backend(args.backend, DB_CONFIG, args.path), max_size=args.threads)
+    book_ids, member_ids = seed(args.books, args.copies, args.members)
+
+    counts = {'issued': 0, 'unavailable': 0, 'returned': 0, 'return_failed': 0,
+              'holds_placed': 0, 'holds_cancelled': 0}
+    lock = threading.Lock()
+    per_thread = args.ops // args.threads
+    threads = [threading.Thread(target=worker, args=(per_thread, book_ids, member_ids, args.hold_rate,
+                                                      counts, lock, random.Random(args.seed + i)))
+               for i in range(args.threads)]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = per_thread * args.threads
+    print(f"--- {args.backend}: {args.threads} threads, {total} ops on {args.books} books x {args.copies} copies ---")
+    print(f"  {total / elapsed:.1f} ops/sec over {elapsed:.2f}s")
+    for key, value in counts.items():
+        print(f"  {key:<16} {value}")
+
+    # Copies left on the shelf by a hold placed just as one came back are
+    # set aside by the sweep (see modules/holds.py)
+    swept = holds.sweep_holds()
+    print(f"  {'swept_stranded':<16} {swept['stranded_set_aside']}")
+
+    problems = check_invariants(book_ids)
+    if problems:
+        print("INVARIANTS BROKEN:")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        return 1
+    print("Invariants hold: no negative availability, every copy accounted for, counters match.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# This is 'benchmarks/http_load.py'
+#
+# Load test for the HTTP service (serve.py). Seeds a SQLite database like
+# benchmarks/circulation.py, starts serve.py on it, and drives it from
+# `--connections` keep-alive connections, each with up to `--depth`
+# pipelined requests in flight. Reports requests/sec and latency
+# percentiles per endpoint as JSON.
+#
+#   python -m benchmarks.http_load --path /tmp/http.db --scale 20000 --seconds 10
+#   python -m benchmarks.http_load --path /tmp/http.db --reuse --connections 64 --depth 8
+#   python -m benchmarks.http_load --url http://10.0.0.5:8080 --seconds 30   # a running server
+#
+# With --url nothing is seeded or started; the mix then only uses the ids
+# that server's database happens to have, so seed it the same way first.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit, urlencode
+
+from benchmarks.circulation import WORDS, LAST_NAMES, seed, existing_data, percentile, _git
+from database.backends import create_backend
+from database.db_connection import set_backend
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = {'search': 60, 'get_book': 20, 'members': 5, 'issue': 8, 'return': 7}
+
+
+class Client:
+    """One keep-alive connection that pipelines requests."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def send(self, method, path, body=None, token=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(data)}\r\n"
+        if token:
+            head += f"Authorization: Bearer {token}\r\n"
+        self.writer.write(head.encode('ascii') + b'\r\n' + data)
+
+    async def receive(self):
+        """Reads one response; returns (status, body bytes)."""
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    async def request(self, method, path, body=None, token=None):
+        self.send(method, path, body, token)
+        await self.writer.drain()
+        return await self.receive()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class Traffic:
+    """Picks the next request; keeps track of the loans it opened."""
+
+    def __init__(self, book_range, member_range, loans, token, rng):
+        self.book_range = book_range
+        self.member_range = member_range
+        self.loans = list(loans)
+        self.token = token
+        self.rng = rng
+
+    def next(self, name):
+        """Returns (method, path, body, token, on_success) for one request of kind `name`."""
+        rng = self.rng
+        if name == 'search':
+            term = rng.choice(WORDS) if rng.random() < 0.7 else rng.choice(LAST_NAMES)
+            return 'GET', '/books?' + urlencode({'q': term}), None, None, None
+        if name == 'get_book':
+            return 'GET', f"/books/{rng.randint(*self.book_range)}", None, None, None
+        if name == 'members':
+            return 'GET', '/members?' + urlencode({'q': rng.choice(LAST_NAMES)}), None, self.token, None
+        if name == 'return' and self.loans:
+            book_id, member_id = self.loans.pop(rng.randrange(len(self.loans)))
+            return 'POST', '/returns', {'book_id': book_id, 'member_id': member_id}, self.token, None
+        # An issue (also when there is nothing to return)
+        loan = (rng.randint(*self.book_range), rng.randint(*self.member_range))
+        return ('POST', '/loans', {'book_id': loan[0], 'member_id': loan[1]}, self.token,
+                lambda: self.loans.append(loan))
+
+
+async def _connection(client, traffic, names, weights, depth, deadline, results, rng):
+    """Keeps `depth` requests in flight on one connection until the deadline."""
+    while time.perf_counter() < deadline:
+        batch = []
+        for name in rng.choices(names, weights, k=depth):
+            method, path, body, token, on_success = traffic.next(name)
+            client.send(method, path, body, token)
+            batch.append((name, on_success, time.perf_counter_ns()))
+        await client.writer.drain()
+        for name, on_success, sent in batch:
+            status, _ = await client.receive()
+            stats = results[name]
+            stats['latencies'].append(time.perf_counter_ns() - sent)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            if status < 300 and on_success is not None:
+                on_success()
+
+
+async def drive(host, port, traffic, mix, connections, depth, seconds, warmup_seconds, rng):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    clients = [Client(host, port) for _ in range(connections)]
+    await asyncio.gather(*(client.connect() for client in clients))
+    try:
+        for phase_seconds, measured in ((warmup_seconds, False), (seconds, True)):
+            results = {name: {'latencies': [], 'statuses': {}} for name in names}
+            started = time.perf_counter()
+            deadline = started + phase_seconds
+            await asyncio.gather(*(_connection(client, traffic, names, weights, depth, deadline, results, rng)
+                                   for client in clients))
+            wall = time.perf_counter() - started
+    finally:
+        for client in clients:
+            client.close()
+
+    endpoints = {}
+    total = 0
+    for name, stats in results.items():
+        values = sorted(stats['latencies'])
+        total += len(values)
+        endpoints[name] = {
+            'count': len(values),
+            'statuses': {str(code): n for code, n in sorted(stats['statuses'].items())},
+            'p50_ms': round(percentile(values, 50) / 1e6, 3),
+            'p95_ms': round(percentile(values, 95) / 1e6, 3),
+            'p99_ms': round(percentile(values, 99) / 1e6, 3),
+            'max_ms': round(values[-1] / 1e6, 3) if values else 0.0,
+        }
+    return {'total_requests': total, 'wall_seconds': round(wall, 3),
+            'requests_per_sec': round(total / wall, 1) if wall else 0.0, 'endpoints': endpoints}
+
+
+async def _login(host, port):
+    client = Client(host, port)
+    await client.connect()
+    try:
+        status, body = await client.request('POST', '/login', {'username': 'admin', 'password': 'admin'})
+    finally:
+        client.close()
+    if status != 200:
+        raise RuntimeError(f"Login failed with HTTP {status}: {body[:200]!r}")
+    return json.loads(body)['token']
+
+
+async def _wait_until_up(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            client = Client(host, port)
+            await client.connect()
+            status, _ = await client.request('GET', '/health')
+            client.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"The server on {host}:{port} did not come up.")
+        await asyncio.sleep(0.1)
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown request kind {name!r}; use {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the HTTP service.")
+    parser.add_argument('--url', help="Test a server that is already running instead of starting one")
+    parser.add_argument('--path', default='http_bench.db', help="SQLite file (recreated unless --reuse)")
+    parser.add_argument('--scale', type=int, default=10_000, help="Books to seed")
+    parser.add_argument('--reuse', action='store_true', help="Use the existing data, don't seed")
+    parser.add_argument('--port', type=int, default=8089, help="Port for the server this starts")
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--depth', type=int, default=4, help="Pipelined requests per connection")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Measured duration")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds first")
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help="Weights, e.g. search=80,get_book=20")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON result here (default: stdout)")
+    args = parser.parse_args(argv)
+    configure_logging('WARNING')
+
+    rng = random.Random(args.seed)
+    if not args.reuse and args.path != ':memory:':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    set_backend(create_backend('sqlite', DB_CONFIG, args.path))
+    if args.url or args.reuse:
+        book_range, member_range, loans = existing_data()
+    else:
+        book_range, member_range, loans = seed(args.scale, max(1, args.scale // 2), args.scale // 10, rng)
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        env = dict(os.environ, LMS_DB_BACKEND='sqlite', LMS_SQLITE_PATH=os.path.abspath(args.path),
+                   LMS_LOG_LEVEL='WARNING')
+        command = [sys.executable, 'serve.py', '--host', host, '--port', str(port)]
+        server = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    try:
+        asyncio.run(_wait_until_up(host, port))
+        token = asyncio.run(_login(host, port))
+        traffic = Traffic(book_range, member_range, loans, token, rng)
+        result = asyncio.run(drive(host, port, traffic, args.mix, args.connections, args.depth,
+                                   args.seconds, args.warmup, rng))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    result = {
+        'benchmark': 'http_load',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git('rev-parse', '--short', 'HEAD'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'books': book_range[1] - book_range[0] + 1,
+        'connections': args.connections,
+        'depth': args.depth,
+        'mix': args.mix,
+        **result,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+# This is 'benchmarks/load_generator.py'
+#
+# Simulates many circulation desks and self-checkout kiosks working at
+# once. Desks are threads spread over worker processes; each desk picks an
+# operation from the mix, runs it, then "thinks" for a random while (the
+# time a librarian spends scanning the next book) before the next one.
+#
+#   python -m benchmarks.load_generator --path /tmp/load.db --desks 40 --duration 60
+#   python -m benchmarks.load_generator --backend mysql --desks 40 --processes 8 --think-ms 500
+#   python -m benchmarks.load_generator --path /tmp/load.db --target storage --think-ms 0
+#
+# --target modules drives the backend functions (issue_return,
+# book_management, ...), caches and retries included; --target storage runs
+# the equivalent single SQL transactions directly, without retries, to
+# see what the database alone can take.
+#
+# Prints one line per --interval seconds while it runs (throughput, tail
+# latency, lock errors, retries, pool waits) and writes the whole timeline
+# plus per-operation totals as JSON with --output. An empty database is
+# seeded first (see benchmarks/circulation.py).
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from database.backends import create_backend
+from database.db_connection import set_backend, get_backend, pooled_connection, pool_stats
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+from modules import issue_return
+from benchmarks.circulation import DEFAULT_MIX, Workload, percentile, seed, existing_data, _parse_mix
+
+
+class StorageWorkload:
+    """The same operations as circulation.Workload, as plain SQL transactions."""
+
+    def __init__(self, book_range, member_range, loans, rng):
+        self.book_range = book_range
+        self.member_range = member_range
+        self.loans = list(loans)
+        self.rng = rng
+
+    def _run(self, statements):
+        """Runs statements(cursor) in one transaction; returns its result."""
+        with pooled_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            cursor = conn.cursor()
+            try:
+                result = statements(cursor)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def search_book(self):
+        isbn = f"978{self.rng.randint(0, self.book_range[1] - self.book_range[0]):010d}"
+        def statements(cursor):
+            cursor.execute("SELECT * FROM books WHERE isbn = %s LIMIT 1", (isbn,))
+            cursor.fetchall()
+            return True
+        return self._run(statements)
+
+    def view_member_details(self):
+        email = f"member{self.rng.randint(0, self.member_range[1] - self.member_range[0])}@example.org"
+        def statements(cursor):
+            cursor.execute("SELECT member_id, name, email, phone_number, registration_date "
+                           "FROM members WHERE email = %s", (email,))
+            cursor.fetchall()
+            return True
+        return self._run(statements)
+
+    def issue_book(self):
+        book_id = self.rng.randint(*self.book_range)
+        member_id = self.rng.randint(*self.member_range)
+        today = datetime.date.today()
+        def statements(cursor):
+            cursor.execute(issue_return._TAKE_COPY, (book_id,))
+            if cursor.rowcount != 1:
+                return False
+            cursor.execute("INSERT INTO transactions (book_id, member_id, issue_date, due_date, return_date, fine_amount) "
+                           "VALUES (%s, %s, %s, %s, NULL, 0)",
+                           (book_id, member_id, today, today + datetime.timedelta(days=issue_return.LOAN_DAYS)))
+            return True
+        if self._run(statements):
+            self.loans.append((book_id, member_id))
+            return True
+        return False
+
+    def return_book(self):
+        if not self.loans:
+            return self.issue_book()
+        book_id, member_id = self.loans.pop(self.rng.randrange(len(self.loans)))
+        def statements(cursor):
+            cursor.execute("SELECT transaction_id, due_date FROM transactions WHERE book_id = %s AND member_id = %s "
+                           "AND return_date IS NULL ORDER BY transaction_id LIMIT 1", (book_id, member_id))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            cursor.execute("UPDATE transactions SET return_date = %s WHERE transaction_id = %s AND return_date IS NULL",
+                           (datetime.date.today(), row[0]))
+            if cursor.rowcount != 1:
+                return False
+            cursor.execute(issue_return._RETURN_COPY, (1, 0, row[1], book_id))
+            return True
+        return self._run(statements)
+
+    def verify_login(self):
+        def statements(cursor):
+            cursor.execute("SELECT user_id, password_hash FROM users WHERE username = %s", ('admin',))
+            return cursor.fetchone() is not None
+        return self._run(statements)
+
+    def authenticate(self):
+        return True  # Sessions live in memory; there is nothing to do in storage
+
+
+# --- Worker processes ---
+
+class _Recorder:
+    """Collects one process's results per interval, for all its desks."""
+
+    def __init__(self, started, interval):
+        self.started = started
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.buckets = defaultdict(lambda: {'ops': defaultdict(list), 'failed': defaultdict(int),
+                                            'errors': defaultdict(int), 'lock_errors': 0})
+
+    def record(self, name, began, latency_ns, outcome, lock_error=False):
+        index = int((began - self.started) // self.interval)  # By start time: calls end after stop_at
+        with self.lock:
+            bucket = self.buckets[index]
+            bucket['ops'][name].append(latency_ns)
+            if outcome == 'failed':
+                bucket['failed'][name] += 1
+            elif outcome == 'error':
+                bucket['errors'][name] += 1
+                if lock_error:
+                    bucket['lock_errors'] += 1
+
+    def take(self, before_index):
+        """Removes and returns the buckets of intervals that are over."""
+        with self.lock:
+            done = {i: self.buckets.pop(i) for i in sorted(self.buckets) if i < before_index}
+        return {i: {'ops': dict(b['ops']), 'failed': dict(b['failed']), 'errors': dict(b['errors']),
+                    'lock_errors': b['lock_errors']} for i, b in done.items()}
+
+
+def _desk(workload, mix, think_ms, stop_at, recorder, rng):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    backend = get_backend()
+    calls = {name: getattr(workload, name) for name in names}
+    while time.time() < stop_at:
+        name = rng.choices(names, weights)[0]
+        began = time.time()
+        t0 = time.perf_counter_ns()
+        try:
+            outcome = 'ok' if calls[name]() else 'failed'
+            lock_error = False
+        except Exception as e:
+            outcome = 'error'
+            lock_error = backend.is_retryable(e)
+        recorder.record(name, began, time.perf_counter_ns() - t0, outcome, lock_error)
+        if think_ms > 0:
+            pause = rng.expovariate(1000.0 / think_ms)  # Mean think_ms, occasionally much longer
+            time.sleep(max(0.0, min(pause, stop_at - time.time())))
+
+
+def worker_process(index, desks, settings, book_range, member_range, loans, started, stop_at, results):
+    """Runs `desks` desk threads in this process and streams interval buckets to `results`."""
+    configure_logging('ERROR')  # Lost races are expected under load; only real errors go to stderr
+    set_backend(create_backend(settings['backend'], DB_CONFIG, settings['path']), max_size=desks)
+    workload_class = StorageWorkload if settings['target'] == 'storage' else Workload
+    recorder = _Recorder(started, settings['interval'])
+
+    threads = []
+    for d in range(desks):
+        rng = random.Random(settings['seed'] * 1000 + index * 100 + d)
+        desk_loans = loans[d::desks]  # Each desk returns its own share of the seeded loans
+        workload = workload_class(book_range, member_range, desk_loans, rng)
+        threads.append(threading.Thread(target=_desk, args=(workload, settings['mix'], settings['think_ms'],
+                                                            stop_at, recorder, rng), daemon=True))
+    time.sleep(max(0.0, started - time.time()))  # All processes start together
+    for t in threads:
+        t.start()
+
+    def counters():
+        pool = pool_stats()
+        return {'transactions': issue_return.transaction_stats(), 'pool_waits': pool['waits'],
+                'pool_wait_time': pool['wait_time'], 'pool_timeouts': pool['timeouts']}
+
+    while True:
+        alive = any(t.is_alive() for t in threads)
+        current = int((time.time() - started) // settings['interval'])
+        upto = current if alive else math.inf
+        buckets = recorder.take(upto)
+        results.put(('buckets', index, buckets, counters()))
+        if not alive:
+            break
+        time.sleep(settings['interval'] / 2)
+    results.put(('done', index, None, counters()))
+
+
+# --- The parent: start workers, merge and report ---
+
+def _mysql_lock_status(cursor):
+    """InnoDB's own row lock counters (MySQL only)."""
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%'")
+    status = {name.lower(): int(value) for name, value in cursor.fetchall() if str(value).isdigit()}
+    try:
+        cursor.execute("SELECT count FROM information_schema.innodb_metrics WHERE name = 'lock_deadlocks'")
+        row = cursor.fetchone()
+        status['deadlocks'] = int(row[0]) if row else 0
+    except Exception:
+        status['deadlocks'] = 0
+    return status
+
+
+def _summarize(latencies, failed, errors, seconds):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'failed': failed,
+        'errors': errors,
+        'ops_per_sec': round(len(values) / seconds, 1) if seconds else 0.0,
+        'p50_ms': round(percentile(values, 50) / 1e6, 3),
+        'p95_ms': round(percentile(values, 95) / 1e6, 3),
+        'p99_ms': round(percentile(values, 99) / 1e6, 3),
+        'max_ms': round(values[-1] / 1e6, 3) if values else 0.0,
+    }
+
+
+def run(args):
+    processes = args.processes or min(args.desks, os.cpu_count() or 1)
+    processes = max(1, min(processes, args.desks))
+    settings = {'backend': args.backend, 'path': args.path, 'target': args.target, 'mix': args.mix,
+                'think_ms': args.think_ms, 'interval': args.interval, 'seed': args.seed}
+
+    set_backend(create_backend(args.backend, DB_CONFIG, args.path))
+    with contextlib.redirect_stdout(sys.stderr):
+        book_range, member_range, loans = existing_data()
+        if book_range[1] < book_range[0]:
+            print(f"Seeding {args.scale} books...")
+            book_range, member_range, loans = seed(args.scale, max(1, args.scale // 2), args.scale // 10,
+                                                   random.Random(args.seed))
+
+    # Spread desks and the seeded open loans over the processes
+    desks_per_process = [args.desks // processes + (1 if i < args.desks % processes else 0)
+                         for i in range(processes)]
+    started = time.time() + 1.0 + 0.05 * processes  # Time for the workers to start up
+    stop_at = started + args.duration
+    results = multiprocessing.get_context('spawn').Queue()
+    workers = [multiprocessing.get_context('spawn').Process(
+        target=worker_process,
+        args=(i, desks_per_process[i], settings, book_range, member_range, loans[i::processes],
+              started, stop_at, results))
+        for i in range(processes)]
+    for w in workers:
+        w.start()
+
+    status_conn = None
+    if args.backend == 'mysql':
+        status_conn = get_backend().connect()
+        lock_before = _mysql_lock_status(status_conn.cursor())
+
+    print(f"{args.desks} desks in {processes} processes, {args.target} target, "
+          f"{args.duration}s, think {args.think_ms} ms", file=sys.stderr)
+    print(f"{'t(s)':>6}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'lock err':>9}{'retries':>8}{'pool waits':>11}", file=sys.stderr)
+
+    intervals = defaultdict(lambda: {'ops': defaultdict(list), 'failed': defaultdict(int),
+                                     'errors': defaultdict(int), 'lock_errors': 0, 'reported': set()})
+    counters = {}
+    last_counters = {}
+    done = set()
+    printed = 0
+    timeline = []
+
+    def counter_total(key, source):
+        if key in ('pool_waits', 'pool_wait_time', 'pool_timeouts'):
+            return sum(c[key] for c in source.values())
+        return sum(c['transactions'][key] for c in source.values())
+
+    while len(done) < processes:
+        try:
+            kind, index, buckets, process_counters = results.get(timeout=args.interval)
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                break
+            continue
+        counters[index] = process_counters
+        if kind == 'done':
+            done.add(index)
+            continue
+        for i, bucket in buckets.items():
+            merged = intervals[i]
+            for name, values in bucket['ops'].items():
+                merged['ops'][name].extend(values)
+            for name, count in bucket['failed'].items():
+                merged['failed'][name] += count
+            for name, count in bucket['errors'].items():
+                merged['errors'][name] += count
+            merged['lock_errors'] += bucket['lock_errors']
+            merged['reported'].add(index)
+
+        # Print every interval all processes have reported on
+        while printed in intervals and len(intervals[printed]['reported']) == processes:
+            merged = intervals[printed]
+            values = sorted(v for vs in merged['ops'].values() for v in vs)
+            snapshot = {key: counter_total(key, counters) for key in ('retries', 'lock_errors', 'pool_waits')}
+            delta = {key: snapshot[key] - last_counters.get(key, 0) for key in snapshot}
+            last_counters = snapshot
+            point = {
+                't': round((printed + 1) * args.interval, 3),
+                'ops_per_sec': round(len(values) / args.interval, 1),
+                'p50_ms': round(percentile(values, 50) / 1e6, 3),
+                'p95_ms': round(percentile(values, 95) / 1e6, 3),
+                'p99_ms': round(percentile(values, 99) / 1e6, 3),
+                'errors': sum(merged['errors'].values()),
+                'lock_errors': merged['lock_errors'] + delta['lock_errors'],
+                'retries': delta['retries'],
+                'pool_waits': delta['pool_waits'],
+            }
+            timeline.append(point)
+            print(f"{point['t']:>6.0f}{point['ops_per_sec']:>9.1f}{point['p50_ms']:>9.2f}{point['p95_ms']:>9.2f}"
+                  f"{point['p99_ms']:>9.2f}{point['errors']:>8}{point['lock_errors']:>9}{point['retries']:>8}"
+                  f"{point['pool_waits']:>11}", file=sys.stderr)
+            printed += 1
+
+    for w in workers:
+        w.join()
+
+    # Totals per operation over the whole run
+    all_ops = defaultdict(list)
+    failed, errors = defaultdict(int), defaultdict(int)
+    storage_lock_errors = 0
+    for merged in intervals.values():
+        for name, values in merged['ops'].items():
+            all_ops[name].extend(values)
+        for name, count in merged['failed'].items():
+            failed[name] += count
+        for name, count in merged['errors'].items():
+            errors[name] += count
+        storage_lock_errors += merged['lock_errors']
+    operations = {name: _summarize(all_ops[name], failed[name], errors[name], args.duration)
+                  for name in args.mix}
+    total_ops = sum(len(v) for v in all_ops.values())
+    every = sorted(v for vs in all_ops.values() for v in vs)
+
+    transactions = counter_total('transactions', counters)
+    lock_errors = counter_total('lock_errors', counters) + storage_lock_errors
+    result = {
+        'benchmark': 'load_generator',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'backend': args.backend,
+        'target': args.target,
+        'desks': args.desks,
+        'processes': processes,
+        'duration': args.duration,
+        'think_ms': args.think_ms,
+        'mix': args.mix,
+        'total_ops': total_ops,
+        'ops_per_sec': round(total_ops / args.duration, 1),
+        'p50_ms': round(percentile(every, 50) / 1e6, 3),
+        'p95_ms': round(percentile(every, 95) / 1e6, 3),
+        'p99_ms': round(percentile(every, 99) / 1e6, 3),
+        'error_rate': round(sum(errors.values()) / total_ops, 5) if total_ops else 0.0,
+        'contention': {
+            'transactions': transactions,
+            'retries': counter_total('retries', counters),
+            'conflicts': counter_total('conflicts', counters),
+            'lock_errors': lock_errors,
+            'failed_transactions': counter_total('failures', counters),
+            'lock_error_rate': round(lock_errors / transactions, 5) if transactions else 0.0,
+            'pool_waits': counter_total('pool_waits', counters),
+            'pool_wait_seconds': round(counter_total('pool_wait_time', counters), 3),
+            'pool_timeouts': counter_total('pool_timeouts', counters),
+        },
+        'operations': operations,
+        'timeline': timeline,
+    }
+    if status_conn is not None:
+        lock_after = _mysql_lock_status(status_conn.cursor())
+        result['contention']['innodb'] = {key: lock_after[key] - lock_before.get(key, 0)
+                                          for key in lock_after if key != 'innodb_row_lock_current_waits'}
+        status_conn.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many concurrent circulation desks.")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default='load.db', help="SQLite file (shared by all processes)")
+    parser.add_argument('--scale', type=int, default=10_000, help="Books to seed if the database is empty")
+    parser.add_argument('--desks', type=int, default=40, help="Concurrent desks / kiosks")
+    parser.add_argument('--processes', type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds per timeline point")
+    parser.add_argument('--think-ms', type=float, default=200.0, help="Mean pause between a desk's calls")
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help="Weights, e.g. issue_book=50,return_book=50")
+    parser.add_argument('--target', choices=['modules', 'storage'], default='modules')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON result here")
+    args = parser.parse_args(argv)
+    if args.backend == 'sqlite' and args.path == ':memory:':
+        parser.error("worker processes can't share an in-memory database; use a file")
+    configure_logging('WARNING')
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# This is 'benchmarks/member_lookup.py'
+#
+# Measures the member lookup index (modules/member_index.py) on its own,
+# without a database: how long it takes to build for `--members` synthetic
+# members, to save and load its snapshot, and how long single lookups take
+# for exact names, misspelled names, name prefixes, emails and phone numbers.
+#
+#   python -m benchmarks.member_lookup --members 1000000
+#   python -m benchmarks.member_lookup --members 200000 --queries 5000 --output lookup.json
+#
+# The names are made up from syllables, so there are tens of thousands of
+# different surnames, like a real member list (a few dozen would make
+# every lookup look slow, since each would match a large share of members).
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.circulation import percentile
+from modules.member_index import MemberLookupIndex
+
+SYLLABLES = ("an ba be bo ca chi da de do el fa fi ga go ha he ia in ja jo ka ke ko la le li lo ma me mi "
+             "mo na ne ni no ol pa pe ra re ri ro sa se si so ta te ti to u va ve vi wa we ya yo za ze").split()
+ENDINGS = ("", "", "son", "sen", "ez", "ov", "ski", "er", "man", "ton", "ley", "ini", "ova", "berg")
+
+
+def make_name(rng, syllables):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+
+def make_members(count, rng):
+    """Returns `count` members rows with made-up names, emails and phone numbers."""
+    first_names = sorted({make_name(rng, rng.randint(2, 3)) for _ in range(5_000)})
+    last_names = sorted({make_name(rng, rng.randint(2, 3)) + rng.choice(ENDINGS) for _ in range(60_000)})
+    members = []
+    for member_id in range(1, count + 1):
+        first, last = rng.choice(first_names), rng.choice(last_names)
+        members.append({'member_id': member_id, 'name': f"{first} {last}",
+                        'email': f"{first.lower()}.{last.lower()}{member_id}@example.com",
+                        'phone_number': f"+1 ({rng.randint(200, 999)}) {rng.randint(100, 999)}-{member_id % 10_000:04d}"})
+    return members
+
+
+def misspell(word, rng):
+    """One typo: a changed, dropped, doubled or swapped letter."""
+    pos = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:pos] + rng.choice('aeiou') + word[pos + 1:]
+    if kind == 1:
+        return word[:pos] + word[pos + 1:]
+    if kind == 2:
+        return word[:pos] + word[pos] + word[pos:]
+    return word[:pos - 1] + word[pos] + word[pos - 1] + word[pos + 1:]
+
+
+def make_queries(members, kind, count, rng):
+    queries = []
+    for _ in range(count):
+        member = rng.choice(members)
+        first, last = member['name'].split(' ')
+        if kind == 'exact':
+            queries.append(member['name'])
+        elif kind == 'typo':
+            queries.append(f"{first} {misspell(last, rng)}")
+        elif kind == 'prefix':
+            queries.append(last[:4])
+        elif kind == 'email':
+            queries.append(member['email'])
+        else:  # phone, written another way than stored
+            digits = ''.join(c for c in member['phone_number'] if c.isdigit())[-10:]
+            queries.append(f"{digits[:3]}.{digits[3:6]}.{digits[6:]}")
+    return queries
+
+
+def time_queries(index, queries, limit):
+    """Runs each query once; returns sorted latencies in ms."""
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search_page(query, None, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the member lookup index.")
+    parser.add_argument('--members', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=2_000, help="Lookups of each kind")
+    parser.add_argument('--limit', type=int, default=50, help="Results per lookup (one page)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON result here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"Making {args.members} members...", file=sys.stderr)
+    members = make_members(args.members, rng)
+
+    started = time.perf_counter()
+    index = MemberLookupIndex()
+    index.add_many(members)
+    build_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'members.idx')
+        started = time.perf_counter()
+        index.save(path)
+        save_seconds = time.perf_counter() - started
+        snapshot_mb = os.path.getsize(path) / 1e6
+        started = time.perf_counter()
+        index = MemberLookupIndex.load(path)
+        load_seconds = time.perf_counter() - started
+
+    lookups = {}
+    for kind in ('exact', 'typo', 'prefix', 'email', 'phone'):
+        values = time_queries(index, make_queries(members, kind, args.queries, rng), args.limit)
+        lookups[kind] = {'p50_ms': round(percentile(values, 50), 3), 'p95_ms': round(percentile(values, 95), 3),
+                         'p99_ms': round(percentile(values, 99), 3), 'max_ms': round(values[-1], 3)}
+        print(f"{kind:>8}: p50 {lookups[kind]['p50_ms']:.3f} ms, p95 {lookups[kind]['p95_ms']:.3f} ms",
+              file=sys.stderr)
+
+    text = json.dumps({'benchmark': 'member_lookup', 'members': args.members, 'limit': args.limit,
+                       'build_seconds': round(build_seconds, 2), 'save_seconds': round(save_seconds, 2),
+                       'load_seconds': round(load_seconds, 2), 'snapshot_mb': round(snapshot_mb, 1),
+                       'lookups': lookups}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# This is 'benchmarks/offline_desk.py'
+#
+# How fast a desk works offline, and how fast it catches up. Times:
+#   - journal appends (what an issue or return costs while the database
+#     is down) from --threads desks at once, with fsync on, so concurrent
+#     appends share fsyncs;
+#   - the same issues and returns made online, against the database, for
+#     comparison;
+#   - replaying the journaled ones into the database, --batch-size per
+#     transaction.
+#
+#   python -m benchmarks.offline_desk --path /tmp/offline.db --ops 5000
+#   python -m benchmarks.offline_desk --path /tmp/offline.db --threads 8 --batch-size 500
+#
+# Each operation is an issue of a random title followed later by its
+# return, so the replay does the same work the online desk did.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.circulation import seed, percentile
+from database.backends import create_backend
+from database.db_connection import set_backend
+from modules import issue_return
+from modules.circulation_journal import CirculationJournal, replay_journal
+from utils.config import DB_CONFIG
+from utils.log import configure_logging
+
+
+def make_operations(count, book_range, member_range, rng):
+    """`count` operations: issues, each followed by its return some time later."""
+    operations, open_loans = [], []
+    while len(operations) < count:
+        if open_loans and (rng.random() < 0.5 or len(operations) + len(open_loans) >= count):
+            operations.append(('return',) + open_loans.pop(rng.randrange(len(open_loans))))
+        else:
+            loan = (rng.randint(*book_range), rng.randint(*member_range))
+            open_loans.append(loan)
+            operations.append(('issue',) + loan)
+    return operations
+
+
+def run_threads(operations, threads, call):
+    """Runs call(op, book_id, member_id) for every operation, spread over
+    `threads` threads; returns (seconds, sorted latencies in ms)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(share):
+        mine = []
+        for op, book_id, member_id in share:
+            started = time.perf_counter()
+            call(op, book_id, member_id)
+            mine.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    # Each thread keeps whole loans, so a return never overtakes its issue
+    shares = [[] for _ in range(threads)]
+    for op, book_id, member_id in operations:
+        shares[(book_id + member_id) % threads].append((op, book_id, member_id))
+    workers = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def _timing(operations, seconds, latencies):
+    return {'ops_per_sec': round(len(operations) / seconds, 1), 'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3), 'p99_ms': round(percentile(latencies, 99), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time offline (journaled) circulation and its replay.")
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default='offline_bench.db', help="SQLite file (must be empty)")
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--members', type=int, default=5_000)
+    parser.add_argument('--ops', type=int, default=5_000, help="Issues and returns, each way")
+    parser.add_argument('--threads', type=int, default=4, help="Desks working at once")
+    parser.add_argument('--batch-size', type=int, default=200, help="Operations replayed per transaction")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON result here (default: stdout)")
+    args = parser.parse_args(argv)
+    configure_logging('WARNING')
+
+    rng = random.Random(args.seed)
+    set_backend(create_backend(args.backend, DB_CONFIG, args.path), max_size=args.threads)
+    print("Seeding...", file=sys.stderr)
+    book_range, member_range, _ = seed(args.books, args.members, 0, rng)
+    result = {'benchmark': 'offline_desk', 'backend': args.backend, 'ops': args.ops, 'threads': args.threads}
+
+    # Online: the desk's normal path
+    online = make_operations(args.ops, book_range, member_range, rng)
+    calls = {'issue': issue_return.issue_book, 'return': issue_return.return_book}
+    seconds, latencies = run_threads(online, args.threads, lambda op, b, m: calls[op](b, m))
+    result['online'] = _timing(online, seconds, latencies)
+
+    with tempfile.TemporaryDirectory() as folder:
+        offline = make_operations(args.ops, book_range, member_range, rng)
+        for threads in sorted({1, args.threads}):
+            journal = CirculationJournal(os.path.join(folder, f'desk{threads}.journal'))
+            seconds, latencies = run_threads(offline, threads, journal.append)
+            result[f'offline_{threads}_threads'] = dict(_timing(offline, seconds, latencies),
+                                                        fsyncs=journal.stats()['fsyncs'])
+
+        # Replay the last journal written
+        started = time.perf_counter()
+        summary = replay_journal(journal, args.batch_size)
+        seconds = time.perf_counter() - started
+        result['replay'] = {'ops_per_sec': round(summary['replayed'] / seconds, 1), 'batches': summary['batches'],
+                            'applied': summary['applied'], 'conflicts': summary['conflicts'],
+                            'errors': summary['errors'], 'seconds': round(seconds, 3)}
+        journal.close()
+
+    for name, timing in result.items():
+        if isinstance(timing, dict):
+            print(f"{name:>18}: {timing['ops_per_sec']:>9.1f} ops/s", file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
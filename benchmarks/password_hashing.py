@@ -0,0 +1,80 @@
+# This is 'benchmarks/password_hashing.py'
+#
+# Picks a password hashing cost that keeps logins inside the latency
+# budget. Times verify_password() at a range of costs on this machine and
+# reports the most expensive one whose p95 fits AUTH_CONFIG['login_budget_ms'].
+#
+#   python -m benchmarks.password_hashing
+#   python -m benchmarks.password_hashing --algorithm scrypt --budget-ms 250
+#   python -m benchmarks.password_hashing --concurrent 8   # 8 logins at once
+#
+# Put the recommended value in AUTH_CONFIG; existing hashes are upgraded
+# as their users log in.
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.circulation import percentile
+from utils.config import AUTH_CONFIG
+from utils.passwords import hash_password, verify_password
+
+DEFAULT_COSTS = {
+    'pbkdf2_sha256': [100_000, 200_000, 310_000, 600_000, 1_000_000],  # iterations
+    'scrypt': [2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16, 2 ** 17],         # n (r=8, p=1)
+}
+
+
+def _config(algorithm, cost):
+    config = dict(AUTH_CONFIG, algorithm=algorithm)
+    config['iterations' if algorithm == 'pbkdf2_sha256' else 'scrypt_n'] = cost
+    return config
+
+
+def measure(algorithm, cost, runs, concurrent):
+    """Times `runs` password checks, `concurrent` at a time; returns latencies in ms."""
+    stored = hash_password('correct horse battery staple', _config(algorithm, cost))
+
+    def check(_):
+        started = time.perf_counter()
+        verify_password('correct horse battery staple', stored)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrent) as pool:
+        return sorted(pool.map(check, range(runs)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the password hashing cost that fits the login budget.")
+    parser.add_argument('--algorithm', choices=list(DEFAULT_COSTS), default=AUTH_CONFIG['algorithm'])
+    parser.add_argument('--costs', type=lambda text: [int(v) for v in text.split(',')],
+                        help="Comma-separated iterations (pbkdf2) or n values (scrypt)")
+    parser.add_argument('--runs', type=int, default=10, help="Checks per cost")
+    parser.add_argument('--concurrent', type=int, default=1, help="Logins hashed at the same time")
+    parser.add_argument('--budget-ms', type=float, default=AUTH_CONFIG['login_budget_ms'])
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'cost':>10}{'p50 ms':>10}{'p95 ms':>10}", file=sys.stderr)
+    for cost in args.costs or DEFAULT_COSTS[args.algorithm]:
+        values = measure(args.algorithm, cost, args.runs, args.concurrent)
+        row = {'cost': cost, 'p50_ms': round(percentile(values, 50), 2),
+               'p95_ms': round(percentile(values, 95), 2), 'fits_budget': percentile(values, 95) <= args.budget_ms}
+        results.append(row)
+        print(f"{cost:>10}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{'' if row['fits_budget'] else '  over budget'}",
+              file=sys.stderr)
+
+    fitting = [row['cost'] for row in results if row['fits_budget']]
+    recommended = max(fitting) if fitting else None
+    print(json.dumps({'algorithm': args.algorithm, 'budget_ms': args.budget_ms, 'concurrent': args.concurrent,
+                      'results': results, 'recommended_cost': recommended}, indent=2))
+    if recommended is None:
+        print("No cost fits the budget; raise the budget or use a faster machine.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
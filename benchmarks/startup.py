@@ -0,0 +1,147 @@
+# This is 'benchmarks/startup.py'
+#
+# Tracks how fast the app starts. Every measurement runs in a fresh Python
+# process, `--runs` times:
+#
+#   interpreter          python -c pass (the floor everything else sits on)
+#   import_login_path    what main.py imports before the login window appears
+#   import_everything    the whole app: main window and all backend modules
+#   first_paint          main.py --startup-probe: login window on screen
+#   backend_ready        ... and backend imported and a pooled connection open
+#
+#   python -m benchmarks.startup --runs 20 --output startup.json
+#   python -m benchmarks.startup --compare startup.json
+#
+# The first-paint numbers need a display (or Xvfb); without one they are
+# skipped and the reason is recorded. With --compare, the exit code is 1 if
+# any p95 got more than --threshold percent slower.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+from benchmarks.circulation import percentile, compare, _git
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGIN_PATH_IMPORTS = "import ui.startup, argparse, ui.login_window, ui.profiler"
+EVERYTHING_IMPORTS = LOGIN_PATH_IMPORTS + ", ui.main_menu, modules.login_system, database.migrations"
+
+
+def _python(args, env, timeout=60):
+    """Runs a fresh interpreter in the repo root; returns (seconds, completed process)."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True,
+                          text=True, timeout=timeout)
+    return time.perf_counter() - started, proc
+
+
+def _summary(values_ms):
+    values = sorted(values_ms)
+    return {'count': len(values),
+            'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+            'p50_ms': round(percentile(values, 50), 3),
+            'p95_ms': round(percentile(values, 95), 3),
+            'max_ms': round(values[-1], 3) if values else 0.0,
+            'ops_per_sec': round(1000 * len(values) / sum(values), 1) if values else 0.0}
+
+
+def slowest_imports(statement, env, top=10):
+    """The modules with the largest cumulative import time, from -X importtime."""
+    _, proc = _python(['-X', 'importtime', '-c', statement], env)
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match and len(match.group(3)) <= 3:  # The module and what it imports directly
+            rows.append((int(match.group(2)), match.group(4)))
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 2)} for us, name in sorted(rows, reverse=True)[:top]]
+
+
+def run(runs, env):
+    samples = {'interpreter': [], 'import_login_path': [], 'import_everything': [],
+               'first_paint': [], 'backend_ready': []}
+    probe_error = None
+    for _ in range(runs):
+        for name, statement in (('interpreter', 'pass'), ('import_login_path', LOGIN_PATH_IMPORTS),
+                                ('import_everything', EVERYTHING_IMPORTS)):
+            seconds, proc = _python(['-c', statement], env)
+            if proc.returncode != 0:
+                raise RuntimeError(f"{name} failed: {proc.stderr.strip()[-500:]}")
+            samples[name].append(seconds * 1000)
+
+        if probe_error is None:
+            seconds, proc = _python(['main.py', '--startup-probe'], env)
+            lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+            if proc.returncode != 0 or not lines:
+                probe_error = (proc.stderr.strip().splitlines() or ['no output'])[-1]
+                continue
+            marks = json.loads(lines[-1])
+            samples['first_paint'].append(marks['first_paint'])
+            samples['backend_ready'].append(marks.get('pool_warm', marks['warm_up_done']))
+
+    # Imports are reported on top of the bare interpreter
+    floor = percentile(sorted(samples['interpreter']), 50)
+    for name in ('import_login_path', 'import_everything'):
+        samples[name] = [max(0.0, value - floor) for value in samples[name]]
+    operations = {name: _summary(values) for name, values in samples.items() if values}
+    return operations, probe_error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Start-up time benchmark.")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default='sqlite')
+    parser.add_argument('--path', default='startup.db', help="SQLite file the probe opens")
+    parser.add_argument('--output', help="Write the JSON result here (default: stdout)")
+    parser.add_argument('--compare', help="A previous JSON result to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed p95 slowdown, percent")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, LMS_DB_BACKEND=args.backend, LMS_SQLITE_PATH=os.path.abspath(args.path),
+               LMS_LOG_LEVEL='WARNING')
+    _python(['-c', EVERYTHING_IMPORTS], env)  # Compile the .pyc files once, outside the measurement
+
+    operations, probe_error = run(args.runs, env)
+    result = {
+        'benchmark': 'startup',
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git('rev-parse', '--short', 'HEAD'),
+        'git_branch': _git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'runs': args.runs,
+        'operations': operations,
+        'first_paint_skipped': probe_error,
+        'slowest_login_path_imports': slowest_imports(LOGIN_PATH_IMPORTS, env),
+    }
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if probe_error:
+        print(f"First paint not measured: {probe_error}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"p95 regressed by more than {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
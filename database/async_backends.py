@@ -0,0 +1,209 @@
+# This is 'database/async_backends.py'
+#
+# Async versions of the storage backends in backends.py, for the async
+# backend functions (modules/async_operations.py). As there, the modules
+# only ever see one interface, here aiomysql's: every call that talks to
+# the database is awaited.
+#
+#   cursor = await conn.cursor(dictionary=True)
+#   await cursor.execute("SELECT ... WHERE book_id = %s", (book_id,))
+#   row = await cursor.fetchone()
+#   await cursor.close()
+#   await conn.commit()
+#
+# MySQL goes through aiomysql (optional: only needed for async on MySQL).
+# SQLite, the local stand-in, runs its statements directly (see below).
+
+import asyncio
+import time
+
+# Pauses before retrying a SQLite statement that found the database
+# locked: the first one, doubled on each try up to the longest
+LOCKED_FIRST_PAUSE = 0.001
+LOCKED_MAX_PAUSE = 0.050
+
+
+class AsyncMySQLBackend:
+    """MySQL through aiomysql, with the same settings as MySQLBackend."""
+
+    name = 'mysql'
+    max_connections = None
+
+    def __init__(self, backend):
+        self._backend = backend  # The MySQLBackend this mirrors
+
+    async def connect(self):
+        import aiomysql  # Imported here so SQLite-only runs don't need it
+        settings = dict(self._backend.config)
+        if 'database' in settings:
+            settings['db'] = settings.pop('database')  # aiomysql's name for it
+        if 'connection_timeout' in settings:
+            settings['connect_timeout'] = settings.pop('connection_timeout')
+        from pymysql.constants import CLIENT
+        # FOUND_ROWS: rowcount counts matched rows, like MySQLBackend
+        raw = await aiomysql.connect(autocommit=False, client_flag=CLIENT.FOUND_ROWS, **settings)
+        return AsyncMySQLConnection(raw)
+
+    def is_retryable(self, error):
+        # aiomysql raises PyMySQL errors, which keep the errno in args[0]
+        errno = error.args[0] if getattr(error, 'args', None) else None
+        return errno in self._backend.RETRYABLE_ERRNOS
+
+    def is_disconnect(self, error):
+        errno = error.args[0] if getattr(error, 'args', None) else None
+        return errno in self._backend.DISCONNECT_ERRNOS
+
+    async def close(self):
+        pass
+
+
+class AsyncMySQLConnection:
+    def __init__(self, raw):
+        self._raw = raw
+
+    async def cursor(self, dictionary=False):
+        import aiomysql
+        return await self._raw.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor)
+
+    async def commit(self):
+        await self._raw.commit()
+
+    async def rollback(self):
+        await self._raw.rollback()
+
+    async def is_connected(self):
+        try:
+            await self._raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        await self._raw.ensure_closed()
+
+
+class AsyncSQLiteBackend:
+    """Gives a SQLiteBackend's connections the async interface.
+
+    The statements run right on the event loop thread. SQLite is a library
+    in our own process, not a server: there is no network wait to overlap,
+    and the indexed lookups the modules make take microseconds, less than
+    handing the call to a worker thread and back would. (Measured with
+    benchmarks/http_load.py: issue/return ran 2.5x slower with every
+    statement sent to a thread pool.) Use MySQL for real concurrency.
+
+    Waiting for another writer is the exception: sqlite3's busy timeout
+    would block the whole event loop while another connection holds the
+    write lock (a desk, sweep_holds.py, the holds endpoints' threads).
+    These connections don't wait in SQLite; a statement that finds the
+    database locked is retried after an asyncio.sleep, for up to the
+    backend's busy_timeout (see AsyncSQLiteConnection._unless_locked).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, backend):
+        self._backend = backend  # The SQLiteBackend this mirrors
+        self.max_connections = backend.max_connections
+
+    async def connect(self):
+        conn = self._backend.connect()
+        if not self._backend.in_memory:  # ':memory:' shares one connection with the sync pool
+            conn.set_busy_timeout(0)
+        return AsyncSQLiteConnection(conn, self._backend)
+
+    def is_retryable(self, error):
+        return self._backend.is_retryable(error)
+
+    def is_disconnect(self, error):
+        return self._backend.is_disconnect(error)
+
+    async def close(self):
+        pass
+
+
+class AsyncSQLiteConnection:
+    def __init__(self, conn, backend):
+        self._conn = conn  # A SQLiteConnection from backends.py
+        self._backend = backend
+
+    async def cursor(self, dictionary=False):
+        return AsyncSQLiteCursor(self._conn.cursor(dictionary), self)
+
+    async def commit(self):
+        await self._unless_locked(self._conn.commit)
+
+    async def rollback(self):
+        self._conn.rollback()
+
+    async def is_connected(self):
+        return self._conn.is_connected()
+
+    async def close(self):
+        self._conn.close()
+
+    async def _unless_locked(self, method, *args):
+        """Runs method(*args), sleeping and trying again while the database is locked.
+
+        Only done where SQLite allows it: the commit, or a statement
+        outside a transaction (the first write, which starts one; what it
+        began is rolled back before the next try). Inside a transaction
+        the error is raised, and the caller's transaction retry rolls back
+        and starts over.
+        """
+        committing = method == self._conn.commit
+        if self._conn.in_transaction and not committing:
+            return method(*args)
+        deadline = time.monotonic() + self._backend.busy_timeout
+        pause = LOCKED_FIRST_PAUSE
+        while True:
+            try:
+                return method(*args)
+            except Exception as e:
+                if not self._backend.is_retryable(e) or time.monotonic() + pause > deadline:
+                    raise
+            if not committing:
+                self._conn.rollback()
+            await asyncio.sleep(pause)
+            pause = min(pause * 2, LOCKED_MAX_PAUSE)
+
+
+class AsyncSQLiteCursor:
+    def __init__(self, cursor, conn):
+        self._cursor = cursor
+        self._conn = conn  # The AsyncSQLiteConnection, which knows how to wait for a lock
+
+    async def execute(self, query, params=()):
+        await self._conn._unless_locked(self._cursor.execute, query, params)
+
+    async def executemany(self, query, seq_of_params):
+        await self._conn._unless_locked(self._cursor.executemany, query, seq_of_params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    async def close(self):
+        self._cursor.close()
+
+
+def create_async_backend(backend):
+    """Builds the async counterpart of a backend from backends.py."""
+    if backend.name == 'mysql':
+        return AsyncMySQLBackend(backend)
+    if backend.name == 'sqlite':
+        return AsyncSQLiteBackend(backend)
+    raise ValueError(f"No async version of the {backend.name!r} backend")
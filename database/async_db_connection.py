@@ -0,0 +1,85 @@
+# This is 'database/async_db_connection.py'
+#
+# The async counterpart of db_connection.py: one shared AsyncConnectionPool
+# for the backend picked there, used by modules/async_operations.py. It is
+# a separate module so the desktop app never imports asyncio.
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from utils.config import ASYNC_POOL_CONFIG, METRICS_CONFIG
+from utils.log import get_logger
+from utils.metrics import registry
+from database.async_backends import create_async_backend
+from database.async_pool import AsyncConnectionPool
+from database.db_connection import get_backend
+from database.instrumentation import AsyncInstrumentedConnection
+
+log = get_logger(__name__)
+_acquire_seconds = registry.histogram('lms_db_async_acquire_seconds', "Time to get a connection from the async pool.")
+
+_async_backend = None
+_async_pool = None
+_pool_key = None  # (backend, event loop) the pool was made for
+
+def get_async_backend():
+    """ Return the async version of the current backend """
+    get_async_pool()
+    return _async_backend
+
+def get_async_pool():
+    """ Return the shared async pool, creating it on first use.
+
+    It is rebuilt if set_backend() switched backends, or if it is used
+    from another event loop than the one it was made on.
+    """
+    global _async_backend, _async_pool, _pool_key
+    backend = get_backend()
+    key = (backend, asyncio.get_running_loop())
+    if _async_pool is None or _pool_key != key:
+        if _async_pool is not None:
+            asyncio.ensure_future(_close(_async_pool, _async_backend))
+        settings = dict(ASYNC_POOL_CONFIG)
+        _async_backend = create_async_backend(backend)
+        if _async_backend.max_connections is not None:
+            settings['max_size'] = min(settings['max_size'], _async_backend.max_connections)
+        _async_pool = AsyncConnectionPool(_async_backend.connect, **settings)
+        _pool_key = key
+    return _async_pool
+
+@asynccontextmanager
+async def async_pooled_connection():
+    """ Borrow an async connection for an `async with` block.
+
+    Yields None if no connection could be opened, like pooled_connection().
+    """
+    pool = get_async_pool()
+    started = time.perf_counter()
+    try:
+        conn = await pool.checkout()
+    except Exception as e:  # PoolTimeoutError or a driver error
+        log.error("Could not connect to the database", error=str(e))
+        yield None
+        return
+    _acquire_seconds.observe(time.perf_counter() - started)
+    try:
+        yield AsyncInstrumentedConnection(conn) if METRICS_CONFIG['enabled'] else conn
+    finally:
+        await pool.checkin(conn)
+
+async def close_async_pool():
+    """ Close the async pool (e.g. when the server shuts down) """
+    global _async_pool, _async_backend, _pool_key
+    if _async_pool is not None:
+        await _close(_async_pool, _async_backend)
+    _async_pool = _async_backend = _pool_key = None
+
+async def _close(pool, backend):
+    try:
+        await pool.close()
+        await backend.close()
+    except Exception as e:
+        log.warning("Could not close the async pool", error=str(e))
+
+registry.register_collector('lms_async_pool', lambda: _async_pool.stats() if _async_pool is not None else {})
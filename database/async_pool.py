@@ -0,0 +1,187 @@
+# This is 'database/async_pool.py'
+#
+# The asyncio version of connection_pool.py, for the async backend
+# functions. Waiting for a connection suspends the coroutine instead of
+# blocking a thread, so one event loop can keep every connection busy.
+# A pool belongs to the event loop that created it.
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from database.connection_pool import PoolTimeoutError
+
+
+class AsyncConnectionPool:
+    """A bounded pool of async database connections.
+
+    `connect` is a zero-argument coroutine function that opens a new
+    connection (see database/async_backends.py). Use `connection()` in an
+    `async with` block.
+    """
+
+    def __init__(self, connect, max_size=50, min_size=0, checkout_timeout=10.0,
+                 max_idle_time=300.0, health_check_interval=30.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_time = max_idle_time
+        self.health_check_interval = health_check_interval
+
+        self._available = asyncio.Condition()
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._size = 0        # Open connections, idle + checked out
+        self._closed = False
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'timeouts': 0,
+                       'created': 0, 'reconnects': 0, 'evicted': 0, 'discarded': 0}
+
+    # --- Public API ---
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        """Checks out a connection for the duration of an `async with` block."""
+        conn = await self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            await self.checkin(conn)
+
+    async def checkout(self, timeout=None):
+        """Takes a healthy connection from the pool, opening one if needed."""
+        if timeout is None:
+            timeout = self.checkout_timeout
+
+        async with self._available:
+            if self._closed:
+                raise PoolTimeoutError("Connection pool is closed.")
+            self._evict_idle()
+            if not self._idle and self._size >= self.max_size:
+                wait_started = time.monotonic()
+                try:
+                    await asyncio.wait_for(
+                        self._available.wait_for(lambda: self._idle or self._size < self.max_size), timeout)
+                except asyncio.TimeoutError:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"No database connection available after {timeout} seconds.")
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - wait_started
+
+            self._stats['checkouts'] += 1
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                # Reserve the slot before connecting outside the lock
+                conn, last_used = None, None
+                self._size += 1
+
+        if conn is None:
+            return await self._open_new()
+        if time.monotonic() - last_used >= self.health_check_interval and not await self._is_healthy(conn):
+            await self._close_quietly(conn)
+            return await self._open_new(reconnect=True)
+        return conn
+
+    async def checkin(self, conn):
+        """Returns a connection to the pool, ending any open transaction."""
+        try:
+            await conn.rollback()  # Never hand the next caller a half-finished transaction
+        except Exception:
+            await self._discard(conn)
+            return
+        async with self._available:
+            if self._closed:
+                self._size -= 1
+                await self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    async def warm(self, count=None):
+        """Opens connections until `count` (default: min_size, at least 1) are open."""
+        target = min(self.max_size, max(1, self.min_size) if count is None else count)
+        opened = 0
+        while True:
+            async with self._available:
+                if self._closed or self._size >= target:
+                    return opened
+                self._size += 1
+            conn = await self._open_new()
+            opened += 1
+            async with self._available:
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+
+    def stats(self):
+        """Returns a snapshot of the pool counters."""
+        snapshot = dict(self._stats)
+        snapshot['size'] = self._size
+        snapshot['idle'] = len(self._idle)
+        snapshot['in_use'] = self._size - len(self._idle)
+        snapshot['max_size'] = self.max_size
+        return snapshot
+
+    async def close(self):
+        """Closes every idle connection; checked-out ones close on checkin."""
+        async with self._available:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                await self._close_quietly(conn)
+            self._available.notify_all()
+
+    # --- Internal helpers ---
+
+    async def _open_new(self, reconnect=False):
+        try:
+            conn = await self._connect()
+        except BaseException:
+            await self._release_slot()
+            raise
+        self._stats['reconnects' if reconnect else 'created'] += 1
+        return conn
+
+    async def _release_slot(self):
+        async with self._available:
+            self._size -= 1
+            self._available.notify()
+
+    async def _discard(self, conn):
+        await self._close_quietly(conn)
+        async with self._available:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._available.notify()
+
+    def _evict_idle(self):
+        """Drops connections idle for too long. Caller must hold the condition.
+
+        They are closed in the background so checkout() doesn't wait for it.
+        """
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.max_idle_time:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['evicted'] += 1
+            asyncio.ensure_future(self._close_quietly(conn))
+
+    @staticmethod
+    async def _is_healthy(conn):
+        try:
+            return await conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    async def _close_quietly(conn):
+        try:
+            await conn.close()
+        except Exception:
+            pass
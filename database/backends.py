@@ -0,0 +1,211 @@
+# This is 'database/backends.py'
+#
+# Storage backends. Each backend knows how to open a connection to its
+# engine; the modules only ever see objects with the mysql.connector
+# connection/cursor interface (cursor(dictionary=...), execute() with %s
+# placeholders, commit(), rollback(), ...), so the same queries run on both.
+
+import datetime
+import sqlite3
+import threading
+
+# Store dates as ISO strings and read DATE/DATETIME columns back as Python
+# objects, so the modules get the same types they get from MySQL.
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('DATE', lambda b: datetime.date.fromisoformat(b.decode()))
+sqlite3.register_converter('DATETIME', lambda b: datetime.datetime.fromisoformat(b.decode()))
+
+
+class MySQLBackend:
+    """The production backend: a MySQL server reached through mysql.connector."""
+
+    name = 'mysql'
+    max_connections = None  # No limit beyond the pool's own
+
+    # Deadlock found / lock wait timeout: the transaction can simply be re-run
+    RETRYABLE_ERRNOS = (1213, 1205)
+    # Can't connect (socket / TCP), server has gone away, lost connection
+    # during a query, lost connection to the server: the session is gone
+    DISCONNECT_ERRNOS = (2002, 2003, 2006, 2013, 2055)
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        import mysql.connector  # Imported here so SQLite-only runs don't need it
+        from mysql.connector.constants import ClientFlag
+        # FOUND_ROWS: an UPDATE's rowcount is the rows its WHERE matched, as
+        # on SQLite, not just the ones whose values changed. The guarded
+        # updates (bulk_import, update_book_details) read a rowcount of 0
+        # as "refused", which a save with nothing changed must not be.
+        return mysql.connector.connect(client_flags=[ClientFlag.FOUND_ROWS], **self.config)
+
+    def is_retryable(self, error):
+        """True if the error means a concurrent transaction won and we can retry."""
+        return getattr(error, 'errno', None) in self.RETRYABLE_ERRNOS
+
+    def is_disconnect(self, error):
+        """True if the error means the connection to the server was lost."""
+        return getattr(error, 'errno', None) in self.DISCONNECT_ERRNOS
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """An in-process SQLite backend, for running without a MySQL server.
+
+    `path` is a database file (opened in WAL mode) or ':memory:'. An
+    in-memory database only exists inside one connection, so every pooled
+    connection shares it and the pool is limited to a single connection.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=':memory:', busy_timeout=30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.in_memory = path == ':memory:'
+        self.max_connections = 1 if self.in_memory else None
+        self._lock = threading.Lock()
+        self._schema_applied = False
+        self._shared = None  # The single raw connection for ':memory:'
+
+    def connect(self):
+        with self._lock:
+            if self.in_memory:
+                if self._shared is None:
+                    self._shared = self._open_raw()
+                raw = self._shared
+            else:
+                raw = self._open_raw()
+            if not self._schema_applied:
+                self.apply_schema(raw)
+                self._schema_applied = True
+        return SQLiteConnection(raw, owns_connection=not self.in_memory)
+
+    def is_retryable(self, error):
+        """True if the error means a concurrent transaction won and we can retry."""
+        return isinstance(error, sqlite3.OperationalError) and (
+            'locked' in str(error) or 'busy' in str(error))
+
+    def is_disconnect(self, error):
+        """True if the database file can't be reached any more (e.g. a share that went away)."""
+        return isinstance(error, sqlite3.OperationalError) and (
+            'unable to open' in str(error) or 'disk I/O error' in str(error))
+
+    def apply_schema(self, raw):
+        """Creates the tables, or upgrades them, by applying pending migrations."""
+        from database.migrations import migrate  # Imported here: migrations imports db_connection
+        migrate(SQLiteConnection(raw, owns_connection=False), 'sqlite')
+
+    def close(self):
+        with self._lock:
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
+                self._schema_applied = False
+
+    def _open_raw(self):
+        raw = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                              detect_types=sqlite3.PARSE_DECLTYPES,
+                              check_same_thread=False)  # The pool moves connections between threads
+        raw.row_factory = sqlite3.Row
+        raw.execute("PRAGMA foreign_keys = ON")
+        if not self.in_memory:
+            raw.execute("PRAGMA journal_mode = WAL")
+            raw.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, much faster commits
+        return raw
+
+
+class SQLiteConnection:
+    """Wraps a sqlite3 connection in the subset of the mysql.connector API we use."""
+
+    def __init__(self, raw, owns_connection=True):
+        self._raw = raw
+        self._owns_connection = owns_connection
+        self._closed = False
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._raw.cursor(), dictionary)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def set_busy_timeout(self, seconds):
+        """How long a statement waits for another connection's write lock before "database is locked"."""
+        self._raw.execute(f"PRAGMA busy_timeout = {int(seconds * 1000)}")
+
+    def is_connected(self):
+        if self._closed:
+            return False
+        try:
+            self._raw.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._owns_connection:
+                self._raw.close()
+
+
+class SQLiteCursor:
+    """Translates %s placeholders to ? and returns tuples or dicts like mysql.connector."""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace('%s', '?'), params)
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(query.replace('%s', '?'), seq_of_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._convert(row)
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._convert(row)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+    def _convert(self, row):
+        return dict(row) if self._dictionary else tuple(row)
+
+
+def create_backend(name, db_config=None, sqlite_path=':memory:'):
+    """Builds a backend by name ('mysql' or 'sqlite')."""
+    if name == 'mysql':
+        return MySQLBackend(db_config)
+    if name == 'sqlite':
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown database backend: {name!r}")
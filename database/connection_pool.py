@@ -0,0 +1,206 @@
+# This is 'database/connection_pool.py'
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class ConnectionPool:
+    """A bounded pool of reusable database connections.
+
+    `connect` is any zero-argument function that opens a new connection.
+    Connections are handed out with `connection()`, which is a context
+    manager, and go back to the pool when the `with` block ends.
+    """
+
+    def __init__(self, connect, max_size=5, min_size=0, checkout_timeout=10.0,
+                 max_idle_time=300.0, health_check_interval=30.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_time = max_idle_time
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._size = 0        # Open connections, idle + checked out
+        self._closed = False
+
+        # Counters used to size the pool under load
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'reconnects': 0,
+            'evicted': 0,
+            'discarded': 0,
+        }
+
+    # --- Public API ---
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Checks out a connection for the duration of a `with` block."""
+        conn = self.checkout(timeout)
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def checkout(self, timeout=None):
+        """Takes a healthy connection from the pool, opening one if needed."""
+        if timeout is None:
+            timeout = self.checkout_timeout
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            if self._closed:
+                raise PoolTimeoutError("Connection pool is closed.")
+            self._evict_idle()
+            waited = False
+            wait_started = time.monotonic()
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {timeout} seconds.")
+                waited = True
+                self._lock.wait(remaining)
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - wait_started
+
+            self._stats['checkouts'] += 1
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                # Reserve the slot before releasing the lock to connect
+                conn, last_used = None, None
+                self._size += 1
+
+        if conn is None:
+            return self._open_new()
+
+        if time.monotonic() - last_used >= self.health_check_interval and not self._is_healthy(conn):
+            self._close_quietly(conn)
+            return self._open_new(reconnect=True)
+        return conn
+
+    def checkin(self, conn):
+        """Returns a connection to the pool, ending any open transaction."""
+        try:
+            # Never hand the next caller a half-finished transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def warm(self, count=None):
+        """Opens connections ahead of time until `count` (default: min_size, at
+        least 1) are open, so the first checkout doesn't pay for connecting.
+        Returns how many were opened."""
+        target = min(self.max_size, max(1, self.min_size) if count is None else count)
+        opened = 0
+        while True:
+            with self._lock:
+                if self._closed or self._size >= target:
+                    return opened
+                self._size += 1  # Reserve the slot, as checkout() does
+            conn = self._open_new()
+            opened += 1
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+
+    def stats(self):
+        """Returns a snapshot of the pool counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._size - len(self._idle)
+            snapshot['max_size'] = self.max_size
+        return snapshot
+
+    def close(self):
+        """Closes every idle connection; checked-out ones close on checkin."""
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._lock.notify_all()
+
+    # --- Internal helpers ---
+
+    def _open_new(self, reconnect=False):
+        try:
+            conn = self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+        if conn is None:
+            self._release_slot()
+            raise ConnectionError("Could not open a database connection.")
+        with self._lock:
+            self._stats['reconnects' if reconnect else 'created'] += 1
+        return conn
+
+    def _release_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._lock:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._lock.notify()
+
+    def _evict_idle(self):
+        """Closes connections idle for too long. Caller must hold the lock."""
+        now = time.monotonic()
+        # The oldest connections are on the left
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.max_idle_time:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['evicted'] += 1
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,39 @@
+-- database/create_tables_sqlite.sql
+-- SQLite version of the library schema (migration 1 in database/migrations.py).
+-- The columns match what the modules actually read and write.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS books (
+    book_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(100) NOT NULL,
+    author VARCHAR(100),
+    isbn VARCHAR(20),
+    genre VARCHAR(50),
+    quantity INT DEFAULT 1,
+    available_quantity INT DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS members (
+    member_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(100) UNIQUE,
+    phone_number VARCHAR(15),
+    registration_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id INT,
+    member_id INT,
+    issue_date DATE,
+    due_date DATE,
+    return_date DATE,
+    fine_amount DECIMAL(10,2) DEFAULT 0,
+    FOREIGN KEY (book_id) REFERENCES books(book_id),
+    FOREIGN KEY (member_id) REFERENCES members(member_id)
+);
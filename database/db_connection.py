@@ -1,20 +1,59 @@
 # This is 'database/db_connection.py'
 
-import mysql.connector
-from mysql.connector import Error
-from utils.config import DB_CONFIG  # Import credentials
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.config import DB_CONFIG, DB_BACKEND, SQLITE_PATH, POOL_CONFIG, METRICS_CONFIG  # Import credentials
+from utils.log import get_logger
+from utils.metrics import registry
+from database.backends import create_backend
+from database.connection_pool import ConnectionPool
+from database.instrumentation import InstrumentedConnection
+
+log = get_logger(__name__)
+_acquire_seconds = registry.histogram('lms_db_acquire_seconds', "Time to get a connection from the pool.")
+
+_backend = None
+_pool = None
+_pool_lock = threading.Lock()
+_pool_overrides = {}
+
+def get_backend():
+    """ Return the storage backend picked in utils/config.py (MySQL or SQLite) """
+    global _backend
+    if _backend is None:
+        with _pool_lock:
+            if _backend is None:
+                _backend = create_backend(DB_BACKEND, DB_CONFIG, SQLITE_PATH)
+    return _backend
+
+def set_backend(backend, **pool_settings):
+    """ Switch every module to another backend, e.g. SQLiteBackend(':memory:')
+
+    Keyword arguments override POOL_CONFIG for the new pool (e.g. max_size=20).
+    """
+    global _backend, _pool, _pool_overrides
+    with _pool_lock:
+        _pool_overrides = pool_settings
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if _backend is not None and _backend is not backend:
+            _backend.close()
+        _backend = backend
 
 def create_connection():
-    """ Create a database connection to the MySQL database """
+    """ Create a database connection to the configured database """
     connection = None
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = get_backend().connect()
         
         if connection.is_connected():
-            print("Successfully connected to the database")
+            log.debug("Connected to the database", backend=get_backend().name)
             
-    except Error as e:
-        print(f"Error while connecting to MySQL: {e}")
+    except Exception as e:
+        log.error("Could not connect to the database", error=str(e))
         return None  # Return None if connection fails
         
     return connection
@@ -23,10 +62,61 @@ def close_connection(connection):
     """ Close the database connection """
     if connection and connection.is_connected():
         connection.close()
-        print("Database connection closed.")
+        log.debug("Database connection closed")
+
+def get_pool():
+    """ Return the shared connection pool, creating it on first use """
+    global _pool
+    backend = get_backend()
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = dict(POOL_CONFIG, **_pool_overrides)
+                if backend.max_connections is not None:
+                    settings['max_size'] = min(settings['max_size'], backend.max_connections)
+                _pool = ConnectionPool(backend.connect, **settings)
+    return _pool
+
+@contextmanager
+def pooled_connection(timeout=None):
+    """ Borrow a connection from the pool for a `with` block.
+
+    Yields None if no connection could be opened, just like create_connection()
+    returns None, so callers keep their `if not conn:` checks. `timeout`
+    overrides the pool's checkout_timeout (seconds to wait for a free one).
+    """
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        conn = pool.checkout(timeout)
+    except Exception as e:  # PoolTimeoutError or a driver error
+        log.error("Could not connect to the database", error=str(e))
+        yield None
+        return
+    _acquire_seconds.observe(time.perf_counter() - started)
+    try:
+        yield InstrumentedConnection(conn) if METRICS_CONFIG['enabled'] else conn
+    finally:
+        pool.checkin(conn)
+
+def warm_pool(count=None):
+    """ Open pooled connections ahead of the first query (e.g. behind the login window) """
+    return get_pool().warm(count)
+
+def pool_stats():
+    """ Return the pool counters (checkouts, waits, reconnects, ...) """
+    return get_pool().stats()
+
+# Report the pool counters with the other metrics, once a pool exists
+registry.register_collector('lms_pool', lambda: _pool.stats() if _pool is not None else {})
 
 # A simple test to run when this file is executed directly
 if __name__ == '__main__':
     conn = create_connection()
     if conn:
-        close_connection(conn)
\ No newline at end of file
+        close_connection(conn)
+
+    with pooled_connection() as conn:
+        if conn:
+            print("Borrowed a pooled connection.")
+    print(pool_stats())
@@ -0,0 +1,189 @@
+# This is 'database/instrumentation.py'
+#
+# Times every SQL statement the modules run. pooled_connection() hands out
+# an InstrumentedConnection, whose cursors record per statement:
+#   lms_sql_seconds{statement}             execute() time
+#   lms_sql_rows_total{statement,kind}     rows read (fetched) or written
+#   lms_sql_errors_total{statement}        statements that raised
+# plus commit/rollback time, and log statements slower than
+# METRICS_CONFIG['slow_query_seconds']. async_pooled_connection() does the
+# same for the async functions with AsyncInstrumentedConnection.
+#
+# `statement` is the query's fingerprint: whitespace collapsed and
+# placeholder lists shortened, so "IN (%s, %s, %s)" with any number of
+# values counts as one statement.
+
+import functools
+import re
+import time
+
+from utils.config import METRICS_CONFIG
+from utils.log import get_logger
+from utils.metrics import registry
+
+log = get_logger(__name__)
+
+_sql_seconds = registry.histogram('lms_sql_seconds', "SQL statement execution time.", ('statement',))
+_sql_rows = registry.counter('lms_sql_rows_total', "Rows read or written by SQL statements.",
+                             ('statement', 'kind'))
+_sql_errors = registry.counter('lms_sql_errors_total', "SQL statements that raised an error.", ('statement',))
+_tx_seconds = registry.histogram('lms_db_transaction_end_seconds', "Time to commit or roll back.", ('action',))
+
+_COMMENTS = re.compile(r"--[^\n]*")
+_SPACES = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_CASE_ARMS = re.compile(r"(?:WHEN %s THEN %s\s*)+")
+_WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(query):
+    """The query with its variable-length parts collapsed, for use as a label."""
+    text = _SPACES.sub(' ', _COMMENTS.sub(' ', query)).strip()
+    text = _CASE_ARMS.sub('WHEN %s THEN %s ... ', text)
+    return _PLACEHOLDER_LIST.sub('%s, ...', text)
+
+
+def _timed(statement, started):
+    elapsed = time.perf_counter() - started
+    _sql_seconds.observe(elapsed, statement)
+    if elapsed >= METRICS_CONFIG['slow_query_seconds']:
+        log.warning("Slow query", seconds=round(elapsed, 4), statement=statement[:500])
+
+
+class InstrumentedCursor:
+    """Wraps a driver cursor; everything not timed here is passed through."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+
+    def execute(self, query, params=()):
+        self._run(self._cursor.execute, query, params)
+
+    def executemany(self, query, seq_of_params):
+        self._run(self._cursor.executemany, query, seq_of_params)
+
+    def _run(self, method, query, params):
+        statement = self._statement = fingerprint(query)
+        started = time.perf_counter()
+        try:
+            method(query, params)
+        except Exception:
+            _sql_errors.inc(statement)
+            raise
+        finally:
+            _timed(statement, started)
+        self._written(statement)
+
+    def _written(self, statement):
+        if statement[:7].upper().startswith(_WRITES):
+            rowcount = self._cursor.rowcount
+            if rowcount and rowcount > 0:
+                _sql_rows.inc(statement, 'written', amount=rowcount)
+
+    def _read(self, rows):
+        if rows and self._statement is not None:
+            _sql_rows.inc(self._statement, 'read', amount=len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._statement is not None:
+            _sql_rows.inc(self._statement, 'read')
+        return row
+
+    def fetchmany(self, size=1):
+        return self._read(self._cursor.fetchmany(size))
+
+    def fetchall(self):
+        return self._read(self._cursor.fetchall())
+
+    def __iter__(self):
+        for row in self._cursor:
+            if self._statement is not None:
+                _sql_rows.inc(self._statement, 'read')
+            yield row
+
+    def __getattr__(self, name):  # rowcount, lastrowid, column_names, close, ...
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Wraps a pooled connection so its cursors are instrumented."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        started = time.perf_counter()
+        self._conn.commit()
+        _tx_seconds.observe(time.perf_counter() - started, 'commit')
+
+    def rollback(self):
+        started = time.perf_counter()
+        self._conn.rollback()
+        _tx_seconds.observe(time.perf_counter() - started, 'rollback')
+
+    def __getattr__(self, name):  # is_connected, close, ...
+        return getattr(self._conn, name)
+
+
+class AsyncInstrumentedCursor(InstrumentedCursor):
+    """InstrumentedCursor for the async drivers' cursors, whose calls are awaited."""
+
+    async def execute(self, query, params=()):
+        await self._run(self._cursor.execute, query, params)
+
+    async def executemany(self, query, seq_of_params):
+        await self._run(self._cursor.executemany, query, seq_of_params)
+
+    async def _run(self, method, query, params):
+        statement = self._statement = fingerprint(query)
+        started = time.perf_counter()
+        try:
+            await method(query, params)
+        except Exception:
+            _sql_errors.inc(statement)
+            raise
+        finally:
+            _timed(statement, started)
+        self._written(statement)
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        if row is not None and self._statement is not None:
+            _sql_rows.inc(self._statement, 'read')
+        return row
+
+    async def fetchmany(self, size=1):
+        return self._read(await self._cursor.fetchmany(size))
+
+    async def fetchall(self):
+        return self._read(await self._cursor.fetchall())
+
+
+class AsyncInstrumentedConnection:
+    """Wraps an async pooled connection so its cursors are instrumented."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def cursor(self, *args, **kwargs):
+        return AsyncInstrumentedCursor(await self._conn.cursor(*args, **kwargs))
+
+    async def commit(self):
+        started = time.perf_counter()
+        await self._conn.commit()
+        _tx_seconds.observe(time.perf_counter() - started, 'commit')
+
+    async def rollback(self):
+        started = time.perf_counter()
+        await self._conn.rollback()
+        _tx_seconds.observe(time.perf_counter() - started, 'rollback')
+
+    def __getattr__(self, name):  # is_connected, close, ...
+        return getattr(self._conn, name)
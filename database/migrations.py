@@ -0,0 +1,424 @@
+# This is 'database/migrations.py'
+#
+# Versioned schema migrations. Each migration runs once per database and
+# its version is recorded in the schema_migrations table, so any database
+# (a fresh one, one made from the old create_tables.sql, or an up-to-date
+# one) ends up with the same schema:
+#
+#   python -m database.migrations            # apply pending migrations
+#   python -m database.migrations --status   # show what has been applied
+#
+# The SQLite backend runs this automatically when it opens a database.
+# Against MySQL, run it once after every upgrade.
+#
+# MySQL commits DDL statements immediately, so a migration that fails half
+# way cannot be rolled back there. Every step below therefore checks what
+# already exists first, and re-running the migration finishes the job.
+
+import argparse
+import datetime
+import os
+import sys
+
+from database.db_connection import pooled_connection, get_backend
+from utils.log import get_logger, configure_logging
+
+log = get_logger(__name__)
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILES = {'mysql': 'create_tables.sql', 'sqlite': 'create_tables_sqlite.sql'}
+LOCK_NAME = 'lms_schema_migrations'
+LOCK_TIMEOUT = 60  # Seconds to wait for another process that is migrating
+
+
+class MigrationError(Exception):
+    """A migration cannot be applied until the data is fixed by hand."""
+
+
+class Migration:
+    """One schema change: `apply(cursor, dialect)` where dialect is 'mysql' or 'sqlite'."""
+
+    def __init__(self, version, name, apply):
+        self.version = version
+        self.name = name
+        self.apply = apply
+
+
+# --- Introspection helpers ---
+
+def _tables(cursor, dialect):
+    if dialect == 'mysql':
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0].lower() for row in cursor.fetchall()}
+
+
+def _columns(cursor, dialect, table):
+    if dialect == 'mysql':
+        cursor.execute("SELECT column_name FROM information_schema.columns "
+                       "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        return {row[0].lower() for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1].lower() for row in cursor.fetchall()}
+
+
+def _indexes(cursor, dialect, table):
+    if dialect == 'mysql':
+        cursor.execute("SELECT DISTINCT index_name FROM information_schema.statistics "
+                       "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        return {row[0].lower() for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA index_list({table})")
+    return {row[1].lower() for row in cursor.fetchall()}
+
+
+def _triggers(cursor, dialect):
+    if dialect == 'mysql':
+        cursor.execute("SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = DATABASE()")
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    return {row[0].lower() for row in cursor.fetchall()}
+
+
+def _create_index(cursor, dialect, table, name, columns, unique=False):
+    if name.lower() in _indexes(cursor, dialect, table):
+        return
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    cursor.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+    log.info("Created index", index=name, table=table, columns=', '.join(columns))
+
+
+def _split_sql(text):
+    """Splits a .sql file into statements (our files have no ';' inside strings)."""
+    lines = [line for line in text.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+# --- The migrations ---
+
+def _create_tables(cursor, dialect):
+    """1: the baseline tables, from create_tables.sql / create_tables_sqlite.sql."""
+    with open(os.path.join(SCHEMA_DIR, SCHEMA_FILES[dialect]), encoding='utf-8') as f:
+        for statement in _split_sql(f.read()):
+            cursor.execute(statement)
+
+
+def _upgrade_legacy_schema(cursor, dialect):
+    """2: brings tables made from the original create_tables.sql up to date.
+
+    That file had users.password, members.phone, no isbn/available_quantity
+    on books, and kept loans in issued_books. Migration 1 has already
+    created whatever table was missing, so only columns need fixing here.
+    """
+    users = _columns(cursor, dialect, 'users')
+    if 'password' in users and 'password_hash' not in users:
+        cursor.execute("ALTER TABLE users RENAME COLUMN password TO password_hash")
+
+    members = _columns(cursor, dialect, 'members')
+    if 'phone' in members and 'phone_number' not in members:
+        cursor.execute("ALTER TABLE members RENAME COLUMN phone TO phone_number")
+    if 'registration_date' not in members:
+        cursor.execute("ALTER TABLE members ADD COLUMN registration_date DATE")
+
+    books = _columns(cursor, dialect, 'books')
+    if 'isbn' not in books:
+        cursor.execute("ALTER TABLE books ADD COLUMN isbn VARCHAR(20)")
+
+    if 'issued_books' in _tables(cursor, dialect):
+        # Carry old loans over once; the loan period was 14 days (issue_return.LOAN_DAYS)
+        cursor.execute("SELECT COUNT(*) FROM transactions")
+        if cursor.fetchone()[0] == 0:
+            due = ("DATE_ADD(issue_date, INTERVAL 14 DAY)" if dialect == 'mysql'
+                   else "date(issue_date, '+14 days')")
+            cursor.execute(f"""
+                INSERT INTO transactions (book_id, member_id, issue_date, due_date, return_date, fine_amount)
+                SELECT book_id, member_id, issue_date, {due}, return_date, COALESCE(fine, 0)
+                FROM issued_books ORDER BY issue_id
+                """)
+
+    if 'available_quantity' not in books:
+        cursor.execute("ALTER TABLE books ADD COLUMN available_quantity INT DEFAULT 1")
+        cursor.execute("""
+            UPDATE books SET available_quantity = quantity - (
+                SELECT COUNT(*) FROM transactions t
+                WHERE t.book_id = books.book_id AND t.return_date IS NULL)
+            """)
+
+
+def _seed_admin(cursor, dialect):
+    """3: the default login, admin / admin (SHA-256 of 'admin'), unless it exists."""
+    insert = 'INSERT IGNORE' if dialect == 'mysql' else 'INSERT OR IGNORE'
+    cursor.execute(f"{insert} INTO users (username, password_hash) VALUES (%s, %s)",
+                   ('admin', '8c6976e5b5410415bde908bd4dee15dfb167a9c873fc4bb8a81f6f2ab448a918'))
+
+
+def _add_hot_path_indexes(cursor, dialect):
+    """4: the indexes behind our hot queries (see database/query_plans.py)."""
+    # A blank ISBN from the Add Book form means "no ISBN"; as '' they would collide
+    cursor.execute("UPDATE books SET isbn = NULL WHERE isbn = ''")
+    cursor.execute("""
+        SELECT isbn, COUNT(*) FROM books WHERE isbn IS NOT NULL
+        GROUP BY isbn HAVING COUNT(*) > 1 ORDER BY isbn LIMIT 10
+        """)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        listed = ', '.join(f"{isbn} (x{count})" for isbn, count in duplicates)
+        raise MigrationError(f"Books share an ISBN, so it cannot be made unique: {listed}. "
+                             "Merge or correct those books and run the migration again.")
+
+    # get_book_by_isbn and the bulk importer's duplicate check
+    _create_index(cursor, dialect, 'books', 'ux_books_isbn', ['isbn'], unique=True)
+    # return_book's open-loan lookup: book, member, and return_date IS NULL
+    _create_index(cursor, dialect, 'transactions', 'ix_transactions_open_loan',
+                  ['book_id', 'member_id', 'return_date'])
+    # Overdue scans (reports, fine assessment)
+    _create_index(cursor, dialect, 'transactions', 'ix_transactions_due_date', ['due_date'])
+    # members.email is already UNIQUE (and so indexed) in every version of the schema
+    _create_index(cursor, dialect, 'members', 'ix_members_name', ['name'])
+
+
+def _widen_password_hash(cursor, dialect):
+    """5: room for salted KDF hashes (utils/passwords.py) and future algorithms."""
+    if dialect == 'mysql':
+        cursor.execute("ALTER TABLE users MODIFY password_hash VARCHAR(255) NOT NULL")
+    # SQLite doesn't enforce VARCHAR lengths; nothing to do
+
+
+def _create_holds(cursor, dialect):
+    """6: the holds table (modules/holds.py) and the indexes its queues need."""
+    key = ('hold_id INT AUTO_INCREMENT PRIMARY KEY' if dialect == 'mysql'
+           else 'hold_id INTEGER PRIMARY KEY AUTOINCREMENT')
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS holds (
+            {key},
+            book_id INT NOT NULL,
+            member_id INT NOT NULL,
+            placed_date DATE NOT NULL,
+            status VARCHAR(10) NOT NULL,
+            ready_date DATE,
+            expires_date DATE,
+            closed_date DATE,
+            FOREIGN KEY (book_id) REFERENCES books(book_id),
+            FOREIGN KEY (member_id) REFERENCES members(member_id)
+        )""")
+    # A title's queue in order (hold_id is the order holds were placed in);
+    # also the hold a member collects at issue_book
+    _create_index(cursor, dialect, 'holds', 'ix_holds_queue', ['book_id', 'status', 'hold_id'])
+    # A member's own holds
+    _create_index(cursor, dialect, 'holds', 'ix_holds_member', ['member_id', 'status'])
+    # The expiry sweep: ready holds past their pickup date
+    _create_index(cursor, dialect, 'holds', 'ix_holds_expiry', ['status', 'expires_date'])
+
+
+def _add_circulation_counters(cursor, dialect):
+    """7: per-title circulation counters on books (see modules/circulation_counters.py)."""
+    books = _columns(cursor, dialect, 'books')
+    for column in ('on_loan', 'held_copies', 'overdue_loans', 'lifetime_issues'):
+        if column not in books:
+            cursor.execute(f"ALTER TABLE books ADD COLUMN {column} INT NOT NULL DEFAULT 0")
+    if 'overdue_as_of' not in books:
+        cursor.execute("ALTER TABLE books ADD COLUMN overdue_as_of DATE")
+    # Fill them in from the loans and holds (the reconciliation job keeps them honest later)
+    cursor.execute("""
+        UPDATE books SET
+            on_loan = (SELECT COUNT(*) FROM transactions t
+                       WHERE t.book_id = books.book_id AND t.return_date IS NULL),
+            held_copies = (SELECT COUNT(*) FROM holds h
+                           WHERE h.book_id = books.book_id AND h.status = 'ready'),
+            overdue_loans = (SELECT COUNT(*) FROM transactions t
+                             WHERE t.book_id = books.book_id AND t.return_date IS NULL AND t.due_date < %s),
+            lifetime_issues = (SELECT COUNT(*) FROM transactions t WHERE t.book_id = books.book_id),
+            overdue_as_of = %s
+        """, (datetime.date.today(), datetime.date.today()))
+
+
+def _create_journal_replays(cursor, dialect):
+    """8: what was replayed from each desk's offline journal (modules/circulation_journal.py)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS journal_replays (
+            journal_id VARCHAR(36) NOT NULL,
+            seq INT NOT NULL,
+            op VARCHAR(10) NOT NULL,
+            book_id INT NOT NULL,
+            member_id INT NOT NULL,
+            op_date DATE NOT NULL,
+            outcome VARCHAR(10) NOT NULL,
+            message VARCHAR(255),
+            replayed_at DATETIME NOT NULL,
+            PRIMARY KEY (journal_id, seq)
+        )""")
+    # Conflicts waiting for a librarian, newest first
+    _create_index(cursor, dialect, 'journal_replays', 'ix_journal_replays_outcome', ['outcome', 'replayed_at'])
+
+
+def _record_changes(cursor, dialect, table, entity, key, columns):
+    """Triggers that note in index_changes every row of `table` added, deleted
+    or changed in one of `columns`, whichever program (or person) did it.
+
+    On MySQL with binary logging on, creating triggers needs the SUPER
+    privilege or log_bin_trust_function_creators = 1.
+    """
+    existing = _triggers(cursor, dialect)
+    note = f"INSERT INTO index_changes (entity, entity_id) VALUES ('{entity}', {{row}}.{key})"
+    if dialect == 'mysql':
+        changed = ' OR '.join(f"NOT (NEW.{c} <=> OLD.{c})" for c in columns)
+        triggers = {
+            f'tr_{table}_changes_insert': f"AFTER INSERT ON {table} FOR EACH ROW {note.format(row='NEW')}",
+            f'tr_{table}_changes_update': (f"AFTER UPDATE ON {table} FOR EACH ROW "
+                                           f"INSERT INTO index_changes (entity, entity_id) "
+                                           f"SELECT '{entity}', NEW.{key} FROM DUAL WHERE {changed}"),
+            f'tr_{table}_changes_delete': f"AFTER DELETE ON {table} FOR EACH ROW {note.format(row='OLD')}",
+        }
+    else:
+        changed = ' OR '.join(f"NEW.{c} IS NOT OLD.{c}" for c in columns)
+        triggers = {
+            f'tr_{table}_changes_insert': f"AFTER INSERT ON {table} BEGIN {note.format(row='NEW')}; END",
+            f'tr_{table}_changes_update': (f"AFTER UPDATE OF {', '.join(columns)} ON {table} WHEN {changed} "
+                                           f"BEGIN {note.format(row='NEW')}; END"),
+            f'tr_{table}_changes_delete': f"AFTER DELETE ON {table} BEGIN {note.format(row='OLD')}; END",
+        }
+    for name, body in triggers.items():
+        if name not in existing:
+            cursor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def _create_index_changes(cursor, dialect):
+    """9: index_changes, so every search index sees books changed by other programs (modules/index_changes.py)."""
+    key = ('change_id BIGINT AUTO_INCREMENT PRIMARY KEY' if dialect == 'mysql'
+           else 'change_id INTEGER PRIMARY KEY AUTOINCREMENT')
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS index_changes (
+            {key},
+            entity VARCHAR(10) NOT NULL,
+            entity_id INT NOT NULL,
+            changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""")
+    # An index catching up: one entity's changes since a time
+    _create_index(cursor, dialect, 'index_changes', 'ix_index_changes_entity', ['entity', 'changed_at'])
+    # Pruning old changes
+    _create_index(cursor, dialect, 'index_changes', 'ix_index_changes_changed_at', ['changed_at'])
+    _record_changes(cursor, dialect, 'books', 'book', 'book_id', ['title', 'author', 'isbn', 'genre'])
+
+
+def _record_member_changes(cursor, dialect):
+    """10: note member changes in index_changes too, for the member lookup index."""
+    _record_changes(cursor, dialect, 'members', 'member', 'member_id', ['name', 'email', 'phone_number'])
+
+
+MIGRATIONS = [
+    Migration(1, 'create tables', _create_tables),
+    Migration(2, 'upgrade legacy schema', _upgrade_legacy_schema),
+    Migration(3, 'seed default admin', _seed_admin),
+    Migration(4, 'hot path indexes', _add_hot_path_indexes),
+    Migration(5, 'widen password hashes', _widen_password_hash),
+    Migration(6, 'holds', _create_holds),
+    Migration(7, 'circulation counters', _add_circulation_counters),
+    Migration(8, 'journal replays', _create_journal_replays),
+    Migration(9, 'index changes', _create_index_changes),
+    Migration(10, 'member index changes', _record_member_changes),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# --- Running them ---
+
+def applied_versions(cursor, dialect):
+    """Returns {version: applied_at} for the migrations already applied."""
+    if 'schema_migrations' not in _tables(cursor, dialect):
+        return {}
+    cursor.execute("SELECT version, applied_at FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+
+def _lock(cursor, dialect):
+    """Makes sure only one process migrates at a time (others wait, then find nothing to do)."""
+    if dialect == 'mysql':
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise MigrationError("Timed out waiting for another process to finish migrating.")
+    else:
+        cursor.execute("BEGIN IMMEDIATE")  # Takes SQLite's write lock until commit
+
+
+def _unlock(cursor, dialect):
+    if dialect == 'mysql':
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+
+
+def migrate(conn=None, dialect=None, target=None):
+    """Applies every pending migration up to `target` (default: all).
+
+    Uses a pooled connection unless `conn` is given. Returns the list of
+    versions applied. On SQLite all of them commit or roll back together.
+    """
+    if conn is None:
+        with pooled_connection() as conn:
+            if not conn:
+                raise ConnectionError("Could not connect to the database.")
+            return migrate(conn, dialect or get_backend().name, target)
+    dialect = dialect or get_backend().name
+    target = LATEST_VERSION if target is None else target
+
+    cursor = conn.cursor()
+    applied = []
+    try:
+        _lock(cursor, dialect)
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    applied_at DATETIME NOT NULL
+                )""")
+            done = applied_versions(cursor, dialect)  # Read under the lock
+            for migration in MIGRATIONS:
+                if migration.version in done or migration.version > target:
+                    continue
+                log.info("Applying migration", version=migration.version, name=migration.name)
+                migration.apply(cursor, dialect)
+                cursor.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                               (migration.version, migration.name, datetime.datetime.now().replace(microsecond=0)))
+                if dialect == 'mysql':
+                    conn.commit()  # DDL has committed anyway; record each version as it lands
+                applied.append(migration.version)
+            conn.commit()
+        finally:
+            _unlock(cursor, dialect)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply or inspect schema migrations.")
+    parser.add_argument('--status', action='store_true', help="Only list applied and pending migrations")
+    parser.add_argument('--target', type=int, help="Stop after this version")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        if args.status:
+            with pooled_connection() as conn:
+                if not conn:
+                    raise ConnectionError("Could not connect to the database.")
+                cursor = conn.cursor()
+                done = applied_versions(cursor, get_backend().name)
+                cursor.close()
+            for migration in MIGRATIONS:
+                state = f"applied {done[migration.version]}" if migration.version in done else "pending"
+                print(f"  {migration.version:>3}  {migration.name:<25} {state}")
+            return 0
+        applied = migrate(target=args.target)
+    except (ConnectionError, MigrationError) as e:
+        print(f"Migration failed: {e}")
+        return 1
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# This is 'database/query_plans.py'
+#
+# Checks that our hot queries still use an index. Each query below is run
+# through EXPLAIN (EXPLAIN QUERY PLAN on SQLite) and the check fails if any
+# of the listed tables is read with a full table scan, e.g. because an
+# index was dropped or a query was changed so it can no longer use one.
+#
+#   python -m database.query_plans      # exit code 1 if a hot query full-scans
+#
+# On MySQL, run it against a database with realistic data: on nearly empty
+# tables the optimizer may rightly prefer a scan.
+#
+# The queries mirror the ones in modules/; keep them in step when those change.
+
+import sys
+
+from database.db_connection import pooled_connection, get_backend
+from utils.log import configure_logging
+
+
+class HotQuery:
+    """A query that must not full-scan `tables` (table names or aliases)."""
+
+    def __init__(self, name, query, params, tables):
+        self.name = name
+        self.query = query
+        self.params = params
+        self.tables = tables
+
+
+HOT_QUERIES = [
+    # book_management.get_book_by_isbn
+    HotQuery('book by isbn', "SELECT * FROM books WHERE isbn = %s LIMIT 1",
+             ('9780000000000',), ['books']),
+    # bulk_import duplicate checks
+    HotQuery('books by isbn batch', "SELECT isbn FROM books WHERE isbn IN (%s, %s, %s)",
+             ('1', '2', '3'), ['books']),
+    HotQuery('members by email batch', "SELECT email FROM members WHERE email IN (%s, %s, %s)",
+             ('a@example.com', 'b@example.com', 'c@example.com'), ['members']),
+    # issue_return.return_book: the member's open loan of this book
+    HotQuery('open loan lookup', """
+        SELECT t.transaction_id, t.due_date, b.genre FROM transactions t
+        JOIN books b ON b.book_id = t.book_id
+        WHERE t.book_id = %s AND t.member_id = %s AND t.return_date IS NULL
+        ORDER BY t.transaction_id LIMIT 1
+        """, (1, 1), ['t', 'b']),
+    # issue_return.return_books: open loans for a whole cart
+    HotQuery('open loans for cart', """
+        SELECT t.transaction_id, t.book_id, t.member_id, t.due_date, b.genre FROM transactions t
+        JOIN books b ON b.book_id = t.book_id
+        WHERE t.return_date IS NULL AND t.book_id IN (%s, %s) AND t.member_id IN (%s, %s)
+        ORDER BY t.transaction_id
+        """, (1, 2, 1, 2), ['t', 'b']),
+    # reports: overdue loans by member
+    HotQuery('overdue scan', """
+        SELECT t.member_id, COUNT(*), MIN(t.due_date) FROM transactions t
+        WHERE t.return_date IS NULL AND t.due_date < %s
+        GROUP BY t.member_id
+        """, ('2000-01-01',), ['t']),
+    # issue_return: the next holds in a title's queue (every return)
+    HotQuery('hold queue', """
+        SELECT hold_id FROM holds WHERE book_id = %s AND status = 'waiting'
+        ORDER BY hold_id LIMIT %s
+        """, (1, 1), ['holds']),
+    # holds.member_holds: "my holds" with the place in each queue
+    HotQuery('member holds', """
+        SELECT h.hold_id, h.book_id, b.title, h.status,
+               CASE WHEN h.status = 'waiting' THEN
+                   (SELECT COUNT(*) FROM holds q
+                    WHERE q.book_id = h.book_id AND q.status = 'waiting' AND q.hold_id <= h.hold_id)
+               END AS position
+        FROM holds h JOIN books b ON b.book_id = h.book_id
+        WHERE h.member_id = %s AND h.status IN ('waiting', 'ready')
+        ORDER BY h.hold_id
+        """, (1,), ['h', 'q', 'b']),
+    # holds.sweep_holds: ready holds past their pickup date
+    HotQuery('expired holds', """
+        SELECT hold_id, book_id FROM holds WHERE status = 'ready' AND expires_date < %s
+        ORDER BY expires_date, hold_id LIMIT %s
+        """, ('2000-01-01', 500), ['holds']),
+    # circulation_counters.reconcile_counters: a batch of titles' loans and ready holds
+    HotQuery('loan counts for titles', """
+        SELECT book_id, COUNT(*),
+               SUM(CASE WHEN return_date IS NULL THEN 1 ELSE 0 END),
+               SUM(CASE WHEN return_date IS NULL AND due_date < %s THEN 1 ELSE 0 END)
+        FROM transactions WHERE book_id BETWEEN %s AND %s
+        GROUP BY book_id
+        """, ('2000-01-01', 1, 1000), ['transactions']),
+    HotQuery('ready holds for titles', """
+        SELECT book_id, COUNT(*) FROM holds
+        WHERE status = 'ready' AND book_id BETWEEN %s AND %s
+        GROUP BY book_id
+        """, (1, 1000), ['holds']),
+    # circulation_journal.replay_journal: which of a batch were replayed before
+    HotQuery('replayed journal operations',
+             "SELECT seq, outcome FROM journal_replays WHERE journal_id = %s AND seq IN (%s, %s, %s)",
+             ('3f2c', 1, 2, 3), ['journal_replays']),
+    # index_changes.ChangeFeed.refresh: one entity's changes since a time (before every search)
+    HotQuery('index changes since', """
+        SELECT change_id, entity_id, changed_at FROM index_changes
+        WHERE entity = %s AND changed_at >= %s
+        LIMIT %s
+        """, ('book', '2000-01-01 00:00:00', 10001), ['index_changes']),
+    # book_management._fetch_books / issue_return.issue_books
+    HotQuery('books by id batch', "SELECT * FROM books WHERE book_id IN (%s, %s, %s)",
+             (1, 2, 3), ['books']),
+]
+
+
+def _full_scans_sqlite(cursor, hot):
+    # Plan rows are (id, parent, notused, detail); a full scan reads "SCAN t"
+    # while an index lookup reads "SEARCH t USING INDEX ..."
+    cursor.execute("EXPLAIN QUERY PLAN " + hot.query, hot.params)
+    plan = [row[3] for row in cursor.fetchall()]
+    scanned = set()
+    for detail in plan:
+        words = detail.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and 'USING' not in words:
+            scanned.add(words[1])
+    return scanned, plan
+
+
+def _full_scans_mysql(cursor, hot):
+    # type ALL is MySQL's full table scan
+    cursor.execute("EXPLAIN " + hot.query, hot.params)
+    columns = [c.lower() for c in cursor.column_names]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    scanned = {row['table'] for row in rows if row.get('type') == 'ALL'}
+    plan = [f"{row['table']}: type={row.get('type')} key={row.get('key')}" for row in rows]
+    return scanned, plan
+
+
+def check_query_plans(verbose=False):
+    """Returns a list of problems: one line per hot query that full-scans a table."""
+    dialect = get_backend().name
+    full_scans = _full_scans_mysql if dialect == 'mysql' else _full_scans_sqlite
+    problems = []
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cursor = conn.cursor()
+        try:
+            for hot in HOT_QUERIES:
+                scanned, plan = full_scans(cursor, hot)
+                bad = sorted(scanned & set(hot.tables))
+                if verbose:
+                    print(f"{'FULL SCAN' if bad else 'ok':>9}  {hot.name}: {' | '.join(plan)}")
+                if bad:
+                    problems.append(f"{hot.name}: full scan of {', '.join(bad)}")
+        finally:
+            cursor.close()
+    return problems
+
+
+def main():
+    configure_logging()
+    try:
+        problems = check_query_plans(verbose=True)
+    except ConnectionError as e:
+        print(f"Query plan check failed: {e}")
+        return 1
+    if problems:
+        print("HOT QUERIES REGRESSED TO A FULL SCAN:")
+        for problem in problems:
+            print(f"  {problem}")
+        print("Run `python -m database.migrations` and check the indexes in database/migrations.py.")
+        return 1
+    print("All hot queries use an index.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,37 @@
 # This is 'main.py'
 # This is the entry point for the entire project.
+#
+#   python main.py                       # Normal start
+#   python main.py --profile             # Profile every button click, see ui/profiler.py
+#   python main.py --profile out/ --stall-ms 50
+#
+# Only the login window's code is imported up front; the backend loads in
+# the background while the user types (see ui/startup.py).
 
-from ui.main_menu import start_application
+from ui import startup  # First, so start-up timings count from here
+
+import argparse
+import sys
+
+from ui.login_window import start_application
+from ui import profiler as profiling
 
 if __name__ == "__main__":
-    start_application()
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Library Management System")
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help="Profile each user action and write the results to DIR (default: ./profile)")
+    parser.add_argument('--stall-ms', type=int, default=100,
+                        help="With --profile: report event-loop stalls longer than this")
+    parser.add_argument('--startup-probe', action='store_true',
+                        help="Print start-up timings as JSON and exit once the app is ready")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiling.enable(args.profile, stall_ms=args.stall_ms)
+    try:
+        start_application(probe=args.startup_probe)
+    finally:
+        summary = profiling.finish()
+        if summary:
+            print(summary, file=sys.stderr)
+            print(f"Profile written to {args.profile}/", file=sys.stderr)
@@ -0,0 +1,569 @@
+# This is 'modules/async_operations.py'
+#
+# Async versions of the book_management, member_management and
+# issue_return functions, for event-loop servers (api/http_service.py).
+# They have the same names, arguments and results, run the same queries,
+# and share the lookup cache and the search index, but they wait for the
+# database with `await`, on the async pool in database/async_db_connection.py.
+# One event loop can so keep as many queries in flight as that pool has
+# connections (ASYNC_POOL_CONFIG['max_size']), with no thread per query.
+#
+#   from modules import async_operations as library
+#   books = await library.search_book('gatsby')
+#   ok = await library.issue_book(book_id, member_id)
+
+import asyncio
+import datetime
+import random
+from collections import Counter
+
+from database.async_db_connection import async_pooled_connection, get_async_backend
+from modules import book_management as books
+from modules import issue_return as circulation
+from modules import member_management as members
+from modules.search_index import normalize_isbn
+from utils.cache import lookup_cache
+from utils.config import PAGE_SIZE
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+# --- Books ---
+
+async def _search_index():
+    """The catalog search index; built and refreshed (on a thread, from the regular pool) when needed."""
+    index, changes = books._search_index, books._search_changes
+    if index is None or changes is None or changes.due():
+        index = await asyncio.to_thread(books.get_search_index)
+    return index
+
+async def _book_by_exact_isbn(search_term):
+    """The book with exactly this ISBN, read from the table (see book_management.search_book), or None."""
+    isbn = search_term.strip()
+    generation = lookup_cache.generation
+    rows = await _fetch_all(books._BOOK_BY_EXACT_ISBN, (isbn, normalize_isbn(isbn)), "Could not look up book",
+                            isbn=isbn)
+    if not rows:
+        return None
+    lookup_cache.put(('book', rows[0]['book_id']), rows[0], if_generation=generation)
+    return dict(rows[0])
+
+@instrumented
+async def add_book(title, author, isbn, genre, quantity):
+    """Adds a new book to the books table."""
+    async with async_pooled_connection() as conn:
+        if not conn:
+            return False
+        cursor = await conn.cursor()
+        # A blank ISBN is stored as NULL: the unique ISBN index allows many NULLs but one ''
+        isbn = isbn.strip() or None if isbn else None
+        try:
+            await cursor.execute(books._INSERT_BOOK, (title, author, isbn, genre, quantity, quantity))
+            book_id = cursor.lastrowid
+            await conn.commit()
+            lookup_cache.invalidate(('isbn', normalize_isbn(isbn)), ('book', book_id))
+            books._sync_search_index('add', book_id, title=title, author=author, isbn=isbn, genre=genre)
+            log.info("Added book", book_id=book_id, title=title, author=author)
+            return True
+        except Exception as e:
+            log.error("Could not add book", title=title, isbn=isbn, error=str(e))
+            await conn.rollback()
+            return False
+        finally:
+            await cursor.close()
+
+@instrumented
+async def search_book(search_term):
+    """Searches for books by title, author, or ISBN (see book_management.search_book)."""
+    if books._looks_like_isbn(search_term):
+        book = await _book_by_exact_isbn(search_term)
+        if book is not None:
+            return [book]
+    index = await _search_index()
+    if index is None:
+        like_term = f"%{search_term}%"
+        return await _fetch_all(books._SCAN_SEARCH, (like_term, like_term, search_term), "Could not search books",
+                                term=search_term)
+    book_ids = index.search(search_term)
+    return await _fetch_books(book_ids) if book_ids else []
+
+@instrumented
+async def search_book_page(search_term, after=None, limit=PAGE_SIZE):
+    """Returns one page of search_book results as (rows, next_cursor)."""
+    if after is None and books._looks_like_isbn(search_term):
+        book = await _book_by_exact_isbn(search_term)
+        if book is not None:
+            return [book], None
+    index = await _search_index()
+    if index is None:
+        like_term = f"%{search_term}%"
+        rows = await _fetch_all(books._SCAN_SEARCH_PAGE, (like_term, like_term, search_term, after or 0, limit + 1),
+                                "Could not search books", term=search_term)
+        return rows[:limit], rows[limit - 1]['book_id'] if len(rows) > limit else None
+
+    book_ids, next_cursor = index.search_page(search_term, after, limit)
+    if not book_ids:
+        return [], None
+    return await _fetch_books(book_ids), next_cursor
+
+@instrumented
+async def get_book(book_id):
+    """Returns one book by its book_id (from the cache when possible), or None."""
+    rows = await _fetch_books([book_id])
+    return rows[0] if rows else None
+
+@instrumented
+async def get_book_by_isbn(isbn):
+    """Returns the book with this ISBN (from the cache when possible), or None."""
+    key = ('isbn', normalize_isbn(isbn))
+    book_id = lookup_cache.get(key)
+    if book_id is not None:
+        book = await get_book(book_id)
+        if book is not None:
+            return book
+
+    generation = lookup_cache.generation
+    rows = await _fetch_all(books._BOOK_BY_ISBN, (isbn,), "Could not look up book", isbn=isbn)
+    if not rows:
+        return None
+    row = rows[0]
+    lookup_cache.put(('book', row['book_id']), row, if_generation=generation)
+    lookup_cache.put(key, row['book_id'], if_generation=generation)
+    return dict(row)
+
+async def _fetch_books(book_ids):
+    """Reads books by primary key in the order of book_ids, through the lookup cache."""
+    cached = lookup_cache.get_many(('book', book_id) for book_id in book_ids)
+    rows_by_id = {key[1]: row for key, row in cached.items()}
+    missing = [book_id for book_id in dict.fromkeys(book_ids) if book_id not in rows_by_id]
+
+    if missing:
+        generation = lookup_cache.generation
+        async with async_pooled_connection() as conn:
+            if not conn:
+                return []
+            cursor = await conn.cursor(dictionary=True)
+            try:
+                for start in range(0, len(missing), books._FETCH_CHUNK):
+                    chunk = missing[start:start + books._FETCH_CHUNK]
+                    await cursor.execute(books._BOOKS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))),
+                                         tuple(chunk))
+                    for row in await cursor.fetchall():
+                        rows_by_id[row['book_id']] = row
+                        lookup_cache.put(('book', row['book_id']), row, if_generation=generation)
+            except Exception as e:
+                log.error("Could not read books", count=len(missing), error=str(e))
+                return []
+            finally:
+                await cursor.close()
+
+    # Copies so callers can't alter cached rows
+    return [dict(rows_by_id[book_id]) for book_id in book_ids if book_id in rows_by_id]
+
+async def _fetch_all(query, params, error_message, **context):
+    """Runs one read-only query; returns its rows as dicts ([] on error)."""
+    async with async_pooled_connection() as conn:
+        if not conn:
+            return []
+        cursor = await conn.cursor(dictionary=True)
+        try:
+            await cursor.execute(query, params)
+            return list(await cursor.fetchall())
+        except Exception as e:
+            log.error(error_message, error=str(e), **context)
+            return []
+        finally:
+            await cursor.close()
+
+async def _write_one(query, params, error_message, **context):
+    """Runs one write and commits it; returns its rowcount, or None on error."""
+    async with async_pooled_connection() as conn:
+        if not conn:
+            return None
+        cursor = await conn.cursor()
+        try:
+            await cursor.execute(query, params)
+            await conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            log.error(error_message, error=str(e), **context)
+            await conn.rollback()
+            return None
+        finally:
+            await cursor.close()
+
+@instrumented
+async def update_book_details(book_id, new_title, new_author, new_quantity):
+    """Updates a book's details based on its book_id."""
+    rowcount = await _write_one(books._UPDATE_BOOK,
+                                (new_title, new_author, new_quantity, new_quantity, book_id, new_quantity),
+                                "Could not update book", book_id=book_id)
+    if rowcount is None:
+        return False
+    lookup_cache.invalidate(('book', book_id))
+    if rowcount == 0:
+        rows = await _fetch_all(books._COPIES_OUT, (book_id,), "Could not look up book", book_id=book_id)
+        books._log_refused_update(book_id, new_quantity, tuple(rows[0].values()) if rows else None)
+        return False
+    books._sync_search_index('update', book_id, title=new_title, author=new_author)
+    log.info("Updated book", book_id=book_id)
+    return True
+
+@instrumented
+async def remove_book(book_id):
+    """Removes a book from the database using its book_id."""
+    # Usually fails for a book that is still issued to a member (foreign key)
+    rowcount = await _write_one(books._DELETE_BOOK, (book_id,), "Could not remove book", book_id=book_id)
+    if rowcount is None:
+        return False
+    lookup_cache.invalidate(('book', book_id))
+    if rowcount == 0:
+        log.warning("No book to remove", book_id=book_id)
+        return False
+    books._sync_search_index('remove', book_id)
+    log.info("Removed book", book_id=book_id)
+    return True
+
+# --- Members ---
+
+@instrumented
+async def register_member(name, email, phone_number):
+    """Registers a new member in the members table."""
+    async with async_pooled_connection() as conn:
+        if not conn:
+            return False
+        cursor = await conn.cursor()
+        try:
+            await cursor.execute(members._INSERT_MEMBER, (name, email, phone_number, datetime.date.today()))
+            member_id = cursor.lastrowid
+            await conn.commit()
+            lookup_cache.invalidate(('member', member_id))
+            members._sync_member_index('add', member_id, name=name, email=email, phone_number=phone_number)
+            log.info("Registered member", member_id=member_id, name=name, email=email)
+            return True
+        except Exception as e:
+            log.error("Could not register member", email=email, error=str(e))
+            await conn.rollback()
+            return False
+        finally:
+            await cursor.close()
+
+@instrumented
+async def update_member(member_id, name, email, phone_number):
+    """Changes a member's name, email and phone number."""
+    rowcount = await _write_one(members._UPDATE_MEMBER, (name, email, phone_number, member_id),
+                                "Could not update member", member_id=member_id)
+    if rowcount is None:
+        return False
+    lookup_cache.invalidate(('member', member_id))
+    if rowcount == 0:
+        log.warning("No member to update", member_id=member_id)
+        return False
+    members._sync_member_index('update', member_id, name=name, email=email, phone_number=phone_number)
+    log.info("Updated member", member_id=member_id)
+    return True
+
+async def _member_index():
+    """The member lookup index; built and refreshed (on a thread, from the regular pool) when needed."""
+    index, changes = members._member_index, members._member_changes
+    if index is None or changes is None or changes.due():
+        index = await asyncio.to_thread(members.get_member_index)
+    return index
+
+@instrumented
+async def view_member_details(search_term):
+    """Searches for a member by name, email or phone number (see member_management)."""
+    index = await _member_index()
+    if index is not None:
+        member_ids = index.search(search_term)
+        return await _fetch_members(member_ids) if member_ids else []
+
+    like_term = f"%{search_term}%"
+    generation = lookup_cache.generation
+    results = await _fetch_all(members._SEARCH_MEMBERS, (like_term, like_term), "Could not search members",
+                               term=search_term)
+    # Members just searched for are usually looked up next
+    for row in results:
+        lookup_cache.put(('member', row['member_id']), dict(row), if_generation=generation)
+    return results
+
+async def _fetch_members(member_ids):
+    """Reads members by primary key in the order of member_ids, through the lookup cache."""
+    cached = lookup_cache.get_many(('member', member_id) for member_id in member_ids)
+    rows_by_id = {key[1]: row for key, row in cached.items()}
+    missing = [member_id for member_id in dict.fromkeys(member_ids) if member_id not in rows_by_id]
+
+    if missing:
+        generation = lookup_cache.generation
+        for start in range(0, len(missing), members._FETCH_CHUNK):
+            chunk = missing[start:start + members._FETCH_CHUNK]
+            rows = await _fetch_all(members._MEMBERS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))),
+                                    tuple(chunk), "Could not read members", count=len(chunk))
+            for row in rows:
+                rows_by_id[row['member_id']] = row
+                lookup_cache.put(('member', row['member_id']), row, if_generation=generation)
+
+    return [dict(rows_by_id[member_id]) for member_id in member_ids if member_id in rows_by_id]
+
+@instrumented
+async def get_member(member_id):
+    """Returns one member by member_id (from the cache when possible), or None."""
+    key = ('member', member_id)
+    member = lookup_cache.get(key)
+    if member is not None:
+        return dict(member)
+    generation = lookup_cache.generation
+    rows = await _fetch_all(members._MEMBER_BY_ID, (member_id,), "Could not look up member", member_id=member_id)
+    if not rows:
+        return None
+    lookup_cache.put(key, rows[0], if_generation=generation)
+    return dict(rows[0])
+
+@instrumented
+async def view_member_details_page(search_term, after=None, limit=PAGE_SIZE):
+    """Returns one page of view_member_details results as (rows, next_cursor)."""
+    index = await _member_index()
+    if index is not None:
+        member_ids, next_cursor = index.search_page(search_term, after, limit)
+        return (await _fetch_members(member_ids), next_cursor) if member_ids else ([], None)
+
+    like_term = f"%{search_term}%"
+    rows = await _fetch_all(members._SEARCH_MEMBERS_PAGE, (like_term, like_term, after or 0, limit + 1),
+                            "Could not search members", term=search_term)
+    return rows[:limit], rows[limit - 1]['member_id'] if len(rows) > limit else None
+
+# --- Issue and return ---
+
+async def _run_transaction(description, work, on_error):
+    """Runs `await work(conn, cursor)` on a pooled connection, retrying on
+    conflicts and on a connection lost before the commit, and reporting
+    one lost during it, like issue_return._run_transaction. The backoff
+    between attempts is an asyncio.sleep, so other requests keep running."""
+    backend = get_async_backend()
+    circulation._count('transactions')
+    for attempt in range(1, circulation.MAX_ATTEMPTS + 1):
+        async with async_pooled_connection() as pooled:
+            if not pooled:
+                circulation._count('failures')
+                return on_error(ConnectionError("Database connection failed."))
+            conn = circulation._Committing(pooled)  # Its commit() returns the awaitable
+            cursor = await conn.cursor()
+            disconnected = False
+            try:
+                return await work(conn, cursor)
+            except Exception as e:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    pass  # The connection is gone; the pool discards it on checkin
+                disconnected = backend.is_disconnect(e)
+                if disconnected and conn.commit_started:
+                    circulation._count('failures')
+                    log.error("Lost the database connection during commit", action=description, error=str(e))
+                    return on_error(circulation._CommitUnknown(f"Lost the database connection while saving: {e}"))
+                if isinstance(e, circulation._Conflict):
+                    circulation._count('conflicts')
+                elif backend.is_retryable(e):
+                    circulation._count('lock_errors')
+                elif disconnected:
+                    circulation._count('disconnects')
+                else:
+                    circulation._count('failures')
+                    log.error("Transaction failed", action=description, error=str(e))
+                    return on_error(e)
+                if attempt == circulation.MAX_ATTEMPTS:
+                    circulation._count('failures')
+                    log.error("Transaction gave up after retries", action=description,
+                              attempts=attempt, error=str(e))
+                    return on_error(ConnectionError(f"Lost the database connection: {e}") if disconnected else e)
+                log.debug("Retrying transaction", action=description, attempt=attempt, error=str(e))
+                circulation._count('retries')
+            finally:
+                if not disconnected:
+                    await cursor.close()
+        await asyncio.sleep(random.uniform(0, circulation.RETRY_BACKOFF * 2 ** attempt))
+
+@instrumented
+async def issue_book(book_id, member_id, on_refused=None):
+    """Issues a book to a member and creates a transaction record.
+
+    If the member or book doesn't exist or no copy is free, returns
+    on_refused(reason) (default False), as issue_return._issue_book does.
+    """
+    issue_date = datetime.date.today()
+    due_date = issue_date + datetime.timedelta(days=circulation.LOAN_DAYS)
+    refused = on_refused or (lambda reason: False)
+
+    async def work(conn, cursor):
+        await cursor.execute(circulation._MEMBER_EXISTS, (member_id,))
+        if await cursor.fetchone() is None:
+            log.warning("No such member to issue to", book_id=book_id, member_id=member_id)
+            return refused(circulation.NO_SUCH_MEMBER)
+        # The copy set aside for the member's hold, else one from the shelf
+        await cursor.execute(circulation._CLAIM_HOLD, (issue_date, book_id, member_id))
+        if cursor.rowcount:
+            await cursor.execute(circulation._LEND_HELD_COPIES, (1, 1, 1, book_id))
+        else:
+            await cursor.execute(circulation._TAKE_COPY, (book_id,))
+            if cursor.rowcount == 0:
+                await cursor.execute(circulation._BOOK_EXISTS, (book_id,))
+                reason = circulation.NO_COPY if await cursor.fetchone() else circulation.NO_SUCH_BOOK
+                log.warning("Book not available for issue", book_id=book_id, member_id=member_id, reason=reason)
+                return refused(reason)
+        await cursor.execute(circulation._INSERT_LOAN, (book_id, member_id, issue_date, due_date))
+        await conn.commit()
+        lookup_cache.invalidate(('book', book_id))  # Its counters changed
+        log.info("Issued book", book_id=book_id, member_id=member_id, due_date=due_date)
+        return True
+
+    return await _run_transaction("book issue", work, on_error=lambda e: False)
+
+@instrumented
+async def return_book(book_id, member_id):
+    """Returns a book, marks the transaction complete, and calculates fine."""
+
+    async def work(conn, cursor):
+        await cursor.execute(circulation._FIND_OPEN_LOAN, (book_id, member_id))
+        trans = await cursor.fetchone()
+        if not trans:
+            log.warning("No open loan to return", book_id=book_id, member_id=member_id)
+            return False
+        transaction_id, due_date, genre = trans[0], trans[1], trans[2]
+        today = datetime.date.today()
+        fine = circulation.calculate_fine(due_date, today, genre)
+        await cursor.execute(circulation._CLOSE_LOAN, (today, fine, transaction_id))
+        if cursor.rowcount == 0:
+            raise circulation._Conflict(f"transaction {transaction_id} was closed concurrently")
+        shelved = await _allocate_copies(cursor, book_id, 1, today)
+        await cursor.execute(circulation._RETURN_COPY, (shelved, 1 - shelved, due_date, book_id))
+        await conn.commit()
+        lookup_cache.invalidate(('book', book_id))
+        log.info("Returned book", book_id=book_id, member_id=member_id, fine=fine)
+        return True
+
+    return await _run_transaction("book return", work, on_error=lambda e: False)
+
+async def _allocate_copies(cursor, book_id, copies, today):
+    """Sets copies aside for the oldest waiting holds; see issue_return._allocate_copies."""
+    await cursor.execute(circulation._NEXT_HOLDS, (book_id, copies))
+    ready = circulation._ready_rows(await cursor.fetchall(), today)
+    if ready:
+        await cursor.executemany(circulation._MAKE_READY, ready)
+        if cursor.rowcount != len(ready):
+            raise circulation._Conflict("a hold was cancelled while copies were set aside")
+        log.info("Set copies aside for holds", book_id=book_id, holds=len(ready))
+    return copies - len(ready)
+
+@instrumented
+async def issue_books(member_id, book_ids):
+    """Issues a whole cart of books to one member in a single transaction
+    (see issue_return.issue_books for the results)."""
+    issue_date = datetime.date.today()
+    due_date = issue_date + datetime.timedelta(days=circulation.LOAN_DAYS)
+    book_ids = list(book_ids)
+    if not book_ids:
+        return []
+
+    async def work(conn, cursor):
+        distinct_ids = list(dict.fromkeys(book_ids))
+        await cursor.execute(circulation._AVAILABILITY.format(books=circulation._in_list(distinct_ids)),
+                             tuple(distinct_ids))
+        available = dict(await cursor.fetchall())
+        await cursor.execute(circulation._READY_HOLDS.format(books=circulation._in_list(distinct_ids)),
+                             (member_id,) + tuple(distinct_ids))
+        held = circulation._held_by_title(await cursor.fetchall())
+        results, taken, collected = circulation._plan_issue(book_ids, available, due_date, held)
+        lent = Counter(book_id for _, book_id in collected)
+        if collected:
+            await cursor.executemany(circulation._FULFIL_HOLD, [(issue_date, hold_id) for hold_id, _ in collected])
+            if cursor.rowcount != len(collected):
+                raise circulation._Conflict("a hold changed during batch issue")
+            await cursor.executemany(circulation._LEND_HELD_COPIES,
+                                     [(n, n, n, book_id) for book_id, n in lent.items()])
+        if taken:
+            await cursor.executemany(circulation._TAKE_COPIES,
+                                     [(n, n, n, book_id, n) for book_id, n in taken.items()])
+            if cursor.rowcount != len(taken):
+                raise circulation._Conflict("availability changed during batch issue")
+        if taken or collected:
+            await cursor.executemany(circulation._INSERT_LOAN, [(r['book_id'], member_id, issue_date, due_date)
+                                                                for r in results if r['success']])
+            await conn.commit()
+            lookup_cache.invalidate(*[('book', book_id) for book_id in taken.keys() | lent.keys()])
+        log.info("Issued books", member_id=member_id, issued=sum(taken.values()) + len(collected),
+                 requested=len(book_ids))
+        return results
+
+    return await _run_transaction(
+        "batch issue", work,
+        on_error=lambda e: [{'book_id': b, 'success': False, 'message': f"Error: {e}"} for b in book_ids])
+
+@instrumented
+async def return_books(items):
+    """Returns a cart of (book_id, member_id) pairs in a single transaction
+    (see issue_return.return_books for the results)."""
+    items = list(items)
+    if not items:
+        return []
+    today = datetime.date.today()
+
+    async def work(conn, cursor):
+        book_ids = list({b for b, _ in items})
+        member_ids = list({m for _, m in items})
+        await cursor.execute(circulation._OPEN_LOANS.format(books=circulation._in_list(book_ids),
+                                                            members=circulation._in_list(member_ids)),
+                             tuple(book_ids) + tuple(member_ids))
+        results, closed, returned = circulation._plan_return(items, await cursor.fetchall(), today)
+        if closed:
+            await cursor.executemany(circulation._CLOSE_LOAN, closed)
+            if cursor.rowcount != len(closed):
+                raise circulation._Conflict("a loan was closed concurrently during batch return")
+            rows = []
+            for book_id, due_dates in returned.items():
+                shelved = await _allocate_copies(cursor, book_id, len(due_dates), today)
+                rows.extend(circulation._return_rows(book_id, due_dates, shelved))
+            await cursor.executemany(circulation._RETURN_COPY, rows)
+            await conn.commit()
+            lookup_cache.invalidate(*[('book', book_id) for book_id in returned])
+        log.info("Returned books", returned=len(closed), requested=len(items))
+        return results
+
+    return await _run_transaction(
+        "batch return", work,
+        on_error=lambda e: [circulation._failed_return(b, m, f"Error: {e}") for b, m in items])
+
+# --- Test block ---
+if __name__ == '__main__':
+    configure_logging()
+    from database.async_db_connection import close_async_pool
+
+    async def demo():
+        print("--- Testing the async backend functions ---")
+        await add_book('Async Test Book', 'Test Author', '978000000001', 'Test', 2)
+        await register_member('Async Tester', 'async@example.com', '5550001')
+        book = (await search_book('978000000001'))[0]
+        member = (await view_member_details('async@example.com'))[0]
+        print(f"  > Book ID {book['book_id']}, member ID {member['member_id']}")
+        await update_member(member['member_id'], 'Async Tester', 'async@example.com', '555-000-1234')
+        print(f"  > Found by phone after update: {[m['name'] for m in await view_member_details('5550001234')]}")
+
+        # Many calls at once, all on one thread
+        issued = await asyncio.gather(*[issue_book(book['book_id'], member['member_id']) for _ in range(5)])
+        print(f"  > 5 concurrent issues of a 2-copy book: {issued.count(True)} succeeded")  # Should be 2
+        returned = await return_books([(book['book_id'], member['member_id'])] * 2)
+        print(f"  > Batch return: {[r['message'] for r in returned]}")
+        print(f"  > Available again: {(await get_book(book['book_id']))['available_quantity']}")  # Should be 2
+
+        await circulation_cleanup(book['book_id'])
+        await close_async_pool()
+
+    async def circulation_cleanup(book_id):
+        async with async_pooled_connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute("DELETE FROM transactions WHERE book_id = %s", (book_id,))
+            await conn.commit()
+            await cursor.close()
+        print(f"  > Removed test book: {await remove_book(book_id)}")
+
+    asyncio.run(demo())
@@ -1,132 +1,467 @@
 # This is 'modules/book_management.py'
 
-from database.db_connection import create_connection, close_connection
+import re
+import threading
 
-def add_book(title, author, isbn, genre, quantity):
-    """Adds a new book to the books table."""
-    conn = create_connection()
-    if not conn:
-        return False
-        
-    cursor = conn.cursor()
-    
-    # We set available_quantity to be the same as total quantity initially
-    query = """
-    INSERT INTO books (title, author, isbn, genre, quantity, available_quantity) 
-    VALUES (%s, %s, %s, %s, %s, %s)
+from database.db_connection import pooled_connection
+from modules.index_changes import ChangeFeed
+from modules.search_index import BookSearchIndex, normalize_isbn
+from utils.cache import lookup_cache
+from utils.config import PAGE_SIZE
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+# The search index is built from the books table on the first search and
+# then kept in sync by add_book, update_book_details and remove_book, and
+# with the changes other programs make through index_changes (see
+# modules/index_changes.py), which it looks at before a search.
+_search_index = None
+_search_changes = None  # The index's ChangeFeed
+_search_index_lock = threading.Lock()
+_search_refresh_lock = threading.Lock()
+_FETCH_CHUNK = 500  # book_ids per "WHERE book_id IN (...)" query
+
+# The queries, shared with the async versions in modules/async_operations.py
+
+# We set available_quantity to be the same as total quantity initially
+_INSERT_BOOK = """
+INSERT INTO books (title, author, isbn, genre, quantity, available_quantity) 
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+_BOOKS_BY_ID = "SELECT * FROM books WHERE book_id IN ({placeholders})"
+_INDEXED_BOOKS_BY_ID = "SELECT book_id, title, author, isbn, genre FROM books WHERE book_id IN ({placeholders})"
+_BOOK_BY_ISBN = "SELECT * FROM books WHERE isbn = %s LIMIT 1"
+_BOOK_BY_EXACT_ISBN = "SELECT * FROM books WHERE isbn IN (%s, %s) LIMIT 1"  # As typed, or without hyphens
+_ISBN_RE = re.compile(r"[0-9][0-9 -]{8,15}[0-9Xx]")
+
+# Using LIKE with % allows for partial matches
+_SCAN_SEARCH = """
+SELECT * FROM books 
+WHERE title LIKE %s OR author LIKE %s OR isbn = %s
+"""
+_SCAN_SEARCH_PAGE = """
+SELECT * FROM books 
+WHERE (title LIKE %s OR author LIKE %s OR isbn = %s) AND book_id > %s
+ORDER BY book_id
+LIMIT %s
+"""
+
+# This query is more complex, it needs to update available_quantity too.
+# available_quantity is assigned first: MySQL applies SET left to right,
+# so after quantity it would see the new quantity and not change at all.
+_UPDATE_BOOK = """
+UPDATE books 
+SET title = %s, 
+    author = %s, 
+    available_quantity = available_quantity + (%s - quantity), -- Adjust available count
+    quantity = %s
+WHERE book_id = %s
+  AND %s >= on_loan + held_copies -- Never fewer copies than are out on loan or set aside
+"""
+_COPIES_OUT = "SELECT on_loan, held_copies FROM books WHERE book_id = %s"
+_DELETE_BOOK = "DELETE FROM books WHERE book_id = %s"
+
+def get_search_index():
+    """Returns the catalog search index, building it on first use.
+
+    At most every REFRESH_SECONDS it first applies the books other
+    programs have added, changed or removed since (modules/index_changes.py).
     """
+    global _search_index, _search_changes
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index, _search_changes = _build_search_index()
+    else:
+        changes = _search_changes
+        if changes is not None and changes.due():
+            _refresh_search_index()
+    return _search_index
+
+def reset_search_index():
+    """Drops the index so the next search rebuilds it (e.g. after set_backend)."""
+    global _search_index, _search_changes
+    with _search_index_lock:
+        _search_index = _search_changes = None
+
+def _build_search_index():
+    """Returns (index, its ChangeFeed), or (None, None) if the books can't be read."""
+    with pooled_connection() as conn:
+        if not conn:
+            return None, None
+        cursor = conn.cursor(dictionary=True)
+        try:
+            # Start the feed first: whatever changes during the scan is applied again later
+            changes = ChangeFeed.before_full_read(conn, 'book')
+            index = BookSearchIndex()
+            cursor.execute("SELECT book_id, title, author, isbn, genre FROM books")
+            index.add_many(_stream_rows(cursor))
+            return index, changes
+        except Exception as e:
+            log.error("Could not build the search index", error=str(e))
+            return None, None
+        finally:
+            cursor.close()
+
+def _refresh_search_index():
+    """Applies the changes made by other programs; one thread at a time, the others don't wait."""
+    global _search_index, _search_changes
+    if not _search_refresh_lock.acquire(blocking=False):
+        return
     try:
-        cursor.execute(query, (title, author, isbn, genre, quantity, quantity))
-        conn.commit()  # commit() is needed to save changes
-        print(f"Success: Added '{title}' by {author}.")
-        return True
-    except Exception as e:
-        print(f"Error adding book: {e}")
-        conn.rollback() # Rollback changes on error
-        return False
+        index, changes = _search_index, _search_changes
+        if index is None or not changes.due():
+            return
+        with pooled_connection() as conn:
+            if not conn:
+                changes.postpone()
+                return
+            try:
+                if changes.refresh(conn, lambda book_ids: _apply_book_changes(conn, index, book_ids)):
+                    return
+            except Exception as e:
+                log.warning("Could not refresh the search index", error=str(e))
+                return
+        # Too far behind: build a new index and swap it in
+        index, changes = _build_search_index()
+        if index is not None:
+            with _search_index_lock:
+                _search_index, _search_changes = index, changes
+    finally:
+        _search_refresh_lock.release()
+
+def _apply_book_changes(conn, index, book_ids):
+    """Re-reads the changed books into the index; the ones no longer there are removed."""
+    book_ids = list(book_ids)
+    found = set()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for start in range(0, len(book_ids), _FETCH_CHUNK):
+            chunk = book_ids[start:start + _FETCH_CHUNK]
+            cursor.execute(_INDEXED_BOOKS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))), tuple(chunk))
+            for row in cursor.fetchall():
+                index.add(row)
+                found.add(row['book_id'])
     finally:
         cursor.close()
-        close_connection(conn)
+    for book_id in book_ids:
+        if book_id not in found:
+            index.remove(book_id)
+    lookup_cache.invalidate(*[('book', book_id) for book_id in book_ids])
+    log.debug("Applied book changes to the search index", books=len(book_ids))
+
+def _stream_rows(cursor):
+    """Yields rows from an executed cursor without fetching them all at once."""
+    rows = cursor.fetchmany(_FETCH_CHUNK)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(_FETCH_CHUNK)
+
+def _sync_search_index(action, book_id, **fields):
+    """Applies a committed change to the index, if it has been built."""
+    with _search_index_lock:  # Waits for a build in progress to finish
+        index = _search_index
+    if index is None:
+        return
+    if action == 'add':
+        index.add(dict(fields, book_id=book_id))
+    elif action == 'update':
+        index.update(book_id, **fields)
+    elif action == 'remove':
+        index.remove(book_id)
 
+@instrumented
+def add_book(title, author, isbn, genre, quantity):
+    """Adds a new book to the books table."""
+    with pooled_connection() as conn:
+        if not conn:
+            return False
+        
+        cursor = conn.cursor()
+    
+        # A blank ISBN is stored as NULL: the unique ISBN index allows many NULLs but one ''
+        isbn = isbn.strip() or None if isbn else None
+
+        try:
+            cursor.execute(_INSERT_BOOK, (title, author, isbn, genre, quantity, quantity))
+            book_id = cursor.lastrowid
+            conn.commit()  # commit() is needed to save changes
+            lookup_cache.invalidate(('isbn', normalize_isbn(isbn)), ('book', book_id))
+            _sync_search_index('add', book_id, title=title, author=author, isbn=isbn, genre=genre)
+            log.info("Added book", book_id=book_id, title=title, author=author)
+            return True
+        except Exception as e:
+            log.error("Could not add book", title=title, isbn=isbn, error=str(e))
+            conn.rollback() # Rollback changes on error
+            return False
+        finally:
+            cursor.close()
+
+@instrumented
 def search_book(search_term):
-    """Searches for books by title, author, or ISBN."""
-    conn = create_connection()
-    if not conn:
+    """Searches for books by title, author, or ISBN.
+
+    An ISBN is looked up in the books table itself. Anything else is
+    matched and ranked in the in-memory search index (whole words and word
+    prefixes, accents and case ignored), and the rows are then read by
+    primary key through the lookup cache, so their quantities may be up to
+    CACHE_CONFIG['ttl'] seconds old.
+    """
+    if _looks_like_isbn(search_term):
+        book = _read_book_by_exact_isbn(search_term)
+        if book is not None:
+            return [book]
+
+    index = get_search_index()
+    if index is None:
+        return _search_book_by_scan(search_term)
+
+    book_ids = index.search(search_term)
+    if not book_ids:
+        log.debug("No books found", term=search_term)
         return []
+    return _fetch_books(book_ids)
+
+@instrumented
+def search_book_page(search_term, after=None, limit=PAGE_SIZE):
+    """Returns one page of search_book results as (rows, next_cursor).
+
+    Pass next_cursor back as `after` to get the following page; it is None
+    on the last page. Only `limit` rows are ever read from the database.
+    """
+    if after is None and _looks_like_isbn(search_term):
+        book = _read_book_by_exact_isbn(search_term)
+        if book is not None:
+            return [book], None
+
+    index = get_search_index()
+    if index is None:
+        return _search_book_page_by_scan(search_term, after, limit)
+
+    book_ids, next_cursor = index.search_page(search_term, after, limit)
+    if not book_ids:
+        return [], None
+    return _fetch_books(book_ids), next_cursor
+
+@instrumented
+def get_book(book_id):
+    """Returns one book by its book_id (from the cache when possible), or None."""
+    rows = _fetch_books([book_id])
+    return rows[0] if rows else None
+
+@instrumented
+def get_book_by_isbn(isbn):
+    """Returns the book with this ISBN (from the cache when possible), or None."""
+    key = ('isbn', normalize_isbn(isbn))
+    book_id = lookup_cache.get(key)
+    if book_id is not None:
+        book = get_book(book_id)
+        if book is not None:
+            return book
+
+    generation = lookup_cache.generation
+    with pooled_connection() as conn:
+        if not conn:
+            return None
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(_BOOK_BY_ISBN, (isbn,))
+            row = cursor.fetchone()
+        except Exception as e:
+            log.error("Could not look up book", isbn=isbn, error=str(e))
+            return None
+        finally:
+            cursor.close()
+    if row is None:
+        return None
+    lookup_cache.put(('book', row['book_id']), row, if_generation=generation)
+    lookup_cache.put(key, row['book_id'], if_generation=generation)
+    return dict(row)
+
+def _looks_like_isbn(search_term):
+    term = search_term.strip()
+    return bool(_ISBN_RE.fullmatch(term)) and len(normalize_isbn(term)) in (10, 13)
+
+def _read_book_by_exact_isbn(isbn):
+    """Reads the book with exactly this ISBN straight from the table, or None."""
+    isbn = isbn.strip()
+    generation = lookup_cache.generation
+    with pooled_connection() as conn:
+        if not conn:
+            return None
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(_BOOK_BY_EXACT_ISBN, (isbn, normalize_isbn(isbn)))
+            row = cursor.fetchone()
+        except Exception as e:
+            log.error("Could not look up book", isbn=isbn, error=str(e))
+            return None
+        finally:
+            cursor.close()
+    if row is None:
+        return None
+    lookup_cache.put(('book', row['book_id']), row, if_generation=generation)
+    return dict(row)
+
+def _fetch_books(book_ids):
+    """Reads books by primary key, returned in the order of book_ids.
+
+    Rows come from the lookup cache when present; only the misses are read
+    from the database (in one IN query per chunk) and then cached.
+    """
+    cached = lookup_cache.get_many(('book', book_id) for book_id in book_ids)
+    rows_by_id = {key[1]: row for key, row in cached.items()}
+    missing = [book_id for book_id in dict.fromkeys(book_ids) if book_id not in rows_by_id]
+
+    if missing:
+        generation = lookup_cache.generation
+        with pooled_connection() as conn:
+            if not conn:
+                return []
+        
+            cursor = conn.cursor(dictionary=True) # dictionary=True gives us results as dicts
+            try:
+                for start in range(0, len(missing), _FETCH_CHUNK):
+                    chunk = missing[start:start + _FETCH_CHUNK]
+                    cursor.execute(_BOOKS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))), tuple(chunk))
+                    for row in cursor.fetchall():
+                        rows_by_id[row['book_id']] = row
+                        lookup_cache.put(('book', row['book_id']), row, if_generation=generation)
+        
+            except Exception as e:
+                log.error("Could not read books", count=len(missing), error=str(e))
+                return [] # Return empty list on error
+            finally:
+                cursor.close()
+
+    # Keep the index's ranking order; copies so callers can't alter cached rows
+    return [dict(rows_by_id[book_id]) for book_id in book_ids if book_id in rows_by_id]
+
+def _search_book_by_scan(search_term):
+    """The old LIKE search, used only if the index could not be built."""
+    with pooled_connection() as conn:
+        if not conn:
+            return []
         
-    cursor = conn.cursor(dictionary=True) # dictionary=True gives us results as dicts
+        cursor = conn.cursor(dictionary=True)
     
-    # Using LIKE with % allows for partial matches
-    query = """
-    SELECT * FROM books 
-    WHERE title LIKE %s OR author LIKE %s OR isbn = %s
-    """
-    # We add '%' wildcards to the search term
-    like_term = f"%{search_term}%"
+        # We add '%' wildcards to the search term
+        like_term = f"%{search_term}%"
     
-    try:
-        cursor.execute(query, (like_term, like_term, search_term))
-        results = cursor.fetchall()
+        try:
+            cursor.execute(_SCAN_SEARCH, (like_term, like_term, search_term))
+            results = cursor.fetchall()
         
-        if not results:
-            print("No books found matching that criteria.")
+            if not results:
+                log.debug("No books found", term=search_term)
         
-        return results # Returns a list of dictionaries
+            return results # Returns a list of dictionaries
         
-    except Exception as e:
-        print(f"Error searching for book: {e}")
-        return [] # Return empty list on error
-    finally:
-        cursor.close()
-        close_connection(conn)
+        except Exception as e:
+            log.error("Could not search books", term=search_term, error=str(e))
+            return [] # Return empty list on error
+        finally:
+            cursor.close()
 
+def _search_book_page_by_scan(search_term, after, limit):
+    """Keyset-paginated LIKE search (by book_id), used only without the index."""
+    with pooled_connection() as conn:
+        if not conn:
+            return [], None
+        
+        cursor = conn.cursor(dictionary=True)
+        like_term = f"%{search_term}%"
+    
+        try:
+            # Ask for one extra row to know whether there is another page
+            cursor.execute(_SCAN_SEARCH_PAGE, (like_term, like_term, search_term, after or 0, limit + 1))
+            rows = cursor.fetchall()
+            next_cursor = rows[limit - 1]['book_id'] if len(rows) > limit else None
+            return rows[:limit], next_cursor
+        except Exception as e:
+            log.error("Could not search books", term=search_term, error=str(e))
+            return [], None
+        finally:
+            cursor.close()
+
+@instrumented
 def update_book_details(book_id, new_title, new_author, new_quantity):
-    """Updates a book's details based on its book_id."""
-    conn = create_connection()
-    if not conn:
-        return False
+    """Updates a book's details based on its book_id.
 
-    cursor = conn.cursor()
-    
-    # This query is more complex, it needs to update available_quantity too
-    query = """
-    UPDATE books 
-    SET title = %s, 
-        author = %s, 
-        quantity = %s,
-        available_quantity = available_quantity + (%s - quantity) -- Adjust available count
-    WHERE book_id = %s
+    The quantity can't go below the copies out on loan or set aside for
+    holds; such an update is refused (False) and the log says why.
     """
-    try:
-        cursor.execute(query, (new_title, new_author, new_quantity, new_quantity, book_id))
-        conn.commit()
-        
-        if cursor.rowcount > 0:
-            print(f"Success: Updated book ID {book_id}.")
-            return True
-        else:
-            print(f"Notice: No book found with ID {book_id} to update.")
+    with pooled_connection() as conn:
+        if not conn:
             return False
+
+        cursor = conn.cursor()
+    
+        try:
+            cursor.execute(_UPDATE_BOOK, (new_title, new_author, new_quantity, new_quantity, book_id, new_quantity))
+            updated = cursor.rowcount > 0
+            if not updated:
+                cursor.execute(_COPIES_OUT, (book_id,))
+                _log_refused_update(book_id, new_quantity, cursor.fetchone())
+            conn.commit()
+            lookup_cache.invalidate(('book', book_id))
+        
+            if updated:
+                _sync_search_index('update', book_id, title=new_title, author=new_author)
+                log.info("Updated book", book_id=book_id)
+            return updated
             
-    except Exception as e:
-        print(f"Error updating book: {e}")
-        conn.rollback()
-        return False
-    finally:
-        cursor.close()
-        close_connection(conn)
+        except Exception as e:
+            log.error("Could not update book", book_id=book_id, error=str(e))
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+
+def _log_refused_update(book_id, new_quantity, copies_out):
+    """Says why _UPDATE_BOOK changed nothing; `copies_out` is the _COPIES_OUT row, or None."""
+    if copies_out is None:
+        log.warning("No book to update", book_id=book_id)
+    else:
+        on_loan, held = copies_out[0], copies_out[1]
+        log.warning("Not updated: the new quantity is below the copies on loan or set aside for holds",
+                    book_id=book_id, quantity=new_quantity, on_loan=on_loan, held_copies=held)
 
+@instrumented
 def remove_book(book_id):
     """Removes a book from the database using its book_id."""
-    conn = create_connection()
-    if not conn:
-        return False
+    with pooled_connection() as conn:
+        if not conn:
+            return False
         
-    cursor = conn.cursor()
-    query = "DELETE FROM books WHERE book_id = %s"
+        cursor = conn.cursor()
     
-    try:
-        cursor.execute(query, (book_id,))
-        conn.commit()
+        try:
+            cursor.execute(_DELETE_BOOK, (book_id,))
+            conn.commit()
+            lookup_cache.invalidate(('book', book_id))
         
-        if cursor.rowcount > 0:
-            print(f"Success: Removed book ID {book_id}.")
-            return True
-        else:
-            print(f"Notice: No book found with ID {book_id} to remove.")
-            return False
+            if cursor.rowcount > 0:
+                _sync_search_index('remove', book_id)
+                log.info("Removed book", book_id=book_id)
+                return True
+            else:
+                log.warning("No book to remove", book_id=book_id)
+                return False
             
-    except Exception as e:
-        print(f"Error removing book: {e}")
-        print("Hint: You cannot remove a book that is currently issued to a member.")
-        conn.rollback()
-        return False
-    finally:
-        cursor.close()
-        close_connection(conn)
+        except Exception as e:
+            # Usually a book that is still issued to a member (foreign key)
+            log.error("Could not remove book", book_id=book_id, error=str(e))
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
 
 # --- Test block ---
 if __name__ == '__main__':
+    configure_logging()
     print("--- Testing Book Management System ---")
     
     # 1. Add a new book
@@ -172,4 +507,18 @@ if __name__ == '__main__':
     if ds_books:
         ds_book_id = ds_books[0]['book_id']
         print(f"  > Found book ID {ds_book_id}. Removing it...")
-        remove_book(ds_book_id)
\ No newline at end of file
+        remove_book(ds_book_id)
+    # 6. A book added by another program (another desk, the importer) turns up too
+    print("\nAdding a book behind this desk's back...")
+    import time
+    from modules.index_changes import REFRESH_SECONDS
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_INSERT_BOOK, ('Elsewhere Added', 'Other Desk', None, 'Test', 1, 1))
+        conn.commit()
+        cursor.close()
+    time.sleep(REFRESH_SECONDS)
+    elsewhere = search_book('Elsewhere')
+    print(f"  > Found by this desk: {[book['title'] for book in elsewhere]}")  # Should be ['Elsewhere Added']
+    if elsewhere:
+        remove_book(elsewhere[0]['book_id'])
@@ -0,0 +1,345 @@
+# This is 'modules/bulk_import.py'
+#
+# Streams books or members from a CSV / JSON Lines feed into the database
+# in batches, instead of one connection and one commit per row.
+
+import csv
+import datetime
+import json
+import os
+import time
+
+from database.db_connection import pooled_connection
+from utils.log import configure_logging
+
+
+class ImportSpec:
+    """Describes how one kind of record (books, members) is imported."""
+
+    def __init__(self, table, key, key_index, insert_query, update_query, to_insert, to_update, refused):
+        self.table = table
+        self.key = key                    # Duplicate-detection column (isbn, email)
+        self.key_index = key_index        # Position of that column in the insert params
+        self.insert_query = insert_query
+        self.update_query = update_query
+        self.to_insert = to_insert        # record -> insert params; raises ValueError if invalid
+        self.to_update = to_update        # insert params -> update params
+        self.refused = refused            # Why an update can match no row, for the rejects file
+
+
+class _UpdateRefused(Exception):
+    """An update matched no row: the guard in its WHERE clause refused it."""
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"missing {field}")
+    return value or None
+
+
+def _book_params(record):
+    quantity = record.get('quantity')
+    try:
+        quantity = int(quantity) if quantity not in (None, '') else 1
+    except (TypeError, ValueError):
+        raise ValueError(f"bad quantity {quantity!r}")
+    if quantity < 0:
+        raise ValueError(f"bad quantity {quantity!r}")
+    # title, author, isbn, genre, quantity, available_quantity
+    return (_text(record, 'title', required=True), _text(record, 'author'),
+            _text(record, 'isbn', required=True), _text(record, 'genre'), quantity, quantity)
+
+
+def _member_params(record):
+    reg_date = _text(record, 'registration_date')
+    try:
+        reg_date = datetime.date.fromisoformat(reg_date) if reg_date else datetime.date.today()
+    except ValueError:
+        raise ValueError(f"bad registration_date {reg_date!r}")
+    phone = _text(record, 'phone_number') or _text(record, 'phone')
+    # name, email, phone_number, registration_date
+    return (_text(record, 'name', required=True), _text(record, 'email', required=True).lower(),
+            phone, reg_date)
+
+
+BOOKS = ImportSpec(
+    table='books',
+    key='isbn',
+    key_index=2,
+    insert_query="""
+    INSERT INTO books (title, author, isbn, genre, quantity, available_quantity)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    """,
+    # available_quantity is assigned before quantity: MySQL applies SET left to right
+    update_query="""
+    UPDATE books
+    SET title = %s,
+        author = %s,
+        genre = %s,
+        available_quantity = available_quantity + (%s - quantity),
+        quantity = %s
+    WHERE isbn = %s
+      AND %s >= on_loan + held_copies
+    """,
+    to_insert=_book_params,
+    to_update=lambda p: (p[0], p[1], p[3], p[4], p[4], p[2], p[4]),
+    refused="quantity is below the copies on loan or set aside for holds",
+)
+
+MEMBERS = ImportSpec(
+    table='members',
+    key='email',
+    key_index=1,
+    insert_query="""
+    INSERT INTO members (name, email, phone_number, registration_date)
+    VALUES (%s, %s, %s, %s)
+    """,
+    update_query="UPDATE members SET name = %s, phone_number = %s WHERE email = %s",
+    to_insert=_member_params,
+    to_update=lambda p: (p[0], p[2], p[1]),
+    refused="the member was removed during the import",
+)
+
+SPECS = {'books': BOOKS, 'members': MEMBERS}
+
+
+def read_records(path, fmt=None):
+    """Yields one dict per record of a CSV or JSON Lines file, without loading it all."""
+    if fmt is None:
+        fmt = 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {k.strip().lower(): v for k, v in row.items() if k}
+        elif fmt == 'jsonl':
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    # Keep the position count right; the bad line is rejected later
+                    yield {'_error': f"line {line_no}: {e}"}
+        else:
+            raise ValueError(f"Unknown input format: {fmt!r}")
+
+
+def run_import(kind, path, fmt=None, batch_size=1000, commit_every=10, on_duplicate='skip',
+               checkpoint_path=None, rejects_path=None):
+    """Imports a feed of `kind` ('books' or 'members') and returns a summary dict.
+
+    Rows are inserted `batch_size` at a time with executemany and committed
+    every `commit_every` batches. Rows whose ISBN (books) or email (members)
+    already exists are rejected (on_duplicate='skip') or overwrite the
+    existing row (on_duplicate='update'). Invalid and rejected rows go to
+    `rejects_path` as JSON Lines with a reason. After every commit the
+    position is saved to `checkpoint_path`, so an interrupted import
+    started again with the same arguments carries on where it stopped.
+    """
+    spec = SPECS[kind]
+    if on_duplicate not in ('skip', 'update'):
+        raise ValueError("on_duplicate must be 'skip' or 'update'")
+    checkpoint_path = checkpoint_path or f"{path}.checkpoint.json"
+    rejects_path = rejects_path or f"{path}.rejects.jsonl"
+
+    resume_from = _load_checkpoint(checkpoint_path, kind, path)
+    summary = {'kind': kind, 'source': path, 'resumed_from': resume_from, 'processed': 0,
+               'inserted': 0, 'updated': 0, 'rejected': 0}
+    started = time.perf_counter()
+
+    with pooled_connection() as conn, \
+            open(rejects_path, 'a' if resume_from else 'w', encoding='utf-8') as rejects:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cursor = conn.cursor()
+        importer = _BatchImporter(spec, conn, cursor, on_duplicate, rejects, summary)
+        position = 0
+        batch = []
+        try:
+            for record in read_records(path, fmt):
+                position += 1
+                if position <= resume_from:
+                    continue  # Already imported before the interruption
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    importer.add_batch(batch)
+                    batch = []
+                    if importer.pending_batches >= commit_every:
+                        importer.commit()
+                        _save_checkpoint(checkpoint_path, kind, path, position)
+            if batch:
+                importer.add_batch(batch)
+            importer.commit()
+        finally:
+            cursor.close()
+
+    # Finished cleanly: nothing left to resume
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if kind == 'books':
+        # This process rebuilds its index on next search; running desks and
+        # serve.py catch up through index_changes (modules/index_changes.py)
+        from modules.book_management import reset_search_index
+        reset_search_index()
+    else:
+        from modules.member_management import reset_member_index
+        reset_member_index()
+
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 3)
+    summary['rows_per_sec'] = round(summary['processed'] / elapsed, 1) if elapsed else 0.0
+    summary['rejects_file'] = rejects_path
+    return summary
+
+
+class _BatchImporter:
+    """Writes batches on one connection and commits them together."""
+
+    def __init__(self, spec, conn, cursor, on_duplicate, rejects, summary):
+        self.spec = spec
+        self.conn = conn
+        self.cursor = cursor
+        self.on_duplicate = on_duplicate
+        self.rejects = rejects
+        self.summary = summary
+        self.pending = []  # Records written since the last commit, for replay on failure
+        self.pending_batches = 0
+        self.pending_rejects = []  # Written to the rejects file only once committed
+        self.committed = {'inserted': 0, 'updated': 0, 'rejected': 0}
+
+    def add_batch(self, records):
+        self.pending.extend(records)
+        self.pending_batches += 1
+        try:
+            self._write(records)
+        except Exception:
+            # Something in the uncommitted work broke a constraint; start
+            # over from the last commit one row at a time
+            self.conn.rollback()
+            self._replay_row_by_row()
+
+    def commit(self):
+        self.conn.commit()
+        self.rejects.writelines(self.pending_rejects)
+        self.rejects.flush()
+        self.summary['processed'] += len(self.pending)
+        self.committed = {name: self.summary[name] for name in self.committed}
+        self.pending = []
+        self.pending_rejects = []
+        self.pending_batches = 0
+
+    def _write(self, records):
+        inserts, updates, keys = [], [], []
+        for record in records:
+            params = self._validate(record)
+            if params is not None:
+                inserts.append((record, params))
+                keys.append(params[self.spec.key_index])
+
+        existing = self._existing_keys(keys)
+        new_rows, seen = [], set()
+        for record, params in inserts:
+            key = params[self.spec.key_index]
+            if key in existing or key in seen:
+                if self.on_duplicate == 'update':
+                    updates.append(self.spec.to_update(params))
+                else:
+                    self._reject(record, f"duplicate {self.spec.key} {key}")
+                continue
+            seen.add(key)
+            new_rows.append(params)
+
+        if new_rows:
+            self.cursor.executemany(self.spec.insert_query, new_rows)
+            self.summary['inserted'] += len(new_rows)
+        if updates:
+            self.cursor.executemany(self.spec.update_query, updates)
+            if self.cursor.rowcount < len(updates):  # Matched rows, even unchanged ones (FOUND_ROWS)
+                raise _UpdateRefused(self.spec.refused)  # add_batch finds which one, row by row
+            self.summary['updated'] += len(updates)
+
+    def _replay_row_by_row(self):
+        # Forget what the rolled-back batches counted before replaying them
+        self.summary.update(self.committed)
+        self.pending_rejects = []
+        for record in self.pending:
+            try:
+                self._write([record])
+            except _UpdateRefused as e:
+                self._reject(record, str(e))
+            except Exception as e:
+                self._reject(record, f"database error: {e}")
+
+    def _validate(self, record):
+        if '_error' in record:
+            self._reject(record, record['_error'])
+            return None
+        try:
+            return self.spec.to_insert(record)
+        except ValueError as e:
+            self._reject(record, str(e))
+            return None
+
+    def _existing_keys(self, keys):
+        if not keys:
+            return set()
+        placeholders = ', '.join(['%s'] * len(keys))
+        self.cursor.execute(
+            f"SELECT {self.spec.key} FROM {self.spec.table} WHERE {self.spec.key} IN ({placeholders})",
+            tuple(keys))
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def _reject(self, record, reason):
+        self.summary['rejected'] += 1
+        self.pending_rejects.append(json.dumps({'reason': reason, 'record': record}, default=str) + '\n')
+
+
+def _load_checkpoint(checkpoint_path, kind, path):
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('kind') != kind or checkpoint.get('source') != os.path.abspath(path):
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to a different import.")
+    return checkpoint['position']
+
+
+def _save_checkpoint(checkpoint_path, kind, path, position):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'kind': kind, 'source': os.path.abspath(path), 'position': position}, f)
+    os.replace(tmp_path, checkpoint_path)  # Atomic, so a crash never leaves half a file
+
+
+# --- Test block ---
+if __name__ == '__main__':
+    import tempfile
+    configure_logging()
+    print("--- Testing Bulk Import ---")
+    books = [{'title': f'Import Test {n}', 'author': 'Test Author', 'isbn': f'97800000090{n:02d}',
+              'genre': 'Test', 'quantity': 2} for n in range(5)]
+    members = [{'name': f'Import Tester {n}', 'email': f'import{n}@example.com', 'phone_number': '5550100'}
+               for n in range(5)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        for kind, records in (('books', books), ('members', members)):
+            path = os.path.join(folder, f'{kind}.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+            summary = run_import(kind, path, batch_size=2)
+            print(f"  > {kind}: inserted {summary['inserted']}, rejected {summary['rejected']}")  # 5, 0
+            # The same rows again, unchanged: every one matches and is updated
+            summary = run_import(kind, path, batch_size=2, on_duplicate='update')
+            print(f"  > {kind} again: updated {summary['updated']}, rejected {summary['rejected']}")  # 5, 0
+            with open(summary['rejects_file'], encoding='utf-8') as f:
+                print(f"  > Rejects: {f.read().splitlines()}")  # []
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM books WHERE isbn LIKE %s", ('97800000090%',))
+        cursor.execute("DELETE FROM members WHERE email LIKE %s", ('import%@example.com',))
+        conn.commit()
+        cursor.close()
@@ -0,0 +1,193 @@
+# This is 'modules/circulation_counters.py'
+#
+# Nightly reconciliation of the circulation counters every title keeps on
+# its books row: available_quantity, on_loan, held_copies, lifetime_issues
+# and overdue_loans (see the notes in modules/issue_return.py). The
+# circulation functions keep them up to date as they go; this job recounts
+# them from transactions and holds, a batch of titles at a time, writes
+# back the ones that are off and reports the drift it found. Drift means
+# something changed loans, holds or quantities without going through
+# those functions (a hand-edited row, an old client, a bug).
+#
+# overdue_loans is different: loans become overdue with time, not with a
+# transaction, so this job is what moves it forward. Each title counts
+# its open loans due before its overdue_as_of date.
+
+import datetime
+import time
+
+from modules.issue_return import _run_transaction, _Conflict
+from utils.cache import lookup_cache
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+BATCH_SIZE = 1_000   # Titles recounted per transaction
+DRIFT_EXAMPLES = 20  # Drifted counters listed in the summary
+
+# The counters circulation maintains; a difference in any of them is drift
+COUNTERS = ('available_quantity', 'on_loan', 'held_copies', 'lifetime_issues')
+
+_STORED_COUNTERS = """
+SELECT book_id, quantity, available_quantity, on_loan, held_copies, lifetime_issues, overdue_loans
+FROM books
+WHERE book_id > %s
+ORDER BY book_id
+LIMIT %s
+"""
+_LOAN_COUNTS = """
+SELECT book_id, COUNT(*),
+       SUM(CASE WHEN return_date IS NULL THEN 1 ELSE 0 END),
+       SUM(CASE WHEN return_date IS NULL AND due_date < %s THEN 1 ELSE 0 END)
+FROM transactions
+WHERE book_id BETWEEN %s AND %s
+GROUP BY book_id
+"""
+_READY_HOLD_COUNTS = """
+SELECT book_id, COUNT(*) FROM holds
+WHERE status = 'ready' AND book_id BETWEEN %s AND %s
+GROUP BY book_id
+"""
+# Writes the recount, unless a desk changed the title since it was read
+_SET_COUNTERS = """
+UPDATE books SET available_quantity = %s, on_loan = %s, held_copies = %s, lifetime_issues = %s,
+                 overdue_loans = %s, overdue_as_of = %s
+WHERE book_id = %s AND quantity = %s AND available_quantity = %s AND on_loan = %s
+  AND held_copies = %s AND lifetime_issues = %s
+"""
+
+
+def _recount(rows, loans, held, as_of):
+    """Compares one batch of stored counters with the recount.
+
+    `loans` maps book_id -> (loans ever, open loans, overdue loans) and
+    `held` book_id -> ready holds. Returns the drift found, as
+    (book_id, counter, stored, actual) tuples, and the _SET_COUNTERS
+    parameters of the titles that need writing.
+    """
+    drift, updates = [], []
+    for book_id, quantity, available, on_loan, held_copies, lifetime, overdue in rows:
+        stored = (available, on_loan, held_copies, lifetime)
+        # SUM() comes back as a Decimal from MySQL
+        loans_ever, open_loans, overdue_now = (int(n) for n in loans.get(book_id, (0, 0, 0)))
+        ready = held.get(book_id, 0)
+        actual = (quantity - open_loans - ready, open_loans, ready, loans_ever)
+        drift.extend((book_id, counter, old, new)
+                     for counter, old, new in zip(COUNTERS, stored, actual) if old != new)
+        if stored != actual or overdue != overdue_now:
+            updates.append(actual + (overdue_now, as_of, book_id, quantity) + stored)
+    return drift, updates
+
+
+def _raise(error):
+    raise error
+
+
+def _reconcile_batch(after, batch_size, as_of, dry_run):
+    """Recounts the next `batch_size` titles after book_id `after`.
+
+    Returns (last book_id, titles, drift, titles written); last book_id is
+    None when there are no titles left.
+    """
+
+    def work(conn, cursor):
+        cursor.execute(_STORED_COUNTERS, (after, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return None, 0, [], 0
+        first, last = rows[0][0], rows[-1][0]
+        cursor.execute(_LOAN_COUNTS, (as_of, first, last))
+        loans = {row[0]: row[1:] for row in cursor.fetchall()}
+        cursor.execute(_READY_HOLD_COUNTS, (first, last))
+        held = dict(cursor.fetchall())
+
+        drift, updates = _recount(rows, loans, held, as_of)
+        if updates and not dry_run:
+            cursor.executemany(_SET_COUNTERS, updates)
+            if cursor.rowcount != len(updates):
+                raise _Conflict("a title changed while its counters were recounted")
+            conn.commit()
+            lookup_cache.invalidate(*[('book', update[6]) for update in updates])
+        return last, len(rows), drift, 0 if dry_run else len(updates)
+
+    return _run_transaction("reconcile counters", work, on_error=_raise)
+
+
+@instrumented
+def reconcile_counters(as_of=None, batch_size=BATCH_SIZE, dry_run=False):
+    """Recounts every title's circulation counters, `batch_size` titles per transaction.
+
+    overdue_loans is counted as of `as_of` (default today). With dry_run
+    nothing is written. Returns a summary dict: titles checked, titles
+    written, how many titles drifted per counter and the first few drifts.
+    """
+    as_of = as_of or datetime.date.today()
+    summary = {'as_of': as_of.isoformat(), 'titles': 0, 'updated': 0, 'drifted_titles': 0,
+               'drift_by_counter': dict.fromkeys(COUNTERS, 0), 'drift_examples': [], 'dry_run': dry_run}
+    started = time.perf_counter()
+
+    after = 0
+    while True:
+        last, titles, drift, updated = _reconcile_batch(after, batch_size, as_of, dry_run)
+        if last is None:
+            break
+        summary['titles'] += titles
+        summary['updated'] += updated
+        summary['drifted_titles'] += len({book_id for book_id, *_ in drift})
+        for book_id, counter, stored, actual in drift:
+            summary['drift_by_counter'][counter] += 1
+            if len(summary['drift_examples']) < DRIFT_EXAMPLES:
+                summary['drift_examples'].append({'book_id': book_id, 'counter': counter,
+                                                  'stored': stored, 'actual': actual})
+        after = last
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    if summary['drifted_titles']:
+        log.warning("Circulation counters had drifted", drifted_titles=summary['drifted_titles'],
+                    **summary['drift_by_counter'])
+    log.info("Reconciled circulation counters", titles=summary['titles'], updated=summary['updated'],
+             drifted_titles=summary['drifted_titles'], seconds=summary['seconds'], dry_run=dry_run)
+    return summary
+
+
+# --- Test block ---
+if __name__ == '__main__':
+    configure_logging()
+    from database.db_connection import pooled_connection
+    from modules.book_management import add_book, search_book, get_book, remove_book
+    from modules.member_management import register_member, view_member_details
+    from modules.issue_return import issue_book, return_book
+
+    print("--- Testing Circulation Counters ---")
+    add_book('Counter Test Book', 'Test Author', '978000000099', 'Test', 3)
+    register_member('Counter Tester', 'counters@example.com', '5550199')
+    book_id = search_book('978000000099')[0]['book_id']
+    member_id = view_member_details('counters@example.com')[0]['member_id']
+
+    issue_book(book_id, member_id)
+    issue_book(book_id, member_id)
+    return_book(book_id, member_id)
+    book = get_book(book_id)
+    print(f"  > After 2 issues and 1 return: available {book['available_quantity']}, on loan {book['on_loan']}, "
+          f"lifetime {book['lifetime_issues']}")  # Should be 2, 1, 2
+    print(f"  > Reconcile finds no drift: {reconcile_counters()['drifted_titles'] == 0}")
+
+    # Change a loan behind circulation's back, as an old client might
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE transactions SET return_date = %s WHERE book_id = %s AND return_date IS NULL",
+                       (datetime.date.today(), book_id))
+        conn.commit()
+        cursor.close()
+    print(f"  > Dry run reports: {reconcile_counters(dry_run=True)['drift_examples']}")
+    reconcile_counters()
+    book = get_book(book_id)
+    print(f"  > Fixed: available {book['available_quantity']}, on loan {book['on_loan']}")  # Should be 3, 0
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM transactions WHERE book_id = %s", (book_id,))
+        conn.commit()
+        cursor.close()
+    remove_book(book_id)
@@ -0,0 +1,166 @@
+# This is 'modules/fine_assessment.py'
+#
+# Nightly batch job: works out the fine every open (unreturned) loan has
+# accrued so far and stores it in transactions.fine_amount, so accrued
+# liabilities are known before the books come back. return_book later
+# overwrites it with the final fine.
+#
+# Fines follow the same rules as issue_return.calculate_fine. The math is
+# done on whole chunks at once with NumPy when it is installed, and with
+# plain Python otherwise.
+
+import datetime
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python path gives the same numbers
+    np = None
+
+from database.db_connection import pooled_connection
+from utils.config import FINE_PER_DAY, FINE_GRACE_DAYS, FINE_CAP, FINE_RATES_BY_GENRE
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+CHUNK_SIZE = 10_000         # Open loans read per query
+UPDATE_BATCH_SIZE = 1_000   # Loans updated per UPDATE statement
+
+
+def compute_fines(due_dates, genres, as_of, grace_days=FINE_GRACE_DAYS, cap=FINE_CAP,
+                  default_rate=FINE_PER_DAY, genre_rates=FINE_RATES_BY_GENRE):
+    """Returns the accrued fine of each loan, as a list of floats.
+
+    `due_dates` and `genres` are parallel sequences, one entry per loan.
+    """
+    if not due_dates:
+        return []
+    if np is not None:
+        return _compute_fines_numpy(due_dates, genres, as_of, grace_days, cap, default_rate, genre_rates)
+
+    fines = []
+    for due_date, genre in zip(due_dates, genres):
+        days = (as_of - due_date).days - grace_days
+        fine = days * genre_rates.get(genre, default_rate) if days > 0 else 0.0
+        if cap is not None:
+            fine = min(fine, cap)
+        fines.append(round(fine, 2))
+    return fines
+
+
+def _compute_fines_numpy(due_dates, genres, as_of, grace_days, cap, default_rate, genre_rates):
+    due = np.array(due_dates, dtype='datetime64[D]')
+    days = (np.datetime64(as_of, 'D') - due).astype(np.int64) - grace_days
+    np.maximum(days, 0, out=days)
+
+    # Map each loan's genre to its rate via a small lookup table
+    names, codes = np.unique(np.array([g or '' for g in genres], dtype=object), return_inverse=True)
+    rate_table = np.array([genre_rates.get(name, default_rate) if name else default_rate
+                           for name in names], dtype=np.float64)
+    fines = days * rate_table[codes]
+    if cap is not None:
+        np.minimum(fines, cap, out=fines)
+    return np.round(fines, 2).tolist()
+
+
+def _open_loan_chunks(cursor, chunk_size):
+    """Yields lists of open loans, keyset-paginated on transaction_id."""
+    query = """
+    SELECT t.transaction_id, t.due_date, t.fine_amount, b.genre
+    FROM transactions t
+    JOIN books b ON b.book_id = t.book_id
+    WHERE t.return_date IS NULL AND t.transaction_id > %s
+    ORDER BY t.transaction_id
+    LIMIT %s
+    """
+    last_id = 0
+    while True:
+        cursor.execute(query, (last_id, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _write_fines(cursor, changes):
+    """Stores (transaction_id, fine) pairs with one CASE update per batch."""
+    for start in range(0, len(changes), UPDATE_BATCH_SIZE):
+        batch = changes[start:start + UPDATE_BATCH_SIZE]
+        cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+        placeholders = ', '.join(['%s'] * len(batch))
+        params = [value for pair in batch for value in pair] + [tid for tid, _ in batch]
+        # return_date IS NULL: never overwrite the final fine of a loan returned meanwhile
+        cursor.execute(f"""
+            UPDATE transactions SET fine_amount = CASE transaction_id {cases} END
+            WHERE transaction_id IN ({placeholders}) AND return_date IS NULL
+            """, tuple(params))
+
+
+@instrumented
+def assess_fines(as_of=None, chunk_size=CHUNK_SIZE, grace_days=FINE_GRACE_DAYS, cap=FINE_CAP,
+                 default_rate=FINE_PER_DAY, genre_rates=FINE_RATES_BY_GENRE, dry_run=False):
+    """Recomputes the accrued fine of every open loan as of `as_of` (default today).
+
+    Loans are read `chunk_size` at a time and only loans whose fine changed
+    are written back, committing once per chunk. Returns a summary dict
+    with the total accrued liability and a per-genre breakdown.
+    """
+    as_of = as_of or datetime.date.today()
+    summary = {'as_of': as_of.isoformat(), 'open_loans': 0, 'overdue': 0, 'updated': 0,
+               'accrued_total': 0.0, 'accrued_by_genre': {}, 'engine': 'numpy' if np else 'python'}
+    started = time.perf_counter()
+
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        read_cursor = conn.cursor()
+        write_cursor = conn.cursor()
+        try:
+            for rows in _open_loan_chunks(read_cursor, chunk_size):
+                ids = [row[0] for row in rows]
+                genres = [row[3] for row in rows]
+                fines = compute_fines([row[1] for row in rows], genres, as_of,
+                                      grace_days, cap, default_rate, genre_rates)
+
+                changes = []
+                by_genre = summary['accrued_by_genre']
+                for transaction_id, old_fine, genre, fine in zip(ids, (row[2] for row in rows), genres, fines):
+                    if fine > 0:
+                        summary['overdue'] += 1
+                        by_genre[genre or ''] = round(by_genre.get(genre or '', 0.0) + fine, 2)
+                    if old_fine is None or abs(float(old_fine) - fine) >= 0.005:
+                        changes.append((transaction_id, fine))
+                summary['open_loans'] += len(rows)
+                summary['accrued_total'] += sum(fines)
+
+                if changes and not dry_run:
+                    _write_fines(write_cursor, changes)
+                    conn.commit()
+                summary['updated'] += len(changes)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            read_cursor.close()
+            write_cursor.close()
+
+    summary['accrued_total'] = round(summary['accrued_total'], 2)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    log.info("Assessed fines", open_loans=summary['open_loans'], overdue=summary['overdue'],
+             updated=summary['updated'], accrued_total=summary['accrued_total'],
+             seconds=summary['seconds'], dry_run=dry_run)
+    return summary
+
+
+# --- Test block ---
+if __name__ == '__main__':
+    configure_logging()
+    print("--- Testing Fine Assessment ---")
+    today = datetime.date.today()
+    due = [today - datetime.timedelta(days=d) for d in (-3, 0, 1, 10, 100)]
+    genres = ['Fiction', None, 'Reference', 'Fiction', 'Reference']
+    rates = {'Reference': 25.0}
+    print("  > Fines:", compute_fines(due, genres, today, grace_days=2, cap=500.0, genre_rates=rates))
+    print("  > Assessing open loans:", assess_fines())
@@ -0,0 +1,294 @@
+# This is 'modules/holds.py'
+#
+# Holds (reservations) on titles with no copy left. Each title has a
+# first-come, first-served queue of 'waiting' holds. When a copy comes
+# back, return_book (modules/issue_return.py) sets it aside for the oldest
+# waiting hold in the same transaction: the hold becomes 'ready' and the
+# member has HOLD_CONFIG['pickup_days'] to collect it with issue_book.
+# Ready holds that are not collected in time are expired in batches by
+# sweep_holds() (run it nightly: `python sweep_holds.py`), and their
+# copies go to the next in line or back on the shelf.
+#
+# A hold moves waiting -> ready -> fulfilled, or ends as cancelled or
+# expired. Copies set aside for ready holds are counted in the title's
+# held_copies, not in available_quantity.
+
+import datetime
+import time
+from collections import Counter
+
+from modules.issue_return import (_run_transaction, _Conflict, _allocate_copies, _pickup_deadline,
+                                  _SET_ASIDE_COPIES, _SHELVE_HELD_COPIES, _BOOK_EXISTS, _MEMBER_EXISTS)
+from database.db_connection import pooled_connection
+from utils.cache import lookup_cache
+from utils.config import HOLD_CONFIG
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+ACTIVE = ('waiting', 'ready')
+
+_INSERT_HOLD = """
+INSERT INTO holds (book_id, member_id, placed_date, status, ready_date, expires_date)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+_ACTIVE_HOLDS_OF_MEMBER = "SELECT hold_id, book_id FROM holds WHERE member_id = %s AND status IN ('waiting', 'ready')"
+# A write that changes nothing, to lock the title's row (SQLite: the
+# database) until the commit, so holds on one title are placed one at a
+# time and the duplicate check below can't miss a hold being placed
+_LOCK_BOOK = "UPDATE books SET held_copies = held_copies WHERE book_id = %s"
+# Place in the queue: waiting holds on the same title placed no later
+_QUEUE_POSITION = "SELECT COUNT(*) FROM holds WHERE book_id = %s AND status = 'waiting' AND hold_id <= %s"
+_HOLD_BY_ID = "SELECT book_id, member_id, status FROM holds WHERE hold_id = %s"
+_CLOSE_HOLD = "UPDATE holds SET status = %s, closed_date = %s WHERE hold_id = %s AND status = %s"
+_MEMBER_HOLDS = """
+SELECT h.hold_id, h.book_id, b.title, h.status, h.placed_date, h.expires_date,
+       CASE WHEN h.status = 'waiting' THEN
+           (SELECT COUNT(*) FROM holds q
+            WHERE q.book_id = h.book_id AND q.status = 'waiting' AND q.hold_id <= h.hold_id)
+       END AS position
+FROM holds h
+JOIN books b ON b.book_id = h.book_id
+WHERE h.member_id = %s AND h.status IN ('waiting', 'ready')
+ORDER BY h.hold_id
+"""
+_HOLD_QUEUE = """
+SELECT h.hold_id, h.member_id, m.name, h.placed_date
+FROM holds h
+JOIN members m ON m.member_id = h.member_id
+WHERE h.book_id = %s AND h.status = 'waiting'
+ORDER BY h.hold_id
+LIMIT %s
+"""
+# For the sweep
+_EXPIRED_HOLDS = """
+SELECT hold_id, book_id FROM holds
+WHERE status = 'ready' AND expires_date < %s
+ORDER BY expires_date, hold_id
+LIMIT %s
+"""
+_EXPIRE_HOLD = "UPDATE holds SET status = 'expired', closed_date = %s WHERE hold_id = %s AND status = 'ready'"
+# Copies on the shelf while someone is waiting for the title, which can
+# happen when a hold is placed just as a copy comes back
+_STRANDED_COPIES = """
+SELECT b.book_id, b.available_quantity, COUNT(*) FROM books b
+JOIN holds h ON h.book_id = b.book_id
+WHERE h.status = 'waiting' AND b.available_quantity > 0
+GROUP BY b.book_id, b.available_quantity
+"""
+
+
+def _failed(message):
+    return {'success': False, 'hold_id': None, 'status': None, 'position': None, 'message': message}
+
+
+@instrumented
+def place_hold(book_id, member_id):
+    """Puts a member in the queue for a title.
+
+    If a copy is on the shelf it is set aside for the member right away.
+    Returns {'success': ..., 'hold_id': ..., 'status': 'waiting'/'ready',
+    'position': place in the queue (None when ready), 'message': ...}.
+    """
+    today = datetime.date.today()
+
+    def work(conn, cursor):
+        cursor.execute(_LOCK_BOOK, (book_id,))
+        cursor.execute(_ACTIVE_HOLDS_OF_MEMBER, (member_id,))
+        active = cursor.fetchall()
+        if any(row[1] == book_id for row in active):
+            return _failed("The member already has a hold on this book.")
+        if len(active) >= HOLD_CONFIG['max_active_per_member']:
+            return _failed(f"The member already has {len(active)} holds.")
+        cursor.execute(_BOOK_EXISTS, (book_id,))
+        if cursor.fetchone() is None:
+            return _failed("No such book.")
+        cursor.execute(_MEMBER_EXISTS, (member_id,))
+        if cursor.fetchone() is None:
+            return _failed("No such member.")
+
+        # A copy on the shelf is set aside at once; otherwise join the queue
+        cursor.execute(_SET_ASIDE_COPIES, (1, 1, book_id, 1))
+        if cursor.rowcount:
+            expires_date = _pickup_deadline(today)
+            cursor.execute(_INSERT_HOLD, (book_id, member_id, today, 'ready', today, expires_date))
+            hold_id = cursor.lastrowid
+            conn.commit()
+            lookup_cache.invalidate(('book', book_id))
+            log.info("Placed hold", hold_id=hold_id, book_id=book_id, member_id=member_id, status='ready')
+            return {'success': True, 'hold_id': hold_id, 'status': 'ready', 'position': None,
+                    'message': f"A copy is set aside until {expires_date}."}
+
+        cursor.execute(_INSERT_HOLD, (book_id, member_id, today, 'waiting', None, None))
+        hold_id = cursor.lastrowid
+        cursor.execute(_QUEUE_POSITION, (book_id, hold_id))
+        position = cursor.fetchone()[0]
+        conn.commit()
+        log.info("Placed hold", hold_id=hold_id, book_id=book_id, member_id=member_id, position=position)
+        return {'success': True, 'hold_id': hold_id, 'status': 'waiting', 'position': position,
+                'message': f"Number {position} in the queue."}
+
+    return _run_transaction("place hold", work, on_error=lambda e: _failed(f"Error: {e}"))
+
+
+@instrumented
+def cancel_hold(hold_id):
+    """Cancels a waiting or ready hold; a copy set aside for it goes to the next in line."""
+    today = datetime.date.today()
+
+    def work(conn, cursor):
+        cursor.execute(_HOLD_BY_ID, (hold_id,))
+        row = cursor.fetchone()
+        if row is None or row[2] not in ACTIVE:
+            log.warning("No active hold to cancel", hold_id=hold_id)
+            return False
+        book_id, member_id, status = row
+        cursor.execute(_CLOSE_HOLD, ('cancelled', today, hold_id, status))
+        if cursor.rowcount == 0:
+            raise _Conflict(f"hold {hold_id} changed concurrently")
+        if status == 'ready' and _allocate_copies(cursor, book_id, 1, today):
+            cursor.execute(_SHELVE_HELD_COPIES, (1, 1, book_id))
+        conn.commit()
+        lookup_cache.invalidate(('book', book_id))
+        log.info("Cancelled hold", hold_id=hold_id, book_id=book_id, member_id=member_id)
+        return True
+
+    return _run_transaction("cancel hold", work, on_error=lambda e: False)
+
+
+def _fetch_all(query, params, error_message, **context):
+    with pooled_connection() as conn:
+        if not conn:
+            return []
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except Exception as e:
+            log.error(error_message, error=str(e), **context)
+            return []
+        finally:
+            cursor.close()
+
+
+@instrumented
+def member_holds(member_id):
+    """The member's waiting and ready holds, oldest first, with their place in each queue."""
+    return _fetch_all(_MEMBER_HOLDS, (member_id,), "Could not read holds", member_id=member_id)
+
+
+@instrumented
+def hold_queue(book_id, limit=10):
+    """Who is next for a title: its first `limit` waiting holds, in order."""
+    return _fetch_all(_HOLD_QUEUE, (book_id, limit), "Could not read hold queue", book_id=book_id)
+
+
+def _raise(error):
+    raise error
+
+
+def _expire_batch(today, batch_size):
+    """Expires one batch of uncollected holds; returns (expired, set aside again, shelved)."""
+
+    def work(conn, cursor):
+        cursor.execute(_EXPIRED_HOLDS, (today, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, 0, 0
+        cursor.executemany(_EXPIRE_HOLD, [(today, hold_id) for hold_id, _ in rows])
+        if cursor.rowcount != len(rows):
+            raise _Conflict("a hold was collected or cancelled during the sweep")
+        freed = Counter(book_id for _, book_id in rows)
+        shelved = [(_allocate_copies(cursor, book_id, count, today), book_id) for book_id, count in freed.items()]
+        shelved = [(count, count, book_id) for count, book_id in shelved if count]
+        if shelved:
+            cursor.executemany(_SHELVE_HELD_COPIES, shelved)
+        conn.commit()
+        lookup_cache.invalidate(*[('book', book_id) for book_id in freed])
+        back = sum(count for count, _, _ in shelved)
+        return len(rows), len(rows) - back, back
+
+    return _run_transaction("expire holds", work, on_error=_raise)
+
+
+def _allocate_stranded(today):
+    """Sets shelf copies aside for titles that have holds waiting; returns how many."""
+
+    def work(conn, cursor):
+        cursor.execute(_STRANDED_COPIES)
+        rows = cursor.fetchall()
+        allocated = 0
+        for book_id, available, waiting in rows:
+            copies = min(available, waiting)
+            copies -= _allocate_copies(cursor, book_id, copies, today)
+            if not copies:
+                continue
+            cursor.execute(_SET_ASIDE_COPIES, (copies, copies, book_id, copies))
+            if cursor.rowcount == 0:
+                raise _Conflict("availability changed during the sweep")
+            allocated += copies
+        conn.commit()
+        lookup_cache.invalidate(*[('book', row[0]) for row in rows])
+        return allocated
+
+    return _run_transaction("allocate stranded copies", work, on_error=_raise)
+
+
+@instrumented
+def sweep_holds(today=None, batch_size=None):
+    """Expires ready holds not collected by their expiry date, in batches.
+
+    Each batch of up to `batch_size` holds is one transaction: the holds
+    are expired and their copies set aside for the next waiting holds or
+    put back on the shelf. Then any shelf copies of titles with holds
+    waiting are set aside too. Returns a summary dict.
+    """
+    today = today or datetime.date.today()
+    batch_size = batch_size or HOLD_CONFIG['sweep_batch_size']
+    summary = {'as_of': today.isoformat(), 'expired': 0, 'passed_on': 0, 'shelved': 0, 'batches': 0}
+    started = time.perf_counter()
+
+    while True:
+        expired, passed_on, shelved = _expire_batch(today, batch_size)
+        if not expired:
+            break
+        summary['batches'] += 1
+        summary['expired'] += expired
+        summary['passed_on'] += passed_on
+        summary['shelved'] += shelved
+    summary['stranded_set_aside'] = _allocate_stranded(today)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    log.info("Swept holds", **summary)
+    return summary
+
+
+# --- Test block ---
+if __name__ == '__main__':
+    configure_logging()
+    from modules.book_management import add_book, search_book
+    from modules.member_management import register_member, view_member_details
+    from modules.issue_return import issue_book, return_book
+
+    print("--- Testing Holds ---")
+    add_book('Hold Test Book', 'Test Author', '978000000077', 'Test', 1)
+    book_id = search_book('978000000077')[0]['book_id']
+    for name in ('Ada', 'Ben', 'Cy'):
+        register_member(f'{name} Holder', f'{name.lower()}@holds.example', '5550100')
+    ada, ben, cy = (view_member_details(f'{name.lower()}@holds.example')[0]['member_id'] for name in ('Ada', 'Ben', 'Cy'))
+
+    print(f"  > Ada borrows the only copy: {issue_book(book_id, ada)}")
+    print(f"  > Ben places a hold: {place_hold(book_id, ben)['message']}")
+    print(f"  > Cy places a hold: {place_hold(book_id, cy)['message']}")
+    print(f"  > Who is next: {[row['name'] for row in hold_queue(book_id)]}")
+    print(f"  > Cy can't walk in and take it... {issue_book(book_id, cy)}")
+    return_book(book_id, ada)
+    print(f"  > After Ada returns it, Ben's holds: {[(h['title'], h['status']) for h in member_holds(ben)]}")
+    print(f"  > Ada can't take Ben's copy: {issue_book(book_id, ada)}")
+    print(f"  > Ben collects it: {issue_book(book_id, ben)}")
+    return_book(book_id, ben)
+    print(f"  > Ben returns it; Cy's holds: {[(h['title'], h['status']) for h in member_holds(cy)]}")
+    later = datetime.date.today() + datetime.timedelta(days=HOLD_CONFIG['pickup_days'] + 1)
+    print(f"  > Cy never comes; sweep: {sweep_holds(today=later)}")
+    print(f"  > Available again: {search_book('978000000077')[0]['available_quantity']}")  # Should be 1
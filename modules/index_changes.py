@@ -0,0 +1,138 @@
+# This is 'modules/index_changes.py'
+#
+# Keeps the in-memory search indexes (books in modules/search_index.py,
+# members in modules/member_index.py) in step with changes made by other
+# programs: another desk, serve.py, import_catalog.py, or a row edited by
+# hand. Triggers (migrations 9 and 10 in database/migrations.py) note every
+# added, deleted or re-worded row in the index_changes table; each index
+# looks there at most every REFRESH_SECONDS, before a search, and re-reads
+# just the rows that changed.
+#
+# Changes are found by the database time they were made, not by
+# change_id: on MySQL a transaction can commit after a later one, so a
+# change_id lower than the last one seen may still turn up. Every look
+# therefore reaches back OVERLAP before the previous one, skipping the
+# changes it has already applied. An index built from a full read starts
+# out with the changes committed before the read counted as applied
+# (ChangeFeed.before_full_read), so a burst of them is not read again.
+
+import datetime
+import time
+
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+REFRESH_SECONDS = 1.0                     # Least time between two looks at index_changes
+OVERLAP = datetime.timedelta(seconds=60)  # Longest a transaction may take to commit
+RETENTION = datetime.timedelta(days=7)    # Changes kept; an index further behind is rebuilt
+MAX_CHANGES = 10_000                      # More changes than this at once: rebuild instead
+
+_NOW = "SELECT CURRENT_TIMESTAMP"
+_CHANGES_SINCE = """
+SELECT change_id, entity_id, changed_at FROM index_changes
+WHERE entity = %s AND changed_at >= %s
+LIMIT %s
+"""
+_CHANGE_IDS_SINCE = "SELECT change_id, changed_at FROM index_changes WHERE entity = %s AND changed_at >= %s"
+_PRUNE_CHANGES = "DELETE FROM index_changes WHERE changed_at < %s"
+
+
+def database_now(conn):
+    """The database's clock (SQLite returns it as text), the one changed_at is set from."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_NOW)
+        now = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if isinstance(now, str):
+        now = datetime.datetime.fromisoformat(now)
+    return now.replace(microsecond=0)
+
+
+def prune_changes(conn, now):
+    """Deletes the changes no index can need any more (see ChangeFeed.refresh)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_PRUNE_CHANGES, (now - RETENTION - OVERLAP,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class ChangeFeed:
+    """The changes to one entity ('book' or 'member') an index has not applied yet.
+
+    `as_of` is the database time the index was last known to be current
+    at: when it was built, loaded from a snapshot that recorded it, or
+    last refreshed. Not thread-safe; the index's owner serializes refreshes.
+    """
+
+    def __init__(self, entity, as_of):
+        self.entity = entity
+        self.as_of = as_of
+        self._applied = {}  # change_id -> changed_at, for changes inside the overlap
+        self._checked = time.monotonic()
+
+    @classmethod
+    def before_full_read(cls, conn, entity):
+        """A feed for an index about to be built by reading its whole table.
+
+        Call it before the read, on the same connection. The changes
+        committed by now are in what the read returns, so they are counted
+        as applied; otherwise, after a burst of more than MAX_CHANGES (a
+        bulk import), every refresh within OVERLAP would find the same
+        burst and rebuild again.
+        """
+        now = database_now(conn)
+        prune_changes(conn, now)
+        feed = cls(entity, now)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_CHANGE_IDS_SINCE, (entity, now - OVERLAP))
+            feed._applied = dict(cursor.fetchall())
+        finally:
+            cursor.close()
+        return feed
+
+    def due(self):
+        return time.monotonic() - self._checked >= REFRESH_SECONDS
+
+    def postpone(self):
+        """Waits REFRESH_SECONDS before the next look (e.g. the database is down)."""
+        self._checked = time.monotonic()
+
+    def refresh(self, conn, apply):
+        """Calls apply(ids) with the ids changed since the last refresh.
+
+        Returns False, without calling apply, if the index is too far behind
+        to catch up change by change and should be rebuilt. If apply raises,
+        the feed stays where it was and the same changes come back next time.
+        """
+        self._checked = time.monotonic()
+        now = database_now(conn)
+        if now - self.as_of > RETENTION:
+            return False
+        cursor = conn.cursor()
+        try:
+            # Enough rows to find MAX_CHANGES + 1 not applied yet, if there are that many
+            cursor.execute(_CHANGES_SINCE, (self.entity, self.as_of - OVERLAP,
+                                            len(self._applied) + MAX_CHANGES + 1))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        rows = [row for row in rows if row[0] not in self._applied]
+        if len(rows) > MAX_CHANGES:
+            log.info("Too many changes to catch up with; rebuilding the index", entity=self.entity)
+            return False
+
+        if rows:
+            apply({entity_id for _, entity_id, _ in rows})
+        window = now - OVERLAP
+        self._applied = {change_id: changed_at for change_id, changed_at in self._applied.items()
+                         if changed_at >= window}
+        self._applied.update((change_id, changed_at) for change_id, _, changed_at in rows
+                             if changed_at >= window)
+        self.as_of = now
+        return True
@@ -1,125 +1,558 @@
 # This is 'modules/issue_return.py'
 
 import datetime
-from database.db_connection import create_connection, close_connection
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from database.db_connection import pooled_connection, get_backend
+from utils.cache import lookup_cache
+from utils.config import FINE_PER_DAY, FINE_GRACE_DAYS, FINE_CAP, FINE_RATES_BY_GENRE, HOLD_CONFIG
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented, registry
 
+log = get_logger(__name__)
+
+LOAN_DAYS = 14
+MAX_ATTEMPTS = 5       # Tries per transaction before giving up on a conflict
+RETRY_BACKOFF = 0.005  # Seconds; doubles with every attempt
+
+def calculate_fine(due_date, return_date, genre=None):
+    """Returns the fine for a loan returned on return_date.
+
+    Days past the due date, minus FINE_GRACE_DAYS, are charged at the
+    genre's rate (FINE_RATES_BY_GENRE, else FINE_PER_DAY), up to FINE_CAP.
+    modules/fine_assessment.py applies the same rules in bulk.
+    """
+    days_charged = (return_date - due_date).days - FINE_GRACE_DAYS
+    if days_charged <= 0:
+        return 0.00
+    fine = days_charged * FINE_RATES_BY_GENRE.get(genre, FINE_PER_DAY)
+    if FINE_CAP is not None:
+        fine = min(fine, FINE_CAP)
+    return round(fine, 2)
+
+# The queries, shared with the async versions in modules/async_operations.py
+
+# Each title keeps its circulation counters on its books row, updated in
+# the same transaction as the loans and holds they count:
+#   available_quantity  copies on the shelf
+#   on_loan             copies out on open loans
+#   held_copies         copies set aside for ready holds
+#   lifetime_issues     loans ever made
+#   overdue_loans       open loans already overdue on overdue_as_of
+# so quantity = available_quantity + on_loan + held_copies. Loans only
+# become overdue with time, so overdue_loans is recounted by the nightly
+# reconciliation (modules/circulation_counters.py) and kept down as those
+# loans come back. That job also reports any drift it finds.
+
+# Take a copy only if one is left. Checking and decrementing in a single
+# statement means two desks can never both get the last copy.
+_TAKE_COPY = """
+UPDATE books SET available_quantity = available_quantity - 1,
+                 on_loan = on_loan + 1, lifetime_issues = lifetime_issues + 1
+WHERE book_id = %s AND available_quantity > 0
+"""
+_INSERT_LOAN = """
+INSERT INTO transactions (book_id, member_id, issue_date, due_date, return_date, fine_amount)
+VALUES (%s, %s, %s, %s, NULL, 0.00)
+"""
+# The OPEN transaction (where return_date is NULL)
+_FIND_OPEN_LOAN = """
+SELECT t.transaction_id, t.due_date, b.genre FROM transactions t
+JOIN books b ON b.book_id = t.book_id
+WHERE t.book_id = %s AND t.member_id = %s AND t.return_date IS NULL
+ORDER BY t.transaction_id
+LIMIT 1
+"""
+# Closes a loan, unless another desk closed it meanwhile
+_CLOSE_LOAN = """
+UPDATE transactions SET return_date = %s, fine_amount = %s
+WHERE transaction_id = %s AND return_date IS NULL
+"""
+# A returned copy goes back on the shelf (available) or to a hold (held);
+# one of the two is 1. The loan was counted overdue if it was due before
+# the title's overdue_as_of.
+_RETURN_COPY = """
+UPDATE books SET available_quantity = available_quantity + %s, held_copies = held_copies + %s,
+                 on_loan = on_loan - 1,
+                 overdue_loans = overdue_loans - CASE WHEN overdue_as_of > %s THEN 1 ELSE 0 END
+WHERE book_id = %s
+"""
+
+# For the batch versions; {books} and {members} are placeholder lists
+_AVAILABILITY = "SELECT book_id, available_quantity FROM books WHERE book_id IN ({books})"
+_TAKE_COPIES = """
+UPDATE books SET available_quantity = available_quantity - %s,
+                 on_loan = on_loan + %s, lifetime_issues = lifetime_issues + %s
+WHERE book_id = %s AND available_quantity >= %s
+"""
+_OPEN_LOANS = """
+SELECT t.transaction_id, t.book_id, t.member_id, t.due_date, b.genre FROM transactions t
+JOIN books b ON b.book_id = t.book_id
+WHERE t.return_date IS NULL
+  AND t.book_id IN ({books}) AND t.member_id IN ({members})
+ORDER BY t.transaction_id
+"""
+
+# Holds (see modules/holds.py). A returned copy goes to the oldest waiting
+# hold on its title instead of back on the shelf; the copy is counted in
+# held_copies, not available_quantity, until that member collects it.
+_NEXT_HOLDS = """
+SELECT hold_id FROM holds
+WHERE book_id = %s AND status = 'waiting'
+ORDER BY hold_id
+LIMIT %s
+"""
+# Sets a copy aside for a hold, unless it was cancelled meanwhile
+_MAKE_READY = """
+UPDATE holds SET status = 'ready', ready_date = %s, expires_date = %s
+WHERE hold_id = %s AND status = 'waiting'
+"""
+# The member collects the copy set aside for them
+_CLAIM_HOLD = """
+UPDATE holds SET status = 'fulfilled', closed_date = %s
+WHERE book_id = %s AND member_id = %s AND status = 'ready'
+"""
+_READY_HOLDS = """
+SELECT hold_id, book_id FROM holds
+WHERE member_id = %s AND status = 'ready' AND book_id IN ({books})
+ORDER BY hold_id
+"""
+_FULFIL_HOLD = "UPDATE holds SET status = 'fulfilled', closed_date = %s WHERE hold_id = %s AND status = 'ready'"
+# Copies set aside for holds, collected and now on loan
+_LEND_HELD_COPIES = """
+UPDATE books SET held_copies = held_copies - %s,
+                 on_loan = on_loan + %s, lifetime_issues = lifetime_issues + %s
+WHERE book_id = %s
+"""
+# Shelf copies set aside for holds, and set-aside copies put back on the shelf
+_SET_ASIDE_COPIES = """
+UPDATE books SET available_quantity = available_quantity - %s, held_copies = held_copies + %s
+WHERE book_id = %s AND available_quantity >= %s
+"""
+_SHELVE_HELD_COPIES = """
+UPDATE books SET held_copies = held_copies - %s, available_quantity = available_quantity + %s
+WHERE book_id = %s
+"""
+_BOOK_EXISTS = "SELECT book_id FROM books WHERE book_id = %s"
+_MEMBER_EXISTS = "SELECT member_id FROM members WHERE member_id = %s"
+
+# Why _issue_book refused an issue, and what to tell the user. Only
+# NO_COPY is worth a hold.
+NO_SUCH_MEMBER = 'no_such_member'
+NO_SUCH_BOOK = 'no_such_book'
+NO_COPY = 'no_copy'
+REFUSALS = {
+    NO_SUCH_MEMBER: "No member has this ID.",
+    NO_SUCH_BOOK: "No book has this ID.",
+    NO_COPY: "No copy of this book is free.",
+}
+
+class _Conflict(Exception):
+    """Another desk changed the rows between our read and our write."""
+
+class _CommitUnknown(Exception):
+    """The connection was lost during commit: the transaction may or may not have been applied."""
+
+class _Committing:
+    """A connection that notes when work() starts its commit, so a lost
+    connection can be told apart: before the commit the server rolls the
+    transaction back, during it nobody knows."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.commit_started = False
+
+    def commit(self):
+        self.commit_started = True
+        return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+# How often transactions had to be retried, for load tests and monitoring
+_stats_lock = threading.Lock()
+_stats = {'transactions': 0, 'retries': 0, 'conflicts': 0, 'lock_errors': 0, 'disconnects': 0, 'failures': 0}
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def transaction_stats():
+    """Returns the counters: transactions run, retries, and why they were needed.
+
+    conflicts are lost races caught by our conditional updates; lock_errors
+    are deadlocks, lock wait timeouts and "database is locked" errors;
+    disconnects are connections lost before commit; failures are
+    transactions that gave up with an error.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+registry.register_collector('lms_transactions', transaction_stats)
+
+def _run_transaction(description, work, on_error, timeout=None):
+    """Runs work(conn, cursor) on a pooled connection, retrying on conflicts.
+
+    work() does its own commit and returns the result. If it loses a race
+    (a _Conflict, a deadlock or a lock timeout) or the connection before
+    its commit, everything is rolled back and it is run again after a
+    short random backoff. Any other error, or running out of attempts,
+    returns on_error(exception). That exception is a ConnectionError if
+    the database could not be reached (no connection within `timeout`
+    seconds, when given, or every attempt lost its connection) and nothing
+    was applied; it is a _CommitUnknown if the connection was lost during
+    the commit.
+    """
+    backend = get_backend()
+    _count('transactions')
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        with pooled_connection(timeout) as pooled:
+            if not pooled:
+                _count('failures')
+                return on_error(ConnectionError("Database connection failed."))
+            conn = _Committing(pooled)
+            cursor = conn.cursor()
+            disconnected = False
+            try:
+                return work(conn, cursor)
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass  # The connection is gone; the pool discards it on checkin
+                disconnected = backend.is_disconnect(e)
+                if disconnected and conn.commit_started:
+                    _count('failures')
+                    log.error("Lost the database connection during commit", action=description, error=str(e))
+                    return on_error(_CommitUnknown(f"Lost the database connection while saving: {e}"))
+                if isinstance(e, _Conflict):
+                    _count('conflicts')
+                elif backend.is_retryable(e):
+                    _count('lock_errors')
+                elif disconnected:
+                    _count('disconnects')
+                else:
+                    _count('failures')
+                    log.error("Transaction failed", action=description, error=str(e))
+                    return on_error(e)
+                if attempt == MAX_ATTEMPTS:
+                    _count('failures')
+                    log.error("Transaction gave up after retries", action=description,
+                              attempts=attempt, error=str(e))
+                    return on_error(ConnectionError(f"Lost the database connection: {e}") if disconnected else e)
+                log.debug("Retrying transaction", action=description, attempt=attempt, error=str(e))
+                _count('retries')
+            finally:
+                if not disconnected:
+                    cursor.close()
+        # Back off a little so the competing transactions don't collide again
+        time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+@instrumented
 def issue_book(book_id, member_id):
     """Issues a book to a member and creates a transaction record."""
-    
-    # Set issue date and a 14-day due date
-    issue_date = datetime.date.today()
-    due_date = issue_date + datetime.timedelta(days=14)
-    
-    conn = create_connection()
-    if not conn:
-        return False
-        
-    cursor = conn.cursor()
-    
-    try:
-        # 1. Check if the book is available
-        cursor.execute("SELECT available_quantity FROM books WHERE book_id = %s", (book_id,))
-        result = cursor.fetchone()
-        
-        if not result or result[0] <= 0:
-            print(f"Error: Book ID {book_id} is not available for issue.")
-            return False
-            
-        # 2. Decrement the book's available quantity
-        update_book_query = "UPDATE books SET available_quantity = available_quantity - 1 WHERE book_id = %s"
-        cursor.execute(update_book_query, (book_id,))
-        
-        # 3. Create the new transaction record
-        insert_trans_query = """
-        INSERT INTO transactions (book_id, member_id, issue_date, due_date, return_date, fine_amount)
-        VALUES (%s, %s, %s, %s, NULL, 0.00)
-        """
-        cursor.execute(insert_trans_query, (book_id, member_id, issue_date, due_date))
+    return _issue_book(book_id, member_id, datetime.date.today(), on_error=lambda e: False)
+
+@instrumented
+def return_book(book_id, member_id):
+    """Returns a book, marks the transaction complete, and calculates fine."""
+    return _return_book(book_id, member_id, datetime.date.today(), on_error=lambda e: False)
+
+def _issue_book(book_id, member_id, issue_date, on_error, timeout=None, on_refused=None):
+    """issue_book as of `issue_date`; returns on_error(exception) if the
+    transaction fails, and on_refused(reason) (default False) if the member
+    or book doesn't exist or no copy is free (see REFUSALS). `timeout`
+    caps the wait for a pooled connection."""
+    refused = on_refused or (lambda reason: False)
+
+    def work(conn, cursor):
+        cursor.execute(_MEMBER_EXISTS, (member_id,))
+        if cursor.fetchone() is None:
+            log.warning("No such member to issue to", book_id=book_id, member_id=member_id)
+            return refused(NO_SUCH_MEMBER)
+        due_date = _issue_one(cursor, book_id, member_id, issue_date)
+        if due_date is None:
+            cursor.execute(_BOOK_EXISTS, (book_id,))
+            reason = NO_COPY if cursor.fetchone() else NO_SUCH_BOOK
+            log.warning("Book not available for issue", book_id=book_id, member_id=member_id, reason=reason)
+            return refused(reason)
         
         # If all steps succeeded, commit the changes
         conn.commit()
-        print(f"Success: Book ID {book_id} issued to member ID {member_id}.")
+        lookup_cache.invalidate(('book', book_id))  # Its counters changed
+        log.info("Issued book", book_id=book_id, member_id=member_id, due_date=due_date)
         return True
-        
-    except Exception as e:
-        # If any step fails, roll back all changes
-        print(f"Error during book issue: {e}")
-        conn.rollback()
-        return False
-    finally:
-        cursor.close()
-        close_connection(conn)
 
-def return_book(book_id, member_id):
-    """Returns a book, marks the transaction complete, and calculates fine."""
-    
-    conn = create_connection()
-    if not conn:
-        return False
-        
-    cursor = conn.cursor()
-    
-    try:
-        # 1. Find the OPEN transaction (where return_date is NULL)
-        find_trans_query = """
-        SELECT transaction_id, due_date FROM transactions 
-        WHERE book_id = %s AND member_id = %s AND return_date IS NULL
-        """
-        cursor.execute(find_trans_query, (book_id, member_id))
-        trans = cursor.fetchone()
-        
-        if not trans:
-            print(f"Error: No active issue record found for book ID {book_id} and member ID {member_id}.")
+    return _run_transaction("book issue", work, on_error, timeout)
+
+def _return_book(book_id, member_id, return_date, on_error, timeout=None):
+    """return_book as of `return_date`; returns on_error(exception) if the
+    transaction fails. `timeout` caps the wait for a pooled connection."""
+
+    def work(conn, cursor):
+        fine = _return_one(cursor, book_id, member_id, return_date)
+        if fine is None:
+            log.warning("No open loan to return", book_id=book_id, member_id=member_id)
             return False
-            
-        transaction_id = trans[0]
-        due_date = trans[1]
-        
-        # 2. Calculate fine
-        today = datetime.date.today()
-        fine = 0.00
-        if today > due_date:
-            # We need the fine_per_day from config
-            # Let's import it (or you can pass it as an argument)
-            from utils.config import FINE_PER_DAY
-            days_overdue = (today - due_date).days
-            fine = days_overdue * FINE_PER_DAY
-            
-        # 3. Update the transaction with return date and fine
-        update_trans_query = "UPDATE transactions SET return_date = %s, fine_amount = %s WHERE transaction_id = %s"
-        cursor.execute(update_trans_query, (today, fine, transaction_id))
-        
-        # 4. Increment the book's available quantity
-        update_book_query = "UPDATE books SET available_quantity = available_quantity + 1 WHERE book_id = %s"
-        cursor.execute(update_book_query, (book_id,))
         
         # If all steps succeeded, commit
         conn.commit()
-        print(f"Success: Book ID {book_id} returned by member ID {member_id}. Fine: {fine}")
+        lookup_cache.invalidate(('book', book_id))  # Its counters changed
+        log.info("Returned book", book_id=book_id, member_id=member_id, fine=fine)
         return True
 
-    except Exception as e:
-        print(f"Error during book return: {e}")
-        conn.rollback()
-        return False
-    finally:
-        cursor.close()
-        close_connection(conn)
+    return _run_transaction("book return", work, on_error, timeout)
+
+def _issue_one(cursor, book_id, member_id, issue_date):
+    """Issues one copy inside the caller's transaction.
+
+    Returns the due date, or None (with nothing changed) if no copy is free.
+    """
+    # 1. Collect the copy set aside for the member's hold, if there is
+    #    one; otherwise take a copy only if one is left
+    cursor.execute(_CLAIM_HOLD, (issue_date, book_id, member_id))
+    if cursor.rowcount:
+        cursor.execute(_LEND_HELD_COPIES, (1, 1, 1, book_id))
+    else:
+        cursor.execute(_TAKE_COPY, (book_id,))
+        if cursor.rowcount == 0:
+            return None
+
+    # 2. Create the new transaction record, due LOAN_DAYS after issue
+    due_date = issue_date + datetime.timedelta(days=LOAN_DAYS)
+    cursor.execute(_INSERT_LOAN, (book_id, member_id, issue_date, due_date))
+    return due_date
+
+def _return_one(cursor, book_id, member_id, return_date):
+    """Closes the member's open loan of a book inside the caller's transaction.
+
+    Returns the fine, or None (with nothing changed) if there is no open loan.
+    """
+    # 1. Find the OPEN transaction (where return_date is NULL)
+    cursor.execute(_FIND_OPEN_LOAN, (book_id, member_id))
+    trans = cursor.fetchone()
+    if not trans:
+        return None
+    transaction_id, due_date, genre = trans[0], trans[1], trans[2]
+
+    # 2. Calculate fine
+    fine = calculate_fine(due_date, return_date, genre)
+
+    # 3. Close the transaction, unless another desk closed it meanwhile
+    cursor.execute(_CLOSE_LOAN, (return_date, fine, transaction_id))
+    if cursor.rowcount == 0:
+        raise _Conflict(f"transaction {transaction_id} was closed concurrently")
+
+    # 4. Give the copy to the next hold, or put it back on the shelf. A hold
+    #    gets its pickup days from today, even for a return dated earlier.
+    shelved = _allocate_copies(cursor, book_id, 1, datetime.date.today())
+    cursor.execute(_RETURN_COPY, (shelved, 1 - shelved, due_date, book_id))
+    return fine
+
+def _pickup_deadline(today):
+    """The last day a copy set aside today waits for its member."""
+    return today + datetime.timedelta(days=HOLD_CONFIG['pickup_days'])
+
+def _ready_rows(hold_rows, today):
+    """_MAKE_READY parameters for the (hold_id,) rows of _NEXT_HOLDS."""
+    expires_date = _pickup_deadline(today)
+    return [(today, expires_date, row[0]) for row in hold_rows]
+
+def _allocate_copies(cursor, book_id, copies, today):
+    """Sets up to `copies` copies of a title aside for its oldest waiting holds.
+
+    Runs inside the caller's transaction. Returns how many copies are left
+    over for the shelf (the caller puts those back).
+    """
+    cursor.execute(_NEXT_HOLDS, (book_id, copies))
+    ready = _ready_rows(cursor.fetchall(), today)
+    if ready:
+        cursor.executemany(_MAKE_READY, ready)
+        if cursor.rowcount != len(ready):
+            raise _Conflict("a hold was cancelled while copies were set aside")
+        log.info("Set copies aside for holds", book_id=book_id, holds=len(ready))
+    return copies - len(ready)
+
+def _in_list(values):
+    """Returns '%s, %s, ...' for an IN (...) clause with len(values) items."""
+    return ', '.join(['%s'] * len(values))
+
+def _plan_issue(book_ids, available, due_date, held=None):
+    """Hands out copies in cart order (a title can be in the cart twice).
+
+    `available` maps book_id -> available_quantity, and `held` book_id ->
+    hold_ids of the member's ready holds (copies set aside for them), which
+    are used first. Returns the result dicts, a Counter of copies to take
+    from the shelf per title, and the (hold_id, book_id) of holds collected.
+    """
+    results, taken, collected = [], Counter(), []
+    held = {book_id: list(hold_ids) for book_id, hold_ids in (held or {}).items()}
+    for book_id in book_ids:
+        if held.get(book_id):
+            collected.append((held[book_id].pop(0), book_id))
+            results.append({'book_id': book_id, 'success': True, 'message': f"Due {due_date} (was on hold)."})
+        elif book_id not in available:
+            results.append({'book_id': book_id, 'success': False, 'message': "No such book."})
+        elif available[book_id] - taken[book_id] <= 0:
+            results.append({'book_id': book_id, 'success': False, 'message': "Not available for issue."})
+        else:
+            taken[book_id] += 1
+            results.append({'book_id': book_id, 'success': True, 'message': f"Due {due_date}."})
+    return results, taken, collected
+
+def _held_by_title(ready_hold_rows):
+    """Groups the (hold_id, book_id) rows of _READY_HOLDS by title, oldest first."""
+    held = defaultdict(list)
+    for hold_id, book_id in ready_hold_rows:
+        held[book_id].append(hold_id)
+    return held
+
+def _return_rows(book_id, due_dates, shelved):
+    """_RETURN_COPY parameters for the loans of one title coming back, the
+    first `shelved` copies to the shelf and the rest to holds."""
+    return [(1, 0, due_date, book_id) if i < shelved else (0, 1, due_date, book_id)
+            for i, due_date in enumerate(due_dates)]
+
+def _failed_return(book_id, member_id, message):
+    return {'book_id': book_id, 'member_id': member_id, 'success': False, 'fine': 0.00, 'message': message}
+
+def _plan_return(items, open_loan_rows, today):
+    """Matches each cart item to an open loan and works out its fine.
+
+    Returns the result dicts, the (return_date, fine, transaction_id)
+    rows to close, and the due dates of the loans returned per title.
+    """
+    open_loans = defaultdict(list)  # (book_id, member_id) -> oldest loan first
+    for transaction_id, book_id, member_id, due_date, genre in open_loan_rows:
+        open_loans[(book_id, member_id)].append((transaction_id, due_date, genre))
+
+    results, closed, returned = [], [], defaultdict(list)
+    for book_id, member_id in items:
+        loans = open_loans.get((book_id, member_id))
+        if not loans:
+            results.append(_failed_return(book_id, member_id, "No active issue record found."))
+            continue
+        transaction_id, due_date, genre = loans.pop(0)
+        fine = calculate_fine(due_date, today, genre)
+        closed.append((today, fine, transaction_id))
+        returned[book_id].append(due_date)
+        results.append({'book_id': book_id, 'member_id': member_id, 'success': True,
+                        'fine': fine, 'message': f"Fine: {fine}"})
+    return results, closed, returned
+
+@instrumented
+def issue_books(member_id, book_ids):
+    """Issues a whole cart of books to one member in a single transaction.
+
+    Availability of every title is checked with one query. Titles that are
+    missing or out of copies are skipped; the rest are issued together.
+    Returns one result dict per requested book, in order:
+    {'book_id': ..., 'success': True/False, 'message': ...}.
+    """
+    issue_date = datetime.date.today()
+    due_date = issue_date + datetime.timedelta(days=LOAN_DAYS)
+    book_ids = list(book_ids)
+    if not book_ids:
+        return []
+
+    def work(conn, cursor):
+        # 1. Read availability of every distinct title at once, and the
+        #    copies already set aside for this member's holds
+        distinct_ids = list(dict.fromkeys(book_ids))
+        cursor.execute(_AVAILABILITY.format(books=_in_list(distinct_ids)), tuple(distinct_ids))
+        available = dict(cursor.fetchall())
+        cursor.execute(_READY_HOLDS.format(books=_in_list(distinct_ids)), (member_id,) + tuple(distinct_ids))
+        held = _held_by_title(cursor.fetchall())
+
+        # 2. Hand out copies in cart order
+        results, taken, collected = _plan_issue(book_ids, available, due_date, held)
+        lent = Counter(book_id for _, book_id in collected)
+
+        if collected:
+            # 3. Collect the copies set aside for the member (if still set aside)
+            cursor.executemany(_FULFIL_HOLD, [(issue_date, hold_id) for hold_id, _ in collected])
+            if cursor.rowcount != len(collected):
+                raise _Conflict("a hold changed during batch issue")
+            cursor.executemany(_LEND_HELD_COPIES, [(n, n, n, book_id) for book_id, n in lent.items()])
+        if taken:
+            # 4. Take the copies, one conditional decrement per title. If any
+            #    title no longer has the copies we read, another desk got there
+            #    first: roll back and plan the cart again from fresh numbers.
+            cursor.executemany(_TAKE_COPIES, [(n, n, n, book_id, n) for book_id, n in taken.items()])
+            if cursor.rowcount != len(taken):
+                raise _Conflict("availability changed during batch issue")
+        if taken or collected:
+            cursor.executemany(_INSERT_LOAN, [(r['book_id'], member_id, issue_date, due_date) for r in results if r['success']])
+            conn.commit()
+            lookup_cache.invalidate(*[('book', book_id) for book_id in taken.keys() | lent.keys()])
+
+        log.info("Issued books", member_id=member_id, issued=sum(taken.values()) + len(collected),
+                 requested=len(book_ids))
+        return results
+
+    return _run_transaction(
+        "batch issue", work,
+        on_error=lambda e: [{'book_id': b, 'success': False, 'message': f"Error: {e}"} for b in book_ids])
+
+@instrumented
+def return_books(items):
+    """Returns a cart of (book_id, member_id) pairs in a single transaction.
+
+    Open loans for the whole cart are found with one query. Returns one
+    result dict per item, in order:
+    {'book_id': ..., 'member_id': ..., 'success': True/False, 'fine': ..., 'message': ...}.
+    """
+    items = list(items)
+    if not items:
+        return []
+    today = datetime.date.today()
+
+    def work(conn, cursor):
+        # 1. Find every open loan for the books and members in the cart
+        book_ids = list({b for b, _ in items})
+        member_ids = list({m for _, m in items})
+        cursor.execute(_OPEN_LOANS.format(books=_in_list(book_ids), members=_in_list(member_ids)),
+                       tuple(book_ids) + tuple(member_ids))
+
+        # 2. Match each cart item to an open loan and work out its fine
+        results, closed, returned = _plan_return(items, cursor.fetchall(), today)
+
+        if closed:
+            # 3. Close the loans (only ones still open) and put the copies back
+            cursor.executemany(_CLOSE_LOAN, closed)
+            if cursor.rowcount != len(closed):
+                raise _Conflict("a loan was closed concurrently during batch return")
+            # 4. Copies go to waiting holds first; the rest back on the shelf
+            rows = []
+            for book_id, due_dates in returned.items():
+                shelved = _allocate_copies(cursor, book_id, len(due_dates), today)
+                rows.extend(_return_rows(book_id, due_dates, shelved))
+            cursor.executemany(_RETURN_COPY, rows)
+            conn.commit()
+            lookup_cache.invalidate(*[('book', book_id) for book_id in returned])
+
+        log.info("Returned books", returned=len(closed), requested=len(items))
+        return results
+
+    return _run_transaction("batch return", work,
+                            on_error=lambda e: [_failed_return(b, m, f"Error: {e}") for b, m in items])
 
 # --- Test block ---
 if __name__ == '__main__':
+    configure_logging()
     # We must import our other modules to create data for the test
     from modules.book_management import add_book, search_book, remove_book
     from modules.member_management import register_member, view_member_details
     # We will also need a way to remove members, let's add a quick helper
     
     def simple_remove_member(member_id):
-        conn = create_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM members WHERE member_id = %s", (member_id,))
-        conn.commit()
-        cursor.close()
-        close_connection(conn)
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM members WHERE member_id = %s", (member_id,))
+            conn.commit()
+            cursor.close()
 
     print("--- Testing Issue/Return System ---")
     
@@ -146,7 +579,7 @@ if __name__ == '__main__':
 
     # 5. Try to issue again (should fail)
     print("\nIssuing the same book again (should fail)...")
-    issue_book(book_id, member_id) # Should print an error
+    issue_book(book_id, member_id) # Should log a warning
     
     # 6. Return the book
     print("\nReturning the book...")
@@ -159,12 +592,11 @@ if __name__ == '__main__':
     # 8. Clean up
     print("\nCleaning up test data...")
     # Must remove transactions first due to foreign key constraints
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM transactions WHERE book_id = %s", (book_id,))
-    conn.commit()
-    cursor.close()
-    close_connection(conn)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM transactions WHERE book_id = %s", (book_id,))
+        conn.commit()
+        cursor.close()
     
     remove_book(book_id)
     simple_remove_member(member_id)
@@ -1,63 +1,110 @@
 # This is 'modules/login_system.py'
+#
+# Logging in. Passwords are checked with the salted hashes from
+# utils/passwords.py; old SHA-256 hashes are upgraded the first time their
+# user logs in. login() also starts a session (utils/sessions.py), and
+# authenticate(token) checks one without touching the database.
 
-import hashlib
 # We need to import the connection functions from our database module
-from database.db_connection import create_connection, close_connection
+from database.db_connection import pooled_connection
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+from utils.passwords import hash_password, verify_password, needs_rehash, burn_time
+from utils.sessions import sessions
 
-def hash_password(password):
-    """Hashes a password using SHA-256 for secure storage."""
-    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+log = get_logger(__name__)
 
-def verify_login(username, password):
-    """Checks user credentials against the database."""
-    
-    # Hash the provided password to compare with the one in the DB
-    hashed_pass_to_check = hash_password(password)
-    
-    conn = create_connection()
-    if not conn:
-        # This is a better error message
-        print("Database connection failed. Check config and MySQL service.")
-        return False 
-
-    cursor = conn.cursor()
-    
-    # Use a parameterized query to prevent SQL injection
-    query = "SELECT password_hash FROM users WHERE username = %s"
-    
+def _find_user(username):
+    """Returns (user_id, password_hash) for a username, or None. Raises if the DB is down."""
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Database connection failed. Check config and MySQL service.")
+        cursor = conn.cursor()
+        try:
+            # Use a parameterized query to prevent SQL injection
+            cursor.execute("SELECT user_id, password_hash FROM users WHERE username = %s", (username,))
+            return cursor.fetchone() # Get the first matching record
+        finally:
+            cursor.close()
+
+def _upgrade_hash(user_id, old_hash, password):
+    """Stores a fresh hash for a user whose hash is legacy or uses an old cost."""
+    new_hash = hash_password(password)
+    with pooled_connection() as conn:
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            # Only if nobody changed the password meanwhile
+            cursor.execute("UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s",
+                           (new_hash, user_id, old_hash))
+            conn.commit()
+            log.info("Upgraded password hash", user_id=user_id)
+        except Exception as e:
+            conn.rollback()
+            log.warning("Could not upgrade password hash", user_id=user_id, error=str(e))
+        finally:
+            cursor.close()
+
+def _check_credentials(username, password):
+    """Returns the user_id if the username and password match, else None."""
     try:
-        cursor.execute(query, (username,))
-        result = cursor.fetchone() # Get the first matching record
-        
-        if result:
-            # result[0] contains the password_hash from the DB
-            stored_password_hash = result[0] 
-            
-            if stored_password_hash == hashed_pass_to_check:
-                print(f"Login successful. Welcome, {username}!")
-                return True
-            else:
-                print("Invalid password.")
-                return False
-        else:
-            print("Invalid username.")
-            return False
-            
+        user = _find_user(username)
     except Exception as e:
-        print(f"An error occurred during login: {e}")
-        return False
-    finally:
-        # Always close the cursor and connection
-        cursor.close()
-        close_connection(conn)
+        log.error("Could not check login", username=username, error=str(e))
+        return None
+
+    if not user:
+        burn_time(password)  # Take as long as a wrong password would
+        log.warning("Login failed: invalid username", username=username)
+        return None
+
+    # The hash is checked after the connection went back to the pool: it
+    # takes a deliberate fraction of a second and shouldn't hold one
+    user_id, stored_hash = user[0], user[1]
+    if not verify_password(password, stored_hash):
+        log.warning("Login failed: invalid password", username=username)
+        return None
+
+    if needs_rehash(stored_hash):
+        _upgrade_hash(user_id, stored_hash, password)
+    log.info("Login successful", username=username)
+    return user_id
+
+@instrumented
+def verify_login(username, password):
+    """Checks user credentials against the database."""
+    return _check_credentials(username, password) is not None
+
+@instrumented
+def login(username, password):
+    """Checks the credentials and starts a session; returns its token, or None."""
+    user_id = _check_credentials(username, password)
+    if user_id is None:
+        return None
+    return sessions.create(user_id, username)
+
+def authenticate(token):
+    """Returns the session for a token as a dict, or None if it is unknown or expired.
+
+    No password hashing and no database query: this is what every request
+    after the login should use.
+    """
+    session = sessions.get(token)
+    return session.as_dict() if session is not None else None
+
+def logout(token):
+    """Ends a session; True if it was active."""
+    return sessions.revoke(token)
 
 # --- Test block ---
 # This code runs ONLY when you run this file directly
 if __name__ == '__main__':
+    configure_logging()
     print("--- Testing Login System ---")
-    
+
     # Test 1: Successful Admin Login
-    # (Remember we created 'admin' with password 'admin' in the SQL script)
+    # (The migrations create 'admin' with password 'admin')
     print("\nAttempting 'admin' with 'admin' (should work):")
     verify_login('admin', 'admin')
 
@@ -67,4 +114,11 @@ if __name__ == '__main__':
 
     # Test 3: Failed Login (Wrong Username)
     print("\nAttempting 'notauser' with 'admin' (should fail):")
-    verify_login('notauser', 'admin')
\ No newline at end of file
+    verify_login('notauser', 'admin')
+
+    # Test 4: Sessions
+    print("\nLogging in and checking the session token:")
+    token = login('admin', 'admin')
+    print(f"  > Session: {authenticate(token)}")
+    logout(token)
+    print(f"  > After logout: {authenticate(token)}")
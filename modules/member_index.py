@@ -0,0 +1,355 @@
+# This is 'modules/member_index.py'
+#
+# An in-memory lookup index over the members, so the desk finds a member
+# even when the name is misspelled ('Smyth' finds 'Smith'), half typed
+# ('patt' finds 'Pattersen'), or given as a phone number in any format
+# ('+1 (555) 000-0032' finds '5550000032').
+#
+# Names and the part of the email before the '@' are split into words.
+# A query word matches an indexed word exactly, as a prefix, or through
+# shared trigrams (three-letter pieces: 'smith' -> '  s', ' sm', 'smi',
+# 'mit', 'ith', 'th '). Trigrams index the distinct words, not the
+# members, so a lookup only compares against the vocabulary (tens of
+# thousands of surnames even for millions of members) and then reads the
+# members of the words that matched.
+#
+# save() / load() keep a snapshot on disk so a restart doesn't have to
+# read every member again (see MEMBER_INDEX_CONFIG in utils/config.py);
+# it records as_of, so the members changed since can be caught up on
+# through index_changes (modules/index_changes.py).
+
+import bisect
+import heapq
+import math
+from collections import Counter
+import os
+import pickle
+import re
+import threading
+
+from modules.search_index import tokenize
+
+SNAPSHOT_VERSION = 3
+
+# How much a match in each field counts towards a member's rank
+FIELD_WEIGHTS = {'name': 1.0, 'email': 0.6}
+# How much each kind of word match counts (times the field weight)
+EXACT_MATCH, PREFIX_MATCH, FUZZY_MATCH = 1.0, 0.8, 0.7
+EMAIL_MATCH, PHONE_MATCH, PHONE_SUFFIX_MATCH = 10.0, 10.0, 5.0
+MAX_PREFIX_WORDS = 500  # Words a short prefix may expand to
+PHONE_DIGITS = 10       # Compare the last 10 digits, so country codes don't matter
+PHONE_SUFFIX = 4        # Digits a partial phone number needs
+
+_DIGITS_RE = re.compile(r"\D")
+_DIGITS_ONLY_RE = re.compile(r"\d+")
+_LETTERS_RE = re.compile(r"[^\W\d_]")
+
+
+def normalize_phone(phone):
+    """Keeps only the digits, at most the last PHONE_DIGITS of them."""
+    if not phone:
+        return ''
+    return _DIGITS_RE.sub('', str(phone))[-PHONE_DIGITS:]
+
+
+def trigrams(word):
+    """The set of three-character pieces of a word, padded at both ends."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _indexed_trigrams(word):
+    """The trigrams kept in the index: all but '  x', the first letter alone.
+
+    Thousands of words share each first letter, so counting that trigram
+    through the index would be most of a lookup's work; _match_term()
+    compares first letters instead.
+    """
+    return trigrams(word) - {f"  {word[0]}"}
+
+
+def _email_words(email):
+    """The words of the part before the '@', without digits ('jon.smith82' -> jon, smith).
+
+    Digits are left out so addresses like smith82 and smith1990 don't each
+    add a word of their own, which would grow the vocabulary by one word
+    per member and slow down every fuzzy lookup.
+    """
+    if not email:
+        return []
+    local = str(email).split('@', 1)[0]
+    return [word for word in tokenize(_DIGITS_ONLY_RE.sub(' ', local)) if len(word) > 1]
+
+
+class MemberLookupIndex:
+    """Word, trigram, email and phone lookups over members; thread-safe.
+
+    Documents are dicts with member_id, name, email and phone_number keys
+    (a members row works).
+    """
+
+    def __init__(self, min_similarity=0.45):
+        self.min_similarity = min_similarity  # Least trigram similarity for a fuzzy match
+        self._lock = threading.RLock()
+        self._postings = {}    # word -> {member_id: field weight}
+        self._trigrams = {}    # trigram -> set of words
+        self._vocabulary = []  # Sorted words, for prefix lookups
+        self._emails = {}      # lowercased email -> set of member_ids
+        self._phones = {}      # normalized phone -> set of member_ids
+        self._phone_tails = {} # last PHONE_SUFFIX digits -> set of member_ids
+        self._docs = {}        # member_id -> (name, email, phone), needed to un-index
+        self.as_of = None      # Database time it was current at, for catching up from a snapshot
+        self.changed = False   # Changed since it was built or loaded
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Keeping the index in sync ---
+
+    def add(self, member):
+        """Indexes (or re-indexes) one member."""
+        with self._lock:
+            for word in self._add(member):
+                bisect.insort(self._vocabulary, word)
+            self.changed = True
+
+    def add_many(self, members):
+        """Indexes many members at once; much faster than add() for a full load."""
+        with self._lock:
+            new_words = []
+            for member in members:
+                new_words.extend(self._add(member))
+            if new_words:
+                self._vocabulary = sorted(set(self._vocabulary).union(new_words))
+            self.changed = True
+
+    def update(self, member_id, **changes):
+        """Re-indexes a member with some fields changed (name, email, phone_number)."""
+        with self._lock:
+            current = self._docs.get(member_id)
+            if current is None:
+                return
+            member = {'member_id': member_id, 'name': current[0], 'email': current[1],
+                      'phone_number': current[2]}
+            member.update(changes)
+            self.add(member)
+
+    def remove(self, member_id):
+        with self._lock:
+            if member_id in self._docs:
+                self._unindex(member_id)
+                del self._docs[member_id]
+                self.changed = True
+
+    def _add(self, member):
+        """Indexes one member and returns words that were not in the vocabulary."""
+        member_id = member['member_id']
+        if member_id in self._docs:
+            self._unindex(member_id)
+        name, email, phone = member.get('name') or '', member.get('email') or '', member.get('phone_number') or ''
+        self._docs[member_id] = (name, email, phone)
+
+        weights = {}
+        for word in tokenize(name):
+            weights[word] = FIELD_WEIGHTS['name']
+        for word in _email_words(email):
+            weights.setdefault(word, FIELD_WEIGHTS['email'])
+        new_words = []
+        for word, weight in weights.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                new_words.append(word)
+                for gram in _indexed_trigrams(word):
+                    self._trigrams.setdefault(gram, set()).add(word)
+            postings[member_id] = weight
+
+        if email:
+            self._emails.setdefault(email.strip().lower(), set()).add(member_id)
+        digits = normalize_phone(phone)
+        if digits:
+            self._phones.setdefault(digits, set()).add(member_id)
+            self._phone_tails.setdefault(digits[-PHONE_SUFFIX:], set()).add(member_id)
+        return new_words
+
+    def _unindex(self, member_id):
+        name, email, phone = self._docs[member_id]
+        for word in set(tokenize(name)) | set(_email_words(email)):
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.pop(member_id, None)
+            if not postings:
+                del self._postings[word]
+                for gram in _indexed_trigrams(word):
+                    words = self._trigrams.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self._trigrams[gram]
+                pos = bisect.bisect_left(self._vocabulary, word)
+                if pos < len(self._vocabulary) and self._vocabulary[pos] == word:
+                    del self._vocabulary[pos]
+        _discard(self._emails, email.strip().lower(), member_id)
+        digits = normalize_phone(phone)
+        if digits:
+            _discard(self._phones, digits, member_id)
+            _discard(self._phone_tails, digits[-PHONE_SUFFIX:], member_id)
+
+    # --- Queries ---
+
+    def search(self, query, limit=None):
+        """Returns member_ids matching the query, best first.
+
+        An exact email or phone number ranks first; otherwise members
+        score for every query word that matches one of their words, so
+        members matching all the words come before those matching some.
+        """
+        scores = self._score(query)
+        if limit:
+            return [key[1] for key in heapq.nsmallest(limit, _rank_keys(scores))]
+        return [key[1] for key in sorted(_rank_keys(scores))]
+
+    def search_page(self, query, after=None, limit=50):
+        """Returns one page of search() as (member_ids, next_cursor); see
+        BookSearchIndex.search_page."""
+        keys = _rank_keys(self._score(query))
+        if after is not None:
+            after = tuple(after)
+            keys = (key for key in keys if key > after)
+        page = heapq.nsmallest(limit + 1, keys)
+        next_cursor = page[limit - 1] if len(page) > limit else None
+        return [key[1] for key in page[:limit]], next_cursor
+
+    def _score(self, query):
+        """Returns {member_id: score} for every member matching the query."""
+        query = str(query or '').strip()
+        if not query:
+            return {}
+        with self._lock:
+            if '@' in query:
+                hits = self._emails.get(query.lower())
+                if hits:
+                    return dict.fromkeys(hits, EMAIL_MATCH)
+
+            scores = {}
+            if not _LETTERS_RE.search(query):
+                scores.update(self._match_phone(normalize_phone(query)))
+
+            for term in set(tokenize(query)):
+                best = {}  # member_id -> best match of this term
+                for word, similarity in self._match_term(term).items():
+                    for member_id, weight in self._postings[word].items():
+                        value = similarity * weight
+                        if value > best.get(member_id, 0.0):
+                            best[member_id] = value
+                for member_id, value in best.items():
+                    scores[member_id] = scores.get(member_id, 0.0) + value
+            return scores
+
+    def _match_term(self, term):
+        """Returns {word: similarity} for the indexed words that match `term`."""
+        matches = {}
+        # Prefixes (which include the word itself)
+        pos = bisect.bisect_left(self._vocabulary, term)
+        end = min(len(self._vocabulary), pos + MAX_PREFIX_WORDS)
+        while pos < end and self._vocabulary[pos].startswith(term):
+            word = self._vocabulary[pos]
+            matches[word] = EXACT_MATCH if word == term else PREFIX_MATCH
+            pos += 1
+
+        # Misspellings, from the trigrams the words share with the term. A
+        # term that is itself a word is taken as typed: with enough members
+        # almost every misspelling of a name is somebody's real name.
+        if len(term) >= 3 and matches.get(term) != EXACT_MATCH:
+            matches.update((word, FUZZY_MATCH * similarity) for word, similarity in self._similar_words(term)
+                           if word not in matches)
+        return matches
+
+    def _similar_words(self, term):
+        """Yields (word, similarity) for the words at least min_similarity like `term`.
+
+        Similarity is Dice's 2|A∩B| / (|A|+|B|) over the trigram sets; a
+        word of length n has n+2 trigrams. A word sharing c trigrams scores
+        at most 2c / (|A|+c), so it needs `least` of them. A word with that
+        many must be in one of the len(indexed) - needed + 1 rarest trigram
+        lists, so only those are counted through; the few common lists
+        (thousands of words each) are only asked about those candidates.
+        """
+        grams = trigrams(term)
+        least = math.ceil(self.min_similarity * len(grams) / (2 - self.min_similarity))
+        # Indexed trigrams needed if the first letter matches (see _indexed_trigrams)
+        needed = max(1, least - 1)
+        indexed = sorted(_indexed_trigrams(term), key=lambda gram: len(self._trigrams.get(gram, ())))
+        rare, common = indexed[:len(indexed) - needed + 1], indexed[len(indexed) - needed + 1:]
+
+        shared = Counter()
+        for gram in rare:
+            shared.update(self._trigrams.get(gram, ()))
+        for gram in common:
+            shared.update(shared.keys() & self._trigrams.get(gram, set()))
+        for word, count in [(word, count) for word, count in shared.items() if count >= needed]:
+            count += word[0] == term[0]
+            if count >= least:
+                similarity = 2 * count / (len(grams) + len(word) + 2)
+                if similarity >= self.min_similarity:
+                    yield word, similarity
+
+    def _match_phone(self, digits):
+        if len(digits) < PHONE_SUFFIX:
+            return {}
+        exact = self._phones.get(digits)
+        if exact:
+            return dict.fromkeys(exact, PHONE_MATCH)
+        # The end of a number, e.g. the last 4 digits a member reads out
+        return {member_id: PHONE_SUFFIX_MATCH for member_id in self._phone_tails.get(digits[-PHONE_SUFFIX:], ())
+                if self._docs[member_id][2] and normalize_phone(self._docs[member_id][2]).endswith(digits)}
+
+    # --- Snapshots ---
+
+    def save(self, path):
+        """Writes the index to `path` (atomically: a reader never sees half a file)."""
+        with self._lock:
+            state = {'version': SNAPSHOT_VERSION, 'min_similarity': self.min_similarity,
+                     'docs': self._docs, 'postings': self._postings, 'trigrams': self._trigrams,
+                     'vocabulary': self._vocabulary, 'emails': self._emails, 'phones': self._phones,
+                     'phone_tails': self._phone_tails, 'as_of': self.as_of}
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.changed = False
+
+    @classmethod
+    def load(cls, path, min_similarity=None):
+        """Reads an index written by save(); None if the file is missing or from another version.
+
+        `min_similarity` replaces the one the snapshot was saved with. The
+        snapshot is a pickle: only load files this program wrote.
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != SNAPSHOT_VERSION:
+            return None
+        index = cls(state['min_similarity'] if min_similarity is None else min_similarity)
+        index._docs, index._postings, index._trigrams = state['docs'], state['postings'], state['trigrams']
+        index._vocabulary, index._emails = state['vocabulary'], state['emails']
+        index._phones, index._phone_tails = state['phones'], state['phone_tails']
+        index.as_of = state['as_of']
+        return index
+
+
+def _discard(mapping, key, member_id):
+    ids = mapping.get(key)
+    if ids is not None:
+        ids.discard(member_id)
+        if not ids:
+            del mapping[key]
+
+
+def _rank_keys(scores):
+    """Sort keys for ranking: highest score first, then lowest member_id."""
+    return ((-score, member_id) for member_id, score in scores.items())
@@ -1,69 +1,417 @@
 # This is 'modules/member_management.py'
 
+import atexit
 import datetime
-from database.db_connection import create_connection, close_connection
+import os
+import threading
+import time
+from database.db_connection import pooled_connection
+from modules.index_changes import ChangeFeed
+from modules.member_index import MemberLookupIndex
+from utils.cache import lookup_cache
+from utils.config import PAGE_SIZE, MEMBER_INDEX_CONFIG
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
 
-def register_member(name, email, phone_number):
-    """Registers a new member in the members table."""
-    conn = create_connection()
-    if not conn:
+log = get_logger(__name__)
+
+# The lookup index is built on the first search (or loaded from its
+# snapshot) and then kept in sync by register_member and update_member,
+# and with the changes other programs make through index_changes (see
+# modules/index_changes.py), which it looks at before a search.
+_member_index = None
+_member_changes = None  # The index's ChangeFeed
+_member_index_lock = threading.Lock()
+_member_refresh_lock = threading.Lock()
+_FETCH_CHUNK = 500  # member_ids per "WHERE member_id IN (...)" query
+
+# The queries, shared with the async versions in modules/async_operations.py
+_INSERT_MEMBER = """
+INSERT INTO members (name, email, phone_number, registration_date) 
+VALUES (%s, %s, %s, %s)
+"""
+_SEARCH_MEMBERS = """
+SELECT member_id, name, email, phone_number, registration_date 
+FROM members 
+WHERE name LIKE %s OR email LIKE %s
+"""
+_MEMBER_BY_ID = """
+SELECT member_id, name, email, phone_number, registration_date 
+FROM members WHERE member_id = %s
+"""
+_SEARCH_MEMBERS_PAGE = """
+SELECT member_id, name, email, phone_number, registration_date 
+FROM members 
+WHERE (name LIKE %s OR email LIKE %s) AND member_id > %s
+ORDER BY member_id
+LIMIT %s
+"""
+_MEMBERS_BY_ID = """
+SELECT member_id, name, email, phone_number, registration_date 
+FROM members WHERE member_id IN ({placeholders})
+"""
+_INDEXED_MEMBERS = "SELECT member_id, name, email, phone_number FROM members"
+_INDEXED_MEMBERS_BY_ID = "SELECT member_id, name, email, phone_number FROM members WHERE member_id IN ({placeholders})"
+_UPDATE_MEMBER = "UPDATE members SET name = %s, email = %s, phone_number = %s WHERE member_id = %s"
+
+def get_member_index():
+    """Returns the member lookup index, building or loading it on first use.
+
+    At most every REFRESH_SECONDS it first applies the members other
+    programs have registered, changed or removed since (modules/index_changes.py).
+    """
+    global _member_index, _member_changes
+    if _member_index is None:
+        with _member_index_lock:
+            if _member_index is None:
+                _member_index, _member_changes = _load_member_index()
+    else:
+        changes = _member_changes
+        if changes is not None and changes.due():
+            _refresh_member_index()
+    return _member_index
+
+def reset_member_index():
+    """Drops the index and its snapshot so the next search rebuilds it (e.g. after a bulk import)."""
+    global _member_index, _member_changes
+    with _member_index_lock:
+        _member_index = _member_changes = None
+        path = MEMBER_INDEX_CONFIG['snapshot_path']
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def save_member_index(path=None):
+    """Writes the index snapshot now; returns False if there is nothing to save."""
+    path = path or MEMBER_INDEX_CONFIG['snapshot_path']
+    index = _member_index
+    if not path or index is None:
         return False
-        
-    cursor = conn.cursor()
-    
-    # Get today's date for the registration_date
-    reg_date = datetime.date.today()
-    
-    query = """
-    INSERT INTO members (name, email, phone_number, registration_date) 
-    VALUES (%s, %s, %s, %s)
+    started = time.perf_counter()
+    index.save(path)
+    log.info("Saved member index snapshot", members=len(index), path=path,
+             seconds=round(time.perf_counter() - started, 3))
+    return True
+
+def _save_member_index_at_exit():
+    """Keeps the snapshot current for the next start (registered once, below)."""
+    index = _member_index
+    if index is not None and index.changed:
+        save_member_index()
+
+atexit.register(_save_member_index_at_exit)
+
+def _load_member_index():
+    """Loads the snapshot if there is a recent one and catches it up on the
+    members changed since, or else reads every member.
+
+    Returns (index, its ChangeFeed), or (None, None) if the members can't be read.
     """
+    path = MEMBER_INDEX_CONFIG['snapshot_path']
+    min_similarity = MEMBER_INDEX_CONFIG['min_similarity']
+    started = time.perf_counter()
+    index = None
+    if path and os.path.exists(path) and time.time() - os.path.getmtime(path) < MEMBER_INDEX_CONFIG['max_snapshot_age']:
+        index = MemberLookupIndex.load(path, min_similarity)
+
+    with pooled_connection() as conn:
+        if not conn:
+            return None, None
+        try:
+            changes = None
+            if index is not None and index.as_of is not None:
+                changes = ChangeFeed('member', index.as_of)
+                if not changes.refresh(conn, lambda member_ids: _apply_member_changes(conn, index, member_ids)):
+                    changes = None  # Too far behind to catch up
+            from_snapshot = changes is not None
+            if not from_snapshot:
+                index, changes = _read_all_members(conn, min_similarity)
+            index.as_of = changes.as_of
+        except Exception as e:
+            log.error("Could not build the member index", error=str(e))
+            return None, None
+    log.info("Member index ready", members=len(index), from_snapshot=from_snapshot,
+             seconds=round(time.perf_counter() - started, 3))
+
+    if path and index.changed:
+        index.save(path)
+    return index, changes
+
+def _read_all_members(conn, min_similarity):
+    """Builds a new index from the members table; returns (index, its ChangeFeed)."""
+    # Start the feed first: whatever changes during the scan is applied again later
+    changes = ChangeFeed.before_full_read(conn, 'member')
+    index = MemberLookupIndex(min_similarity)
+    cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute(query, (name, email, phone_number, reg_date))
-        conn.commit()
-        print(f"Success: Registered new member '{name}' with email '{email}'.")
-        return True
-    except Exception as e:
-        print(f"Error registering member: {e}")
-        conn.rollback()
-        return False
+        cursor.execute(_INDEXED_MEMBERS)
+        rows = cursor.fetchmany(_FETCH_CHUNK)
+        while rows:
+            index.add_many(rows)
+            rows = cursor.fetchmany(_FETCH_CHUNK)
+    finally:
+        cursor.close()
+    return index, changes
+
+def _refresh_member_index():
+    """Applies the changes made by other programs; one thread at a time, the others don't wait."""
+    global _member_index, _member_changes
+    if not _member_refresh_lock.acquire(blocking=False):
+        return
+    try:
+        index, changes = _member_index, _member_changes
+        if index is None or not changes.due():
+            return
+        with pooled_connection() as conn:
+            if not conn:
+                changes.postpone()
+                return
+            try:
+                if changes.refresh(conn, lambda member_ids: _apply_member_changes(conn, index, member_ids)):
+                    index.as_of = changes.as_of
+                    return
+                # Too far behind: build a new index and swap it in
+                index, changes = _read_all_members(conn, MEMBER_INDEX_CONFIG['min_similarity'])
+                index.as_of = changes.as_of
+            except Exception as e:
+                log.warning("Could not refresh the member index", error=str(e))
+                return
+        with _member_index_lock:
+            _member_index, _member_changes = index, changes
+    finally:
+        _member_refresh_lock.release()
+
+def _apply_member_changes(conn, index, member_ids):
+    """Re-reads the changed members into the index; the ones no longer there are removed."""
+    member_ids = list(member_ids)
+    found = set()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for start in range(0, len(member_ids), _FETCH_CHUNK):
+            chunk = member_ids[start:start + _FETCH_CHUNK]
+            cursor.execute(_INDEXED_MEMBERS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))), tuple(chunk))
+            for row in cursor.fetchall():
+                index.add(row)
+                found.add(row['member_id'])
     finally:
         cursor.close()
-        close_connection(conn)
+    for member_id in member_ids:
+        if member_id not in found:
+            index.remove(member_id)
+    lookup_cache.invalidate(*[('member', member_id) for member_id in member_ids])
+    log.debug("Applied member changes to the lookup index", members=len(member_ids))
+
+def _sync_member_index(action, member_id, **fields):
+    """Applies a committed change to the index, if it has been built."""
+    with _member_index_lock:  # Waits for a build in progress to finish
+        index = _member_index
+    if index is None:
+        return
+    if action == 'add':
+        index.add(dict(fields, member_id=member_id))
+    elif action == 'update':
+        index.update(member_id, **fields)
+
+@instrumented
+def register_member(name, email, phone_number):
+    """Registers a new member in the members table."""
+    with pooled_connection() as conn:
+        if not conn:
+            return False
+        
+        cursor = conn.cursor()
+    
+        # Get today's date for the registration_date
+        reg_date = datetime.date.today()
+    
+        try:
+            cursor.execute(_INSERT_MEMBER, (name, email, phone_number, reg_date))
+            member_id = cursor.lastrowid
+            conn.commit()
+            lookup_cache.invalidate(('member', member_id))
+            _sync_member_index('add', member_id, name=name, email=email, phone_number=phone_number)
+            log.info("Registered member", member_id=member_id, name=name, email=email)
+            return True
+        except Exception as e:
+            log.error("Could not register member", email=email, error=str(e))
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+
+@instrumented
+def update_member(member_id, name, email, phone_number):
+    """Changes a member's name, email and phone number."""
+    with pooled_connection() as conn:
+        if not conn:
+            return False
 
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_UPDATE_MEMBER, (name, email, phone_number, member_id))
+            conn.commit()
+            lookup_cache.invalidate(('member', member_id))
+            if cursor.rowcount > 0:
+                _sync_member_index('update', member_id, name=name, email=email, phone_number=phone_number)
+                log.info("Updated member", member_id=member_id)
+                return True
+            else:
+                log.warning("No member to update", member_id=member_id)
+                return False
+        except Exception as e:
+            # Usually an email that another member already has
+            log.error("Could not update member", member_id=member_id, error=str(e))
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+
+@instrumented
 def view_member_details(search_term):
-    """Searches for a member by name or email."""
-    conn = create_connection()
-    if not conn:
+    """Searches for a member by name, email or phone number.
+
+    Matching and ranking happen in the lookup index (misspellings, word
+    prefixes and phone numbers in any format match; best matches first);
+    the rows are then read by primary key.
+    """
+    index = get_member_index()
+    if index is None:
+        return _view_member_details_by_scan(search_term)
+
+    member_ids = index.search(search_term)
+    if not member_ids:
+        log.debug("No members found", term=search_term)
         return []
+    return _fetch_members(member_ids)
+
+def _fetch_members(member_ids):
+    """Reads members by primary key in the order of member_ids, through the lookup cache."""
+    cached = lookup_cache.get_many(('member', member_id) for member_id in member_ids)
+    rows_by_id = {key[1]: row for key, row in cached.items()}
+    missing = [member_id for member_id in dict.fromkeys(member_ids) if member_id not in rows_by_id]
+
+    if missing:
+        generation = lookup_cache.generation
+        with pooled_connection() as conn:
+            if not conn:
+                return []
+
+            cursor = conn.cursor(dictionary=True)
+            try:
+                for start in range(0, len(missing), _FETCH_CHUNK):
+                    chunk = missing[start:start + _FETCH_CHUNK]
+                    cursor.execute(_MEMBERS_BY_ID.format(placeholders=', '.join(['%s'] * len(chunk))), tuple(chunk))
+                    for row in cursor.fetchall():
+                        rows_by_id[row['member_id']] = row
+                        lookup_cache.put(('member', row['member_id']), row, if_generation=generation)
+            except Exception as e:
+                log.error("Could not read members", count=len(missing), error=str(e))
+                return []
+            finally:
+                cursor.close()
+
+    # Keep the index's ranking order; copies so callers can't alter cached rows
+    return [dict(rows_by_id[member_id]) for member_id in member_ids if member_id in rows_by_id]
+
+def _view_member_details_by_scan(search_term):
+    """The old LIKE search, used only if the index could not be built."""
+    with pooled_connection() as conn:
+        if not conn:
+            return []
         
-    cursor = conn.cursor(dictionary=True) # Get results as dictionaries
+        cursor = conn.cursor(dictionary=True) # Get results as dictionaries
     
-    query = """
-    SELECT member_id, name, email, phone_number, registration_date 
-    FROM members 
-    WHERE name LIKE %s OR email LIKE %s
-    """
-    like_term = f"%{search_term}%"
+        like_term = f"%{search_term}%"
+        generation = lookup_cache.generation
     
-    try:
-        cursor.execute(query, (like_term, like_term))
-        results = cursor.fetchall()
+        try:
+            cursor.execute(_SEARCH_MEMBERS, (like_term, like_term))
+            results = cursor.fetchall()
         
-        if not results:
-            print("No members found matching that criteria.")
+            if not results:
+                log.debug("No members found", term=search_term)
+
+            # Members just searched for are usually looked up next
+            for row in results:
+                lookup_cache.put(('member', row['member_id']), dict(row), if_generation=generation)
         
-        return results # Returns a list of dictionaries
+            return results # Returns a list of dictionaries
         
-    except Exception as e:
-        print(f"Error searching for member: {e}")
-        return []
-    finally:
-        cursor.close()
-        close_connection(conn)
+        except Exception as e:
+            log.error("Could not search members", term=search_term, error=str(e))
+            return []
+        finally:
+            cursor.close()
+
+@instrumented
+def get_member(member_id):
+    """Returns one member by member_id (from the cache when possible), or None."""
+    key = ('member', member_id)
+    member = lookup_cache.get(key)
+    if member is not None:
+        return dict(member)
+
+    generation = lookup_cache.generation
+    with pooled_connection() as conn:
+        if not conn:
+            return None
+        
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(_MEMBER_BY_ID, (member_id,))
+            member = cursor.fetchone()
+        except Exception as e:
+            log.error("Could not look up member", member_id=member_id, error=str(e))
+            return None
+        finally:
+            cursor.close()
+
+    if member is not None:
+        lookup_cache.put(key, member, if_generation=generation)
+        member = dict(member)
+    return member
+
+@instrumented
+def view_member_details_page(search_term, after=None, limit=PAGE_SIZE):
+    """Returns one page of view_member_details results as (rows, next_cursor).
+
+    Pass next_cursor back as `after`; it is None on the last page. The
+    cursor is a position in the ranking, so only `limit` rows are ever
+    read from the database.
+    """
+    index = get_member_index()
+    if index is None:
+        return _view_member_details_page_by_scan(search_term, after, limit)
+
+    member_ids, next_cursor = index.search_page(search_term, after, limit)
+    if not member_ids:
+        return [], None
+    return _fetch_members(member_ids), next_cursor
+
+def _view_member_details_page_by_scan(search_term, after, limit):
+    """Keyset-paginated LIKE search (by member_id), used only without the index."""
+    with pooled_connection() as conn:
+        if not conn:
+            return [], None
+        
+        cursor = conn.cursor(dictionary=True)
+    
+        like_term = f"%{search_term}%"
+    
+        try:
+            # Ask for one extra row to know whether there is another page
+            cursor.execute(_SEARCH_MEMBERS_PAGE, (like_term, like_term, after or 0, limit + 1))
+            rows = cursor.fetchall()
+            next_cursor = rows[limit - 1]['member_id'] if len(rows) > limit else None
+            return rows[:limit], next_cursor
+        except Exception as e:
+            log.error("Could not search members", term=search_term, error=str(e))
+            return [], None
+        finally:
+            cursor.close()
 
 # --- Test block ---
 if __name__ == '__main__':
+    configure_logging()
     print("--- Testing Member Management System ---")
     
     # 1. Register a new member
@@ -87,4 +435,30 @@ if __name__ == '__main__':
     bob_members = view_member_details('Bob')
     for member in bob_members:
         print(f"  > Found: {member['name']} (ID: {member['member_id']})")
-    
\ No newline at end of file
+
+    # 4. Typos and phone numbers
+    print("\nSearching for 'Jonson' (misspelled)...")
+    for member in view_member_details('Jonson'):
+        print(f"  > Found: {member['name']} (ID: {member['member_id']})")
+
+    print("\nSearching for '(098) 765-4321'...")
+    for member in view_member_details('(098) 765-4321'):
+        print(f"  > Found: {member['name']} (ID: {member['member_id']})")
+
+    print("\nChanging Alice's surname to 'Smythe' and searching for 'smithe'...")
+    alice_id = members[0]['member_id']
+    update_member(alice_id, 'Alice Smythe', 'alice@example.com', '1234567890')
+    for member in view_member_details('smithe'):
+        print(f"  > Found: {member['name']} (ID: {member['member_id']})")
+    
+    # 5. A change made by another program (another desk, the HTTP API) turns up too
+    print("\nChanging Bob's email behind this desk's back...")
+    from modules.index_changes import REFRESH_SECONDS
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE members SET email = %s WHERE email = %s", ('robert@example.com', 'bob@example.com'))
+        conn.commit()
+        cursor.close()
+    time.sleep(REFRESH_SECONDS)
+    for member in view_member_details('robert@example.com'):
+        print(f"  > Found: {member['name']} ({member['email']})")  # Should be Bob Johnson
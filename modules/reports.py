@@ -0,0 +1,297 @@
+# This is 'modules/reports.py'
+#
+# Circulation reports. Each report is one SQL query whose rows are streamed
+# from the database cursor through a chain of generators straight into the
+# output file, so memory use stays flat however big the result is.
+#
+# mysql.connector cursors are unbuffered by default (rows stay on the
+# server until fetched) and SQLite steps through its result lazily, so
+# fetchmany() in a loop never holds more than one chunk.
+
+import csv
+import datetime
+import decimal
+import json
+import os
+import time
+
+from database.db_connection import pooled_connection
+from utils.log import get_logger, configure_logging
+from utils.metrics import instrumented
+
+log = get_logger(__name__)
+
+FETCH_CHUNK = 5_000      # Rows fetched from the cursor at a time
+ROW_GROUP_SIZE = 50_000  # Rows per Parquet row group
+PROGRESS_EVERY = 10_000  # Report progress every this many rows
+
+FORMATS = {'csv': '.csv', 'jsonl': '.jsonl', 'parquet': '.parquet'}
+
+
+class Report:
+    """One report: a query plus the name and type of each output column.
+
+    Column types ('int', 'float', 'str', 'date') are used to normalize
+    values coming from either database and to type the Parquet columns.
+    `params` lists the keyword arguments the query needs, in order;
+    `transform` (optional) turns each fetched row into the output row.
+    """
+
+    def __init__(self, name, title, columns, query, params=(), transform=None):
+        self.name = name
+        self.title = title
+        self.columns = columns  # [(column name, type), ...]
+        self.query = query
+        self.params = params
+        self.transform = transform
+
+    @property
+    def column_names(self):
+        return [name for name, _ in self.columns]
+
+
+def _utilization(row):
+    genre, titles, copies, on_loan, on_hold, overdue, lifetime_issues = row
+    on_loan = on_loan or 0
+    return (genre, titles, copies, on_loan, round(on_loan / copies, 4) if copies else 0.0,
+            on_hold or 0, overdue or 0, lifetime_issues or 0)
+
+
+OVERDUE_BY_MEMBER = Report(
+    name='overdue_by_member',
+    title="Overdue loans by member",
+    columns=[('member_id', 'int'), ('name', 'str'), ('email', 'str'), ('overdue_loans', 'int'),
+             ('oldest_due_date', 'date'), ('accrued_fines', 'float')],
+    query="""
+    SELECT m.member_id, m.name, m.email, COUNT(*), MIN(t.due_date), SUM(t.fine_amount)
+    FROM transactions t
+    JOIN members m ON m.member_id = t.member_id
+    WHERE t.return_date IS NULL AND t.due_date < %s
+    GROUP BY m.member_id, m.name, m.email
+    ORDER BY m.member_id
+    """,
+    params=('as_of',),
+)
+
+MOST_CIRCULATED = Report(
+    name='most_circulated',
+    title="Most-circulated titles",
+    columns=[('book_id', 'int'), ('title', 'str'), ('author', 'str'), ('genre', 'str'),
+             ('issues', 'int')],
+    query="""
+    SELECT b.book_id, b.title, b.author, b.genre, COUNT(*) AS issues
+    FROM transactions t
+    JOIN books b ON b.book_id = t.book_id
+    WHERE t.issue_date BETWEEN %s AND %s
+    GROUP BY b.book_id, b.title, b.author, b.genre
+    ORDER BY issues DESC, b.book_id
+    LIMIT %s
+    """,
+    params=('start', 'end', 'top'),
+)
+
+GENRE_UTILIZATION = Report(
+    name='genre_utilization',
+    title="Utilization per genre",
+    columns=[('genre', 'str'), ('titles', 'int'), ('copies', 'int'), ('on_loan', 'int'),
+             ('utilization', 'float'), ('on_hold', 'int'), ('overdue', 'int'), ('lifetime_issues', 'int')],
+    # Sums of each title's counters (see modules/circulation_counters.py), so
+    # no loans are read; overdue is as of the last nightly reconciliation
+    query="""
+    SELECT COALESCE(genre, ''), COUNT(*), SUM(quantity), SUM(on_loan), SUM(held_copies),
+           SUM(overdue_loans), SUM(lifetime_issues)
+    FROM books
+    GROUP BY COALESCE(genre, '')
+    ORDER BY COALESCE(genre, '')
+    """,
+    transform=_utilization,
+)
+
+DAILY_VOLUME = Report(
+    name='daily_volume',
+    title="Daily issue/return volume",
+    columns=[('day', 'date'), ('issued', 'int'), ('returned', 'int')],
+    query="""
+    SELECT day, SUM(issued), SUM(returned)
+    FROM (
+        SELECT issue_date AS day, 1 AS issued, 0 AS returned
+        FROM transactions WHERE issue_date BETWEEN %s AND %s
+        UNION ALL
+        SELECT return_date AS day, 0 AS issued, 1 AS returned
+        FROM transactions WHERE return_date BETWEEN %s AND %s
+    ) AS movements
+    GROUP BY day
+    ORDER BY day
+    """,
+    params=('start', 'end', 'start', 'end'),
+)
+
+REPORTS = {report.name: report for report in
+           (OVERDUE_BY_MEMBER, MOST_CIRCULATED, GENRE_UTILIZATION, DAILY_VOLUME)}
+
+
+def _default_params(as_of=None, start=None, end=None, top=100):
+    today = datetime.date.today()
+    end = end or today
+    return {'as_of': as_of or today, 'start': start or end - datetime.timedelta(days=30),
+            'end': end, 'top': top}
+
+
+# --- Pipeline stages ---
+
+def _fetch(cursor, chunk_size):
+    """Yields rows from an executed cursor, one chunk in memory at a time."""
+    rows = cursor.fetchmany(chunk_size)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(chunk_size)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])  # SQLite hands back text from UNIONs
+
+
+_COERCE = {
+    'int': lambda v: None if v is None else int(v),
+    'float': lambda v: None if v is None else float(v),  # MySQL returns Decimal for SUMs
+    'str': lambda v: None if v is None else str(v),
+    'date': _as_date,
+}
+
+
+def _normalize(rows, report):
+    """Applies the report's transform and gives every value its column's type."""
+    coercers = [_COERCE[kind] for _, kind in report.columns]
+    for row in rows:
+        if report.transform is not None:
+            row = report.transform(row)
+        yield tuple(coerce(value) for coerce, value in zip(coercers, row))
+
+
+def _count(rows, counter, progress):
+    """Passes rows through, counting them and reporting progress now and then."""
+    for row in rows:
+        counter[0] += 1
+        if progress is not None and counter[0] % PROGRESS_EVERY == 0:
+            progress(f"{counter[0]:,} rows written...")
+        yield row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Writers ---
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def _write_csv(rows, report, f):
+    writer = csv.writer(f)
+    writer.writerow(report.column_names)
+    writer.writerows(rows)
+
+
+def _write_jsonl(rows, report, f):
+    names = report.column_names
+    for row in rows:
+        f.write(json.dumps(dict(zip(names, row)), default=_json_default) + '\n')
+
+
+def _write_parquet(rows, report, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
+
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'date': pa.date32()}
+    schema = pa.schema([(name, types[kind]) for name, kind in report.columns])
+    with pq.ParquetWriter(path, schema) as writer:
+        # One row group per chunk: columnar on disk, bounded in memory
+        for chunk in _chunks(rows, ROW_GROUP_SIZE):
+            columns = [list(column) for column in zip(*chunk)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+
+# --- Running reports ---
+
+def iter_report(name, chunk_size=FETCH_CHUNK, **params):
+    """Yields the rows of report `name` as tuples, streaming from the database.
+
+    Keyword arguments: as_of (overdue_by_member, default today), start/end
+    (most_circulated and daily_volume, default the last 30 days) and top
+    (most_circulated, default 100).
+    """
+    report = REPORTS[name]
+    values = _default_params(**params)
+    with pooled_connection() as conn:
+        if not conn:
+            raise ConnectionError("Could not connect to the database.")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(report.query, tuple(values[p] for p in report.params))
+            yield from _normalize(_fetch(cursor, chunk_size), report)
+        finally:
+            cursor.close()
+
+
+@instrumented
+def run_report(name, path, fmt=None, progress=None, **params):
+    """Streams report `name` into `path` and returns a summary dict.
+
+    `fmt` is 'csv', 'jsonl' or 'parquet' (default: from the file extension).
+    The file is written under a temporary name and moved into place at the
+    end, so a failed run never leaves a half-written report behind.
+    `progress`, if given, is called now and then with a status text.
+    """
+    report = REPORTS[name]
+    if fmt is None:
+        fmt = next((f for f, ext in FORMATS.items() if path.lower().endswith(ext)), 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format: {fmt!r}")
+
+    started = time.perf_counter()
+    counter = [0]
+    rows = _count(iter_report(name, **params), counter, progress)
+    tmp_path = path + '.tmp'
+    try:
+        if fmt == 'parquet':
+            _write_parquet(rows, report, tmp_path)
+        else:
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                (_write_csv if fmt == 'csv' else _write_jsonl)(rows, report, f)
+        os.replace(tmp_path, path)
+    finally:
+        rows.close()  # Releases the cursor and connection if writing failed midway
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if progress is not None:
+        progress(f"{counter[0]:,} rows written.")
+    summary = {'report': name, 'path': path, 'format': fmt, 'rows': counter[0],
+               'seconds': round(time.perf_counter() - started, 3)}
+    log.info("Wrote report", **summary)
+    return summary
+
+
+# --- Test block ---
+if __name__ == '__main__':
+    configure_logging()
+    print("--- Testing Reports ---")
+    for report_name in REPORTS:
+        print(f"  > {REPORTS[report_name].title}: {list(iter_report(report_name))[:5]}")
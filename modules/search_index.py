@@ -0,0 +1,213 @@
+# This is 'modules/search_index.py'
+#
+# An in-memory inverted index over the book catalog, so search_book can
+# answer queries without scanning the books table.
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+
+# How much a match in each field counts towards a book's rank
+FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'genre': 1.0}
+EXACT_BONUS = 1.5  # A whole-word match ranks above a prefix match
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize(text):
+    """Lowercases text and strips accents, so 'Émile' and 'emile' match."""
+    text = str(text)
+    if text.isascii():
+        return text.lower()  # Nothing to fold; the common case
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.casefold()
+
+
+def tokenize(text):
+    """Splits text into normalized word tokens."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def normalize_isbn(isbn):
+    """Drops hyphens and spaces so '978-0-7432-7356-5' equals '9780743273565'."""
+    if not isbn:
+        return ''
+    return re.sub(r"[\s-]", "", str(isbn)).upper()
+
+
+class BookSearchIndex:
+    """Token -> book postings over title, author and genre, plus an ISBN lookup.
+
+    All methods are thread-safe. Documents are dicts with at least
+    book_id, title, author, isbn and genre keys (a books row works).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}   # token -> {book_id: weight}
+        self._vocabulary = [] # Sorted list of tokens, for prefix lookups
+        self._isbn = {}       # normalized isbn -> set of book_ids
+        self._docs = {}       # book_id -> indexed fields, needed to un-index
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Keeping the index in sync ---
+
+    def add(self, book):
+        """Indexes (or re-indexes) one book."""
+        with self._lock:
+            new_tokens = self._add(book)
+            for token in new_tokens:
+                bisect.insort(self._vocabulary, token)
+
+    def add_many(self, books):
+        """Indexes many books at once; much faster than add() for a full load."""
+        with self._lock:
+            new_tokens = []
+            for book in books:
+                new_tokens.extend(self._add(book))
+            if new_tokens:
+                self._vocabulary = sorted(set(self._vocabulary).union(new_tokens))
+
+    def _add(self, book):
+        """Indexes one book and returns tokens that were not in the vocabulary."""
+        book_id = book['book_id']
+        fields = {
+            'title': book.get('title'),
+            'author': book.get('author'),
+            'genre': book.get('genre'),
+            'isbn': normalize_isbn(book.get('isbn')),
+        }
+        if book_id in self._docs:
+            self._unindex(book_id)
+        self._docs[book_id] = fields
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields[field]):
+                weights[token] = weights.get(token, 0.0) + weight
+        new_tokens = []
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                new_tokens.append(token)
+            postings[book_id] = weight
+        if fields['isbn']:
+            self._isbn.setdefault(fields['isbn'], set()).add(book_id)
+        return new_tokens
+
+    def update(self, book_id, **changes):
+        """Re-indexes a book with some fields changed (e.g. title, author)."""
+        with self._lock:
+            current = self._docs.get(book_id)
+            if current is None:
+                return
+            book = dict(current, book_id=book_id)
+            book.update(changes)
+            self.add(book)
+
+    def remove(self, book_id):
+        with self._lock:
+            if book_id in self._docs:
+                self._unindex(book_id)
+                del self._docs[book_id]
+
+    def _unindex(self, book_id):
+        fields = self._docs[book_id]
+        for field in FIELD_WEIGHTS:
+            for token in tokenize(fields[field]):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(book_id, None)
+                if not postings:
+                    del self._postings[token]
+                    pos = bisect.bisect_left(self._vocabulary, token)
+                    if pos < len(self._vocabulary) and self._vocabulary[pos] == token:
+                        del self._vocabulary[pos]
+        ids = self._isbn.get(fields['isbn'])
+        if ids is not None:
+            ids.discard(book_id)
+            if not ids:
+                del self._isbn[fields['isbn']]
+
+    # --- Queries ---
+
+    def lookup_isbn(self, isbn):
+        """Returns the book_ids with exactly this ISBN."""
+        with self._lock:
+            return sorted(self._isbn.get(normalize_isbn(isbn), ()))
+
+    def search(self, query, limit=None):
+        """Returns book_ids matching every term of the query, best first.
+
+        Each term matches whole words and word prefixes ('gats' finds
+        'Gatsby'). A query that is an ISBN returns that book directly.
+        """
+        scores = self._score(query)
+        if limit:
+            # Only the top `limit` books need to be ordered
+            return [key[1] for key in heapq.nsmallest(limit, _rank_keys(scores))]
+        return [key[1] for key in sorted(_rank_keys(scores))]
+
+    def search_page(self, query, after=None, limit=50):
+        """Returns one page of search() as (book_ids, next_cursor).
+
+        Pass the returned cursor as `after` to get the next page; it is
+        None on the last page. Pages stay consistent while books are added
+        or removed because the cursor is a position in the ranking
+        (score, book_id), not an offset.
+        """
+        keys = _rank_keys(self._score(query))
+        if after is not None:
+            after = tuple(after)
+            keys = (key for key in keys if key > after)
+        page = heapq.nsmallest(limit + 1, keys)
+        next_cursor = page[limit - 1] if len(page) > limit else None
+        return [key[1] for key in page[:limit]], next_cursor
+
+    def _score(self, query):
+        """Returns {book_id: score} for every book matching the query."""
+        with self._lock:
+            isbn_hits = self._isbn.get(normalize_isbn(query))
+            if isbn_hits:
+                return dict.fromkeys(isbn_hits, 0.0)
+
+            terms = tokenize(query)
+            if not terms:
+                return {}
+
+            scores = None
+            # Start with the rarest term so the candidate set stays small
+            for term_scores in sorted((self._match_term(t) for t in set(terms)), key=len):
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {book_id: score + term_scores[book_id]
+                              for book_id, score in scores.items() if book_id in term_scores}
+                if not scores:
+                    return {}
+            return scores
+
+    def _match_term(self, term):
+        """Scores every book containing a word that starts with `term`."""
+        scores = {}
+        pos = bisect.bisect_left(self._vocabulary, term)
+        while pos < len(self._vocabulary) and self._vocabulary[pos].startswith(term):
+            token = self._vocabulary[pos]
+            bonus = EXACT_BONUS if token == term else 1.0
+            for book_id, weight in self._postings[token].items():
+                scores[book_id] = max(scores.get(book_id, 0.0), weight * bonus)
+            pos += 1
+        return scores
+
+
+def _rank_keys(scores):
+    """Sort keys for ranking: highest score first, then lowest book_id."""
+    return ((-score, book_id) for book_id, score in scores.items())
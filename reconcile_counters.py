@@ -0,0 +1,37 @@
+# This is 'reconcile_counters.py'
+# Nightly job: recounts every title's circulation counters (available, on
+# loan, held, lifetime issues, overdue) and reports any that had drifted.
+#
+#   python reconcile_counters.py
+#   python reconcile_counters.py --as-of 2024-06-30 --batch-size 5000 --dry-run
+
+import argparse
+import datetime
+import json
+import sys
+
+from modules.circulation_counters import reconcile_counters, BATCH_SIZE
+from utils.log import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recount the circulation counters of every title.")
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat,
+                        help="Date overdue loans are counted at (default: today)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Titles recounted per transaction")
+    parser.add_argument('--dry-run', action='store_true', help="Report drift, but write nothing")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        summary = reconcile_counters(as_of=args.as_of, batch_size=args.batch_size, dry_run=args.dry_run)
+    except ConnectionError as e:
+        print(f"Reconciliation failed: {e}")
+        return 1
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
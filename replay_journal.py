@@ -0,0 +1,52 @@
+# This is 'replay_journal.py'
+# Replays a desk's offline circulation journal into the database, or lists
+# the journaled issues/returns that could not be applied. A running desk
+# replays its own journal once it can connect; this is for a desk that was
+# closed while offline, or a journal copied from another machine (close
+# the desk that writes to it first).
+#
+#   python replay_journal.py
+#   python replay_journal.py --path desk2.journal --batch-size 500
+#   python replay_journal.py --conflicts 50
+
+import argparse
+import json
+import sys
+
+from modules.circulation_journal import CirculationJournal, JournalError, replay_journal, replay_conflicts
+from utils.config import JOURNAL_CONFIG
+from utils.log import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an offline circulation journal.")
+    parser.add_argument('--path', default=JOURNAL_CONFIG['path'], help="The journal file")
+    parser.add_argument('--batch-size', type=int, default=JOURNAL_CONFIG['replay_batch_size'],
+                        help="Operations replayed per transaction")
+    parser.add_argument('--conflicts', type=int, metavar='N',
+                        help="Only list the last N operations that could not be applied")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if args.conflicts is not None:
+        print(json.dumps(replay_conflicts(args.conflicts), indent=2, default=str))
+        return 0
+
+    try:
+        journal = CirculationJournal(args.path)
+    except (JournalError, OSError) as e:
+        print(f"Cannot open the journal: {e}")
+        return 1
+    try:
+        summary = replay_journal(journal, args.batch_size)
+        if not summary['stopped']:
+            journal.compact()
+    finally:
+        journal.close()
+
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['stopped'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+# This is 'serve.py'
+# Runs the HTTP/JSON service (api/http_service.py), next to main.py.
+#
+#   python serve.py                          # http://127.0.0.1:8080
+#   python serve.py --host 0.0.0.0 --port 9000
+#
+# Uses uvloop for the event loop when it is installed. The number of
+# database connections is ASYNC_POOL_CONFIG['max_size'] in utils/config.py.
+
+import argparse
+import asyncio
+import sys
+
+from utils.log import configure_logging, get_logger
+
+log = get_logger(__name__)
+
+
+def _event_loop_policy():
+    try:
+        import uvloop  # Optional: a faster event loop
+    except ImportError:
+        return None
+    return uvloop.EventLoopPolicy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the library backend over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--search-cache-ttl', type=float, default=2.0, help="Seconds a search response is reused")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    policy = _event_loop_policy()
+    if policy is not None:
+        asyncio.set_event_loop_policy(policy)
+
+    # Imported here so logging is configured before the backend loads
+    from api.http_service import LibraryService
+    service = LibraryService(search_cache_ttl=args.search_cache_ttl)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        log.info("Stopped")
+    except OSError as e:
+        print(f"Could not start the server: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# This is 'sweep_holds.py'
+# Nightly job: expires holds whose copy was not collected in time and
+# passes those copies on to the next member in line (see modules/holds.py).
+#
+#   python sweep_holds.py
+#   python sweep_holds.py --as-of 2024-06-30 --batch-size 1000
+
+import argparse
+import datetime
+import json
+import sys
+
+from modules.holds import sweep_holds
+from utils.config import HOLD_CONFIG
+from utils.log import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expire uncollected holds and pass their copies on.")
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat, help="Date to sweep at (default: today)")
+    parser.add_argument('--batch-size', type=int, default=HOLD_CONFIG['sweep_batch_size'],
+                        help="Holds expired per transaction")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        summary = sweep_holds(today=args.as_of, batch_size=args.batch_size)
+    except ConnectionError as e:
+        print(f"Hold sweep failed: {e}")
+        return 1
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
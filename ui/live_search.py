@@ -0,0 +1,115 @@
+# This is 'ui/live_search.py'
+#
+# Search-as-you-type for an Entry widget. Queries run on a background
+# thread so a slow database never freezes the window.
+
+import queue
+import threading
+import tkinter as tk
+
+
+class LiveSearch:
+    """Runs `search_func(term)` as the user types into `entry`.
+
+    Keystrokes are debounced by `delay_ms`. Only the newest query matters:
+    queries that were overtaken before they started are skipped, and results
+    of ones that were already running are thrown away. Results are handed to
+    `on_results(term, results)` on the Tk thread, through `after()` polling.
+    """
+
+    def __init__(self, entry, search_func, on_results, on_status=None,
+                 delay_ms=250, poll_ms=30):
+        self.entry = entry
+        self.search_func = search_func
+        self.on_results = on_results
+        self.on_status = on_status or (lambda text: None)
+        self.delay_ms = delay_ms
+        self.poll_ms = poll_ms
+
+        self._text = tk.StringVar(master=entry)
+        entry.configure(textvariable=self._text)
+        self._text.trace_add('write', self._on_change)
+
+        self._after_id = None
+        self._generation = 0       # Bumped for every new query; read by the worker
+        self._pending = None       # (generation, term) waiting for the worker
+        self._wakeup = threading.Condition()
+        self._done = queue.Queue() # (generation, results, error) from the worker
+        self._closed = False
+
+        threading.Thread(target=self._worker, name="live-search", daemon=True).start()
+        self._poll_id = entry.after(poll_ms, self._poll)
+        entry.bind('<Destroy>', lambda event: self.close(), add='+')
+
+    def search_now(self):
+        """Runs the current text immediately, skipping the debounce delay."""
+        self._cancel_timer()
+        self._start_query()
+
+    def close(self):
+        self._closed = True
+        self._cancel_timer()
+        with self._wakeup:
+            self._wakeup.notify()
+
+    # --- Tk thread ---
+
+    def _on_change(self, *args):
+        self._cancel_timer()
+        self._after_id = self.entry.after(self.delay_ms, self._start_query)
+
+    def _cancel_timer(self):
+        if self._after_id is not None:
+            self.entry.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _start_query(self):
+        self._after_id = None
+        self._generation += 1  # Anything still running is now stale
+        term = self._text.get().strip()
+        if not term:
+            self.on_results(term, None)
+            self.on_status("")
+            return
+        self.on_status("Searching...")
+        with self._wakeup:
+            self._pending = (self._generation, term)
+            self._wakeup.notify()
+
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                generation, term, results, error = self._done.get_nowait()
+                if generation != self._generation:
+                    continue  # The user has typed since; drop it
+                if error is not None:
+                    self.on_status(f"Search failed: {error}")
+                else:
+                    self.on_status("")
+                    self.on_results(term, results)
+        except queue.Empty:
+            pass
+        try:
+            self._poll_id = self.entry.after(self.poll_ms, self._poll)
+        except tk.TclError:
+            self.close()  # The widget is gone
+
+    # --- Worker thread ---
+
+    def _worker(self):
+        while True:
+            with self._wakeup:
+                while self._pending is None and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                generation, term = self._pending
+                self._pending = None
+            if generation != self._generation:
+                continue  # Overtaken while waiting
+            try:
+                self._done.put((generation, term, self.search_func(term), None))
+            except Exception as e:
+                self._done.put((generation, term, None, e))
@@ -0,0 +1,83 @@
+# This is 'ui/login_window.py'
+#
+# The first window the user sees. It imports nothing but tkinter, so it can
+# appear right away; the backend is loaded behind it (see ui/startup.py)
+# and the main window is opened once the login succeeds.
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+from ui import profiler as profiling
+from ui import startup
+from ui.task_executor import TaskExecutor
+
+
+def _login(username, password):
+    """Runs on a worker thread: waits for the backend to load, then checks the login."""
+    startup.wait()
+    from modules import login_system
+    return login_system.verify_login(username, password)
+
+
+def start_application(probe=False):
+    """Starts the application by showing the login window.
+
+    With `probe=True` the window closes itself once the warm-up is done and
+    the start-up timings are printed as JSON (used by benchmarks/startup.py).
+    """
+    login_window = tk.Tk()
+    login_window.title("LMS Login")
+    login_window.geometry("300x150")
+
+    frame = ttk.Frame(login_window, padding="10")
+    frame.pack(expand=True)
+
+    ttk.Label(frame, text="Username:").grid(row=0, column=0, padx=5, pady=5)
+    username_entry = ttk.Entry(frame)
+    username_entry.grid(row=0, column=1, padx=5, pady=5)
+
+    ttk.Label(frame, text="Password:").grid(row=1, column=0, padx=5, pady=5)
+    password_entry = ttk.Entry(frame, show="*") # Hides password
+    password_entry.grid(row=1, column=1, padx=5, pady=5)
+
+    login_executor = TaskExecutor(login_window, max_workers=1)
+    profiling.watch(login_window)
+
+    def handle_login():
+        username = username_entry.get()
+        password = password_entry.get()
+
+        def done(logged_in):
+            if logged_in:
+                login_executor.shutdown()
+                login_window.destroy() # Close login window
+                from ui.main_menu import launch_main_window  # Already loaded by the warm-up
+                launch_main_window() # Open main app
+            else:
+                messagebox.showerror("Login Failed", "Invalid username or password.")
+
+        # We call your existing login function (on a worker thread)!
+        login_executor.submit(_login, username, password, on_success=done, disable=[login_btn])
+
+    login_btn = ttk.Button(frame, text="Login", command=profiling.action("login", handle_login))
+    login_btn.grid(row=2, columnspan=2, pady=10)
+
+    # Once the window is on screen, load the rest of the app behind it
+    def on_first_map(event):
+        if event.widget is login_window and 'first_paint' not in startup.marks():
+            startup.mark('first_paint')
+            login_window.after_idle(startup.begin)
+            if probe:
+                finish_probe()
+    login_window.bind('<Map>', on_first_map)
+
+    def finish_probe():
+        if not startup.wait(0):
+            login_window.after(10, finish_probe)
+            return
+        import json
+        print(json.dumps(startup.marks()))
+        login_executor.shutdown()
+        login_window.destroy()
+
+    login_window.mainloop()
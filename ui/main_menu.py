@@ -1,20 +1,85 @@
 # This is the new 'ui/main_menu.py'
+#
+# The main window. It is imported in the background while the login
+# window is showing (see ui/startup.py), so its imports don't delay start-up.
 
+import datetime
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, filedialog
 
 # Import all your backend modules just like before
-from modules import login_system, book_management, member_management, issue_return
+from modules import book_management, member_management, issue_return, holds, reports
+from modules.circulation_journal import CirculationJournal, CirculationDesk, JournalError, circulate
+from utils.config import JOURNAL_CONFIG
+from ui.live_search import LiveSearch
+from ui.task_executor import TaskExecutor, BusyIndicator
+from ui.paged_treeview import PagedTreeview
+from ui import profiler as profiling
+
+# Every backend call from a button goes through this executor, so the
+# window keeps redrawing while the database works.
+_executor = None
+
+def get_executor():
+    """Returns the main window's task executor."""
+    return _executor
+
+# Issues and returns go through the desk, which journals them while the
+# database can't be reached (see modules/circulation_journal.py)
+_desk = None
+
+def _open_desk():
+    """Opens the offline journal and starts replaying it; None if it can't be used."""
+    try:
+        journal = CirculationJournal(JOURNAL_CONFIG['path'])
+    except (JournalError, OSError) as e:
+        messagebox.showerror("Offline Journal", f"Issues and returns will not work offline:\n{e}")
+        return None
+    desk = CirculationDesk(journal)
+    desk.start()
+    return desk
+
+def _online_only(op, book_id, member_id):
+    """circulate() for when the journal can't be used, so no offline fallback."""
+    return circulate(op, book_id, member_id) or {'success': False, 'offline': False, 'reason': 'error',
+                                                 'message': "Could not connect to the database."}
+
+def desk_issue_book(book_id, member_id):
+    """Issues a book through the desk: {'success': ..., 'offline': ..., 'reason': ..., 'message': ...}."""
+    if _desk is None:
+        return _online_only('issue', book_id, member_id)
+    return _desk.issue_book(book_id, member_id)
+
+def desk_return_book(book_id, member_id):
+    """Returns a book through the desk: {'success': ..., 'offline': ..., 'reason': ..., 'message': ...}."""
+    if _desk is None:
+        return _online_only('return', book_id, member_id)
+    return _desk.return_book(book_id, member_id)
 
 # --- Main Application Window ---
 
 def launch_main_window():
     """Creates the main library application window after login."""
     
+    global _executor, _desk
     main_app = tk.Tk()
     main_app.title("Library Management System")
     main_app.geometry("800x600")
 
+    # Status bar at the bottom shows when backend work is in progress
+    busy_indicator = BusyIndicator(main_app, padding="2")
+    busy_indicator.pack(side=tk.BOTTOM, fill='x')
+    _executor = TaskExecutor(main_app, busy_indicator=busy_indicator)
+    profiling.watch(main_app)  # Records event-loop stalls (--profile only)
+    _desk = _open_desk()
+
+    def on_close():
+        _executor.shutdown()
+        if _desk is not None:
+            _desk.stop()
+        main_app.destroy()
+    main_app.protocol("WM_DELETE_WINDOW", on_close)
+
     # Create a Tabbed Interface
     notebook = ttk.Notebook(main_app)
     
@@ -33,6 +98,11 @@ def launch_main_window():
     notebook.add(issue_tab, text='Issue/Return Books')
     create_issue_return_tab(issue_tab)
 
+    # --- Tab 4: Reports ---
+    reports_tab = ttk.Frame(notebook, padding="10")
+    notebook.add(reports_tab, text='Reports')
+    create_reports_tab(reports_tab)
+
     notebook.pack(expand=True, fill='both')
     main_app.mainloop()
 
@@ -45,19 +115,32 @@ def create_book_tab(tab):
     btn_frame = ttk.Frame(tab)
     btn_frame.pack(pady=10, fill='x')
 
-    ttk.Button(btn_frame, text="Add New Book", command=add_book_popup).pack(side=tk.LEFT, padx=5)
-    ttk.Button(btn_frame, text="Search Books", command=lambda: search_book_gui(tree)).pack(side=tk.LEFT, padx=5)
-    ttk.Button(btn_frame, text="Remove Selected Book", command=lambda: remove_book_gui(tree)).pack(side=tk.LEFT, padx=5)
-
-    # Treeview to display search results
-    cols = ('Book ID', 'Title', 'Author', 'ISBN', 'Genre', 'Available', 'Total')
-    tree = ttk.Treeview(tab, columns=cols, show='headings')
-    
-    for col in cols:
-        tree.heading(col, text=col)
-    
+    ttk.Button(btn_frame, text="Add New Book",
+               command=profiling.action("open add book", add_book_popup)).pack(side=tk.LEFT, padx=5)
+    ttk.Button(btn_frame, text="Search Books",
+               command=profiling.action("search books", lambda: live.search_now())).pack(side=tk.LEFT, padx=5)
+    ttk.Button(btn_frame, text="Remove Selected Book",
+               command=profiling.action("remove book", lambda: remove_book_gui(tree))).pack(side=tk.LEFT, padx=5)
+
+    # Search box: results update as you type (Title, Author, or ISBN)
+    search_frame = ttk.Frame(tab)
+    search_frame.pack(pady=(0, 10), fill='x')
+    ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=5)
+    search_entry = ttk.Entry(search_frame, width=50)
+    search_entry.pack(side=tk.LEFT, padx=5)
+    status_label = ttk.Label(search_frame, text="")
+    status_label.pack(side=tk.LEFT, padx=5)
+
+    # Treeview to display search results, loaded a page at a time
+    cols = ('Book ID', 'Title', 'Author', 'ISBN', 'Genre', 'Available', 'On Loan', 'On Hold', 'Total')
+    set_status = lambda text: status_label.config(text=text)
+    tree = PagedTreeview(tab, cols, book_row_values, book_management.search_book_page,
+                         get_executor(), on_status=set_status)
     tree.pack(expand=True, fill='both')
 
+    live = LiveSearch(search_entry, profiling.task("live search books", book_management.search_book_page),
+                      on_results=tree.load, on_status=set_status)
+
 def create_member_tab(tab):
     """Populates the Member Management tab with widgets."""
     
@@ -65,18 +148,30 @@ def create_member_tab(tab):
     btn_frame = ttk.Frame(tab)
     btn_frame.pack(pady=10, fill='x')
 
-    ttk.Button(btn_frame, text="Register New Member", command=add_member_popup).pack(side=tk.LEFT, padx=5)
-    ttk.Button(btn_frame, text="Search Members", command=lambda: search_member_gui(tree)).pack(side=tk.LEFT, padx=5)
-
-    # Treeview to display search results
+    ttk.Button(btn_frame, text="Register New Member",
+               command=profiling.action("open register member", add_member_popup)).pack(side=tk.LEFT, padx=5)
+    ttk.Button(btn_frame, text="Search Members",
+               command=profiling.action("search members", lambda: live.search_now())).pack(side=tk.LEFT, padx=5)
+
+    # Search box: results update as you type (Name or Email)
+    search_frame = ttk.Frame(tab)
+    search_frame.pack(pady=(0, 10), fill='x')
+    ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=5)
+    search_entry = ttk.Entry(search_frame, width=50)
+    search_entry.pack(side=tk.LEFT, padx=5)
+    status_label = ttk.Label(search_frame, text="")
+    status_label.pack(side=tk.LEFT, padx=5)
+
+    # Treeview to display search results, loaded a page at a time
     cols = ('Member ID', 'Name', 'Email', 'Phone', 'Reg. Date')
-    tree = ttk.Treeview(tab, columns=cols, show='headings')
-    
-    for col in cols:
-        tree.heading(col, text=col)
-    
+    set_status = lambda text: status_label.config(text=text)
+    tree = PagedTreeview(tab, cols, member_row_values, member_management.view_member_details_page,
+                         get_executor(), on_status=set_status)
     tree.pack(expand=True, fill='both')
 
+    live = LiveSearch(search_entry, profiling.task("live search members", member_management.view_member_details_page),
+                      on_results=tree.load, on_status=set_status)
+
 def create_issue_return_tab(tab):
     """Populates the Issue/Return tab with widgets."""
     
@@ -101,13 +196,32 @@ def create_issue_return_tab(tab):
             messagebox.showwarning("Input Error", "Book ID and Member ID are required.")
             return
         
-        # We call your existing backend function!
-        if issue_return.issue_book(int(book_id), int(member_id)):
-            messagebox.showinfo("Success", f"Book ID {book_id} issued to member ID {member_id}.")
-            book_id_entry.delete(0, tk.END)
-            member_id_entry.delete(0, tk.END)
-        else:
-            messagebox.showerror("Error", "Failed to issue book. Check availability or inputs.")
+        def done(result):
+            if result['success']:
+                text = f"Book ID {book_id} issued to member ID {member_id}."
+                if result['offline']:  # The database is unreachable; the desk journaled it
+                    messagebox.showinfo("Recorded Offline", f"{text}\n\n{result['message']}")
+                else:
+                    messagebox.showinfo("Success", text)
+                book_id_entry.delete(0, tk.END)
+                member_id_entry.delete(0, tk.END)
+            elif result['reason'] != issue_return.NO_COPY:  # A wrong ID or a database error
+                messagebox.showerror("Error", f"The book could not be issued. {result['message']}")
+            elif messagebox.askyesno("Not Available",
+                                     f"No copy of book ID {book_id} is free.\n\n"
+                                     f"Place a hold on it for member ID {member_id}?"):
+                get_executor().submit(holds.place_hold, int(book_id), int(member_id),
+                                      on_success=hold_placed, disable=[issue_btn, return_btn])
+
+        def hold_placed(result):
+            if result['success']:
+                messagebox.showinfo("Hold Placed", result['message'])
+            else:
+                messagebox.showerror("Error", f"Failed to place hold: {result['message']}")
+
+        # We call your existing backend function (on a worker thread)!
+        get_executor().submit(desk_issue_book, int(book_id), int(member_id),
+                              on_success=done, disable=[issue_btn, return_btn])
 
     def return_gui():
         book_id = book_id_entry.get()
@@ -116,16 +230,104 @@ def create_issue_return_tab(tab):
             messagebox.showwarning("Input Error", "Book ID and Member ID are required.")
             return
 
-        # We call your existing backend function!
-        if issue_return.return_book(int(book_id), int(member_id)):
-            messagebox.showinfo("Success", f"Book ID {book_id} returned by member ID {member_id}.")
-            book_id_entry.delete(0, tk.END)
-            member_id_entry.delete(0, tk.END)
-        else:
-            messagebox.showerror("Error", "Failed to return book. Check inputs.")
+        def done(result):
+            if result['success']:
+                text = f"Book ID {book_id} returned by member ID {member_id}."
+                if result['offline']:  # The database is unreachable; the desk journaled it
+                    messagebox.showinfo("Recorded Offline", f"{text}\n\n{result['message']}")
+                else:
+                    messagebox.showinfo("Success", text)
+                book_id_entry.delete(0, tk.END)
+                member_id_entry.delete(0, tk.END)
+            else:
+                messagebox.showerror("Error", result['message'] or "Failed to return book. Check inputs.")
+
+        # We call your existing backend function (on a worker thread)!
+        get_executor().submit(desk_return_book, int(book_id), int(member_id),
+                              on_success=done, disable=[issue_btn, return_btn])
+
+    issue_btn = ttk.Button(btn_frame, text="Issue Book", command=profiling.action("issue book", issue_gui))
+    issue_btn.pack(side=tk.LEFT, padx=10, ipady=5)
+    return_btn = ttk.Button(btn_frame, text="Return Book", command=profiling.action("return book", return_gui))
+    return_btn.pack(side=tk.LEFT, padx=10, ipady=5)
+
+    # Whether the desk is working offline, checked once a second
+    sync_label = ttk.Label(tab, text="")
+    sync_label.pack(pady=5)
+
+    def show_sync_status():
+        if _desk is not None:
+            status = _desk.status()
+            text = f"Offline: {status['pending']} issues/returns waiting to sync." if status['offline'] else ""
+            if status['conflicts']:
+                text += (f" {status['conflicts']} synced issues/returns could not be applied "
+                         "(see python replay_journal.py --conflicts).")
+            sync_label.config(text=text.strip())
+        tab.after(1000, show_sync_status)
+    show_sync_status()
+
+def create_reports_tab(tab):
+    """Populates the Reports tab: pick a report and export it to a file."""
 
-    ttk.Button(btn_frame, text="Issue Book", command=issue_gui).pack(side=tk.LEFT, padx=10, ipady=5)
-    ttk.Button(btn_frame, text="Return Book", command=return_gui).pack(side=tk.LEFT, padx=10, ipady=5)
+    form_frame = ttk.Frame(tab, padding="10")
+    form_frame.pack(pady=20)
+
+    titles = {report.title: name for name, report in reports.REPORTS.items()}
+    ttk.Label(form_frame, text="Report:").grid(row=0, column=0, padx=5, pady=5, sticky='w')
+    report_box = ttk.Combobox(form_frame, values=list(titles), state='readonly', width=35)
+    report_box.current(0)
+    report_box.grid(row=0, column=1, padx=5, pady=5)
+
+    # Dates are optional: blank means today / the last 30 days
+    today = datetime.date.today()
+    date_entries = {}
+    for row, (label, default) in enumerate([("From (YYYY-MM-DD):", today - datetime.timedelta(days=30)),
+                                            ("To / As of (YYYY-MM-DD):", today)], start=1):
+        ttk.Label(form_frame, text=label).grid(row=row, column=0, padx=5, pady=5, sticky='w')
+        entry = ttk.Entry(form_frame, width=38)
+        entry.insert(0, default.isoformat())
+        entry.grid(row=row, column=1, padx=5, pady=5)
+        date_entries[row] = entry
+
+    ttk.Label(form_frame, text="Format:").grid(row=3, column=0, padx=5, pady=5, sticky='w')
+    format_box = ttk.Combobox(form_frame, values=list(reports.FORMATS), state='readonly', width=35)
+    format_box.current(0)
+    format_box.grid(row=3, column=1, padx=5, pady=5)
+
+    status_label = ttk.Label(tab, text="")
+    status_label.pack(pady=5)
+
+    def export_gui():
+        name = titles[report_box.get()]
+        fmt = format_box.get()
+        try:
+            start = datetime.date.fromisoformat(date_entries[1].get().strip())
+            end = datetime.date.fromisoformat(date_entries[2].get().strip())
+        except ValueError:
+            messagebox.showwarning("Input Error", "Dates must look like 2024-01-31.")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=reports.FORMATS[fmt],
+                                            initialfile=f"{name}_{end.isoformat()}{reports.FORMATS[fmt]}")
+        if not path:
+            return
+
+        def done(summary):
+            status_label.config(text=f"Wrote {summary['rows']:,} rows in {summary['seconds']}s.")
+            messagebox.showinfo("Success", f"Report saved to {summary['path']}.")
+
+        def failed(error):
+            status_label.config(text="")
+            messagebox.showerror("Error", f"Failed to export report: {error}")
+
+        status_label.config(text="Running report...")
+        # Runs on a worker thread; rows stream straight from the database to the file
+        get_executor().submit(reports.run_report, name, path, fmt=fmt, as_of=end, start=start, end=end,
+                              on_success=done, on_error=failed,
+                              on_progress=lambda text: status_label.config(text=text),
+                              disable=[export_btn])
+
+    export_btn = ttk.Button(tab, text="Export Report", command=profiling.action("export report", export_gui))
+    export_btn.pack(pady=10, ipady=5)
 
 
 # --- Pop-up Window Functions (for Forms) ---
@@ -149,20 +351,33 @@ def add_book_popup():
 
     def submit():
         try:
-            # We call your existing backend function!
-            book_management.add_book(
-                title=entries['Title'].get(),
-                author=entries['Author'].get(),
-                isbn=entries['ISBN'].get(),
-                genre=entries['Genre'].get(),
-                quantity=int(entries['Quantity'].get())
-            )
-            messagebox.showinfo("Success", "Book added successfully!")
-            popup.destroy()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add book: {e}")
-
-    ttk.Button(frame, text="Submit", command=submit).grid(row=len(fields), columnspan=2, pady=10)
+            quantity = int(entries['Quantity'].get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Failed to add book: {e}", parent=popup)
+            return
+
+        def done(added):
+            if added:
+                messagebox.showinfo("Success", "Book added successfully!")
+                popup.destroy()
+            else:
+                messagebox.showerror("Error", "Failed to add book.", parent=popup)
+
+        # We call your existing backend function (on a worker thread)!
+        get_executor().submit(
+            book_management.add_book,
+            title=entries['Title'].get(),
+            author=entries['Author'].get(),
+            isbn=entries['ISBN'].get(),
+            genre=entries['Genre'].get(),
+            quantity=quantity,
+            on_success=done,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to add book: {e}", parent=popup),
+            disable=[submit_btn]
+        )
+
+    submit_btn = ttk.Button(frame, text="Submit", command=profiling.action("add book", submit))
+    submit_btn.grid(row=len(fields), columnspan=2, pady=10)
 
 def add_member_popup():
     """Creates a pop-up form to register a new member."""
@@ -181,120 +396,75 @@ def add_member_popup():
         entries[field] = entry
     
     def submit():
-        try:
-            # We call your existing backend function!
-            member_management.register_member(
-                name=entries['Name'].get(),
-                email=entries['Email'].get(),
-                phone_number=entries['Phone Number'].get()
-            )
-            messagebox.showinfo("Success", "Member registered successfully!")
-            popup.destroy()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to register member: {e}")
-
-    ttk.Button(frame, text="Register", command=submit).grid(row=len(fields), columnspan=2, pady=10)
+        def done(registered):
+            if registered:
+                messagebox.showinfo("Success", "Member registered successfully!")
+                popup.destroy()
+            else:
+                messagebox.showerror("Error", "Failed to register member.", parent=popup)
+
+        # We call your existing backend function (on a worker thread)!
+        get_executor().submit(
+            member_management.register_member,
+            name=entries['Name'].get(),
+            email=entries['Email'].get(),
+            phone_number=entries['Phone Number'].get(),
+            on_success=done,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to register member: {e}", parent=popup),
+            disable=[register_btn]
+        )
+
+    register_btn = ttk.Button(frame, text="Register", command=profiling.action("register member", submit))
+    register_btn.grid(row=len(fields), columnspan=2, pady=10)
 
 # --- GUI Helper Functions (connecting buttons to backend) ---
 
-def search_book_gui(tree):
-    """Prompts for search term and displays results in the Treeview."""
-    term = simpledialog.askstring("Search", "Enter Title, Author, or ISBN:")
-    if not term:
-        return
-        
-    # Clear old results
-    for item in tree.get_children():
-        tree.delete(item)
-        
-    # We call your existing backend function!
-    results = book_management.search_book(term)
-    
-    # Populate the tree
-    for book in results:
-        tree.insert('', tk.END, values=(
-            book['book_id'],
-            book['title'],
-            book['author'],
-            book['isbn'],
-            book['genre'],
-            book['available_quantity'],
-            book['quantity']
-        ))
+def book_row_values(book):
+    """Turns a books row into the Book tab's column values."""
+    return (
+        book['book_id'],
+        book['title'],
+        book['author'],
+        book['isbn'],
+        book['genre'],
+        book['available_quantity'],
+        book['on_loan'],
+        book['held_copies'],
+        book['quantity']
+    )
 
 def remove_book_gui(tree):
     """Removes the book selected in the Treeview."""
-    selected_item = tree.focus() # Get selected item
-    if not selected_item:
+    selected_row = tree.focused_row() # Get selected row
+    if not selected_row:
         messagebox.showwarning("No Selection", "Please select a book from the list to remove.")
         return
         
     # Get book ID from the selected row (it's the first value)
-    book_id = tree.item(selected_item)['values'][0]
+    book_id = selected_row[0]
     
     if messagebox.askyesno("Confirm", f"Are you sure you want to remove book ID {book_id}?"):
-        # We call your existing backend function!
-        if book_management.remove_book(book_id):
-            messagebox.showinfo("Success", f"Book ID {book_id} removed.")
-            tree.delete(selected_item) # Remove from view
-        else:
-            messagebox.showerror("Error", "Failed to remove book. (Is it currently issued?)")
-
-def search_member_gui(tree):
-    """Prompts for search term and displays member results."""
-    term = simpledialog.askstring("Search", "Enter Name or Email:")
-    if not term:
-        return
-        
-    for item in tree.get_children():
-        tree.delete(item)
-        
-    results = member_management.view_member_details(term)
-    
-    for member in results:
-        tree.insert('', tk.END, values=(
-            member['member_id'],
-            member['name'],
-            member['email'],
-            member['phone_number'],
-            member['registration_date']
-        ))
-
-
-# --- Login Window ---
-
-def start_application():
-    """Starts the application by showing the login window."""
-    
-    login_window = tk.Tk()
-    login_window.title("LMS Login")
-    login_window.geometry("300x150")
-    
-    frame = ttk.Frame(login_window, padding="10")
-    frame.pack(expand=True)
-
-    ttk.Label(frame, text="Username:").grid(row=0, column=0, padx=5, pady=5)
-    username_entry = ttk.Entry(frame)
-    username_entry.grid(row=0, column=1, padx=5, pady=5)
-    
-    ttk.Label(frame, text="Password:").grid(row=1, column=0, padx=5, pady=5)
-    password_entry = ttk.Entry(frame, show="*") # Hides password
-    password_entry.grid(row=1, column=1, padx=5, pady=5)
-
-    def handle_login():
-        username = username_entry.get()
-        password = password_entry.get()
-        
-        # We call your existing login function!
-        if login_system.verify_login(username, password):
-            login_window.destroy() # Close login window
-            launch_main_window() # Open main app
-        else:
-            messagebox.showerror("Login Failed", "Invalid username or password.")
-
-    ttk.Button(frame, text="Login", command=handle_login).grid(row=2, columnspan=2, pady=10)
-    
-    login_window.mainloop()
-
-# Note: The 'if __name__ == "__main__":' block is in main.py
-# This file (main_menu.py) only needs to EXPORT the start_application function.
\ No newline at end of file
+        def done(removed):
+            if removed:
+                messagebox.showinfo("Success", f"Book ID {book_id} removed.")
+                if tree.focused_row() == selected_row:
+                    tree.remove_focused() # Remove from view
+            else:
+                messagebox.showerror("Error", "Failed to remove book. (Is it currently issued?)")
+
+        # We call your existing backend function (on a worker thread)!
+        get_executor().submit(book_management.remove_book, book_id, on_success=done)
+
+def member_row_values(member):
+    """Turns a members row into the Member tab's column values."""
+    return (
+        member['member_id'],
+        member['name'],
+        member['email'],
+        member['phone_number'],
+        member['registration_date']
+    )
+
+
+# Note: The login window is in ui/login_window.py, and the
+# 'if __name__ == "__main__":' block is in main.py
@@ -0,0 +1,193 @@
+# This is 'ui/paged_treeview.py'
+#
+# A Treeview for result lists too long to insert all at once. Rows are
+# fetched a page at a time as the user scrolls, and the Treeview itself
+# only ever holds as many items as fit on screen: scrolling just rewrites
+# the values of those items.
+
+import tkinter as tk
+from tkinter import ttk
+
+DEFAULT_ROW_HEIGHT = 20
+HEADER_HEIGHT = 25
+
+
+class PagedTreeview(ttk.Frame):
+    """A windowed, lazily loaded Treeview.
+
+    `fetch_page(query, cursor)` must return (rows, next_cursor) like
+    book_management.search_book_page; it runs on `executor`. `row_values`
+    turns one row into the tuple of column values.
+    """
+
+    def __init__(self, master, columns, row_values, fetch_page, executor,
+                 prefetch_rows=100, on_status=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_values = row_values
+        self.fetch_page = fetch_page
+        self.executor = executor
+        self.prefetch_rows = prefetch_rows  # Keep this many rows loaded below the window
+        self.on_status = on_status or (lambda text: None)
+
+        self.tree = ttk.Treeview(self, columns=columns, show='headings', selectmode='browse')
+        for col in columns:
+            self.tree.heading(col, text=col)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.tree.pack(side=tk.LEFT, expand=True, fill='both')
+
+        self._rows = []           # Value tuples of every row loaded so far
+        self._query = None
+        self._next_cursor = None  # None once the last page is loaded
+        self._generation = 0      # Bumped by load(); stale page fetches are dropped
+        self._loading = False
+        self._offset = 0          # Index of the row shown in the first slot
+        self._visible = 1         # Rows that fit in the widget
+        self._slots = []          # Treeview item ids, reused while scrolling
+        self._selected = None     # Index into self._rows
+
+        style_height = ttk.Style(self).lookup('Treeview', 'rowheight')
+        self._row_height = int(style_height) if style_height else DEFAULT_ROW_HEIGHT
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self._on_wheel)
+        self.tree.bind('<Up>', lambda event: self._move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self._move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self._move_selection(-self._visible))
+        self.tree.bind('<Next>', lambda event: self._move_selection(self._visible))
+
+    # --- Public API ---
+
+    def load(self, query, page):
+        """Shows the first page of a new result set."""
+        rows, next_cursor = page if page else ([], None)
+        self._generation += 1
+        self._query = query
+        self._rows = [self.row_values(row) for row in rows]
+        self._next_cursor = next_cursor
+        self._loading = False
+        self._offset = 0
+        self._selected = None
+        self._render()
+        self._maybe_prefetch()
+
+    def focused_row(self):
+        """Returns the values of the selected row, or None."""
+        if self._selected is None:
+            return None
+        return self._rows[self._selected]
+
+    def remove_focused(self):
+        """Drops the selected row from the list (e.g. after deleting it)."""
+        if self._selected is not None:
+            del self._rows[self._selected]
+            self._selected = None
+            self._render()
+
+    def scroll_to(self, offset):
+        last_start = max(0, len(self._rows) - self._visible)
+        self._offset = max(0, min(int(offset), last_start))
+        self._render()
+        self._maybe_prefetch()
+
+    # --- Rendering ---
+
+    def _render(self):
+        count = max(0, min(self._visible, len(self._rows) - self._offset))
+        # Grow or shrink the pool of items to what fits on screen
+        while len(self._slots) < count:
+            self._slots.append(self.tree.insert('', tk.END))
+        while len(self._slots) > count:
+            self.tree.delete(self._slots.pop())
+
+        selected_slot = None
+        for i, slot in enumerate(self._slots):
+            index = self._offset + i
+            self.tree.item(slot, values=self._rows[index])
+            if index == self._selected:
+                selected_slot = slot
+        if selected_slot is not None:
+            self.tree.selection_set(selected_slot)
+            self.tree.focus(selected_slot)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+
+        total = len(self._rows)
+        if total:
+            self.scrollbar.set(self._offset / total, (self._offset + count) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        more = '+' if self._next_cursor is not None else ''
+        self.on_status(f"{total}{more} result(s)" if self._query else "")
+
+    def _maybe_prefetch(self):
+        if self._next_cursor is None or self._loading:
+            return
+        if self._offset + self._visible + self.prefetch_rows < len(self._rows):
+            return
+        self._loading = True
+        generation = self._generation
+        self.executor.submit(self.fetch_page, self._query, self._next_cursor,
+                             on_success=lambda page: self._append(generation, page),
+                             on_error=lambda error: self._fetch_failed(generation, error))
+
+    def _append(self, generation, page):
+        if generation != self._generation:
+            return  # A newer search replaced these results
+        rows, next_cursor = page
+        self._loading = False
+        self._rows.extend(self.row_values(row) for row in rows)
+        self._next_cursor = next_cursor
+        self._render()
+        self._maybe_prefetch()
+
+    def _fetch_failed(self, generation, error):
+        if generation == self._generation:
+            self._loading = False
+            self.on_status(f"Could not load more results: {error}")
+
+    # --- Event handlers ---
+
+    def _on_resize(self, event):
+        visible = max(1, (event.height - HEADER_HEIGHT) // self._row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self.scroll_to(self._offset)
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self._slots:
+            self._selected = self._offset + self._slots.index(selection[0])
+
+    def _on_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_to(self._offset - 3)
+        else:
+            self.scroll_to(self._offset + 3)
+        return 'break'  # Don't let the Treeview scroll its own items
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll_to(float(amount) * len(self._rows))
+        elif unit == 'pages':
+            self.scroll_to(self._offset + int(amount) * self._visible)
+        else:
+            self.scroll_to(self._offset + int(amount))
+
+    def _move_selection(self, step):
+        if not self._rows:
+            return 'break'
+        if self._selected is None:
+            self._selected = self._offset
+        else:
+            self._selected = max(0, min(self._selected + step, len(self._rows) - 1))
+        # Keep the selected row inside the window
+        if self._selected < self._offset:
+            self.scroll_to(self._selected)
+        elif self._selected >= self._offset + self._visible:
+            self.scroll_to(self._selected - self._visible + 1)
+        else:
+            self._render()
+        return 'break'
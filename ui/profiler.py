@@ -0,0 +1,392 @@
+# This is 'ui/profiler.py'
+#
+# Opt-in profiling for the desktop app (python main.py --profile). Every
+# user action, like "issue book" or "search books", is profiled from the
+# click until its results are back on screen:
+#
+#   - cProfile runs while the action's code runs, on the Tk thread and on
+#     the worker threads that do its backend calls
+#   - a sampler thread records the call stack of that code every few
+#     milliseconds, for flame graphs
+#   - a heartbeat on the Tk event loop records every stall longer than
+#     stall_ms, and which action was running at the time
+#
+# On exit it writes to the output directory:
+#   <action>.prof     cProfile stats (snakeviz, `python -m pstats`)
+#   <action>.folded   collapsed stacks (flamegraph.pl, speedscope, inferno)
+#   all.folded        every action in one flame graph, the action as root
+#   summary.json      per-action timings and every stall
+#   summary.txt       the summary table, also printed to stderr
+#
+# When profiling is off, action() and task() return the function
+# unchanged, so the app runs exactly as before.
+
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+UNATTRIBUTED = '(other callbacks)'  # Tk work outside any named action: polls, scrolling, ...
+TOP_FUNCTIONS = 5                   # Functions listed per action in summary.txt
+
+_profiler = None
+
+
+def get_profiler():
+    """Returns the running UIProfiler, or None when profiling is off."""
+    return _profiler
+
+
+def enable(output_dir, stall_ms=100, sample_ms=5):
+    """Turns profiling on for the rest of the program; returns the profiler."""
+    global _profiler
+    if _profiler is None:
+        _profiler = UIProfiler(output_dir, stall_ms, sample_ms)
+    return _profiler
+
+
+def action(name, func):
+    """Wraps a button or key handler so each call is profiled as action `name`."""
+    return _profiler.wrap_action(name, func) if _profiler is not None else func
+
+
+def task(name, func):
+    """Wraps a function that runs on its own worker thread (like LiveSearch's query)."""
+    return _profiler.wrap_task(name, func) if _profiler is not None else func
+
+
+def watch(root):
+    """Starts the stall heartbeat on a Tk window's event loop."""
+    if _profiler is not None:
+        _profiler.watch(root)
+
+
+def finish():
+    """Stops profiling and writes the results; returns the summary table text."""
+    global _profiler
+    if _profiler is None:
+        return None
+    profiler, _profiler = _profiler, None
+    return profiler.finish()
+
+
+class _Run:
+    """One execution of an action, from the click until its last task is done."""
+
+    __slots__ = ('action', 'started', 'pending', 'handler_done', 'result_at')
+
+    def __init__(self, action):
+        self.action = action
+        self.started = time.perf_counter()
+        self.pending = 0          # Executor tasks submitted for this run, not yet called back
+        self.handler_done = False
+        self.result_at = None     # When the last result reached the Tk thread
+
+
+class _ActionStats:
+    def __init__(self):
+        self.durations = []       # Click-to-result seconds per run
+        self.ui_cpu = 0.0         # Tk thread CPU seconds (handlers and callbacks)
+        self.worker = 0.0         # Worker thread wall seconds
+        self.stalls = []          # Stall seconds while this action was on the Tk thread
+        self.stats = None         # Merged pstats.Stats
+        self.stacks = Counter()   # Folded stack -> samples
+
+
+class UIProfiler:
+    """Collects per-action profiles, stack samples and event-loop stalls."""
+
+    def __init__(self, output_dir, stall_ms=100, sample_ms=5):
+        # Imported here: the login window loads this module and must appear fast
+        from utils.metrics import registry
+        self._action_seconds = registry.histogram('lms_ui_action_seconds', "Click-to-result time of UI actions.",
+                                                  ('action',))
+        self._stall_seconds = registry.histogram('lms_ui_stall_seconds', "Tk event loop stalls.", ('action',))
+        self.output_dir = output_dir
+        self.stall_seconds = stall_ms / 1000.0
+        self.sample_interval = sample_ms / 1000.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._actions = defaultdict(_ActionStats)
+        self._stalls = []               # (seconds since start, stall seconds, action)
+        self._current = None            # The _Run whose code the Tk thread is running
+        self._tk_profile = None         # Active cProfile on the Tk thread (never nested)
+        self._tk_thread = threading.get_ident()
+        self._workers = {}              # Thread id -> action name, while running a task
+        self._tk_recent = Counter()     # Actions sampled on the Tk thread since the last heartbeat
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="ui-profiler", daemon=True)
+        self._sampler.start()
+
+    # --- Wrapping handlers (Tk thread) ---
+
+    def wrap_action(self, name, func):
+        def handler(*args, **kwargs):
+            if self._current is not None:  # Called from inside another action: part of it
+                return func(*args, **kwargs)
+            run = _Run(name)
+            try:
+                return self.on_tk_thread(run, func, *args, **kwargs)
+            finally:
+                run.handler_done = True
+                self._maybe_finish(run)
+        handler.__name__ = getattr(func, '__name__', 'handler')
+        return handler
+
+    def on_tk_thread(self, run, func, *args, **kwargs):
+        """Runs func on the Tk thread as part of `run` (a handler or a callback)."""
+        outer, self._current = self._current, run
+        outermost = self._tk_profile is None  # A message box's nested event loop can re-enter here
+        profile = None
+        if outermost:
+            profile = self._tk_profile = cProfile.Profile()
+        cpu_started = time.thread_time()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler owns this interpreter; CPU time still counts
+                profile = None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            if outermost:
+                self._tk_profile = None
+            cpu = time.thread_time() - cpu_started
+            self._current = outer
+            with self._lock:
+                stats = self._actions[run.action]
+                if outermost:
+                    stats.ui_cpu += cpu
+                if profile is not None:
+                    self._merge(stats, profile)
+
+    # --- Executor tasks ---
+
+    def current_run(self):
+        """The run whose code is executing on the Tk thread right now, if any."""
+        return self._current
+
+    def task_submitted(self, run):
+        run.pending += 1
+
+    def task_done(self, run):
+        """Called on the Tk thread once a task's callback has run."""
+        run.pending -= 1
+        self._maybe_finish(run)
+
+    def result_arrived(self, run):
+        run.result_at = time.perf_counter()
+
+    def in_worker(self, action_name, func):
+        """Wraps func so it is profiled as part of `action_name` on a worker thread."""
+        def work(*args, **kwargs):
+            thread = threading.get_ident()
+            self._workers[thread] = action_name
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler owns this interpreter; samples still work
+                profile = None
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                elapsed = time.perf_counter() - started
+                self._workers.pop(thread, None)
+                with self._lock:
+                    stats = self._actions[action_name]
+                    stats.worker += elapsed
+                    if profile is not None:
+                        self._merge(stats, profile)
+        return work
+
+    def wrap_task(self, name, func):
+        worker = self.in_worker(name, func)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return worker(*args, **kwargs)
+            finally:
+                self._record_run(name, time.perf_counter() - started)
+        return timed
+
+    def _maybe_finish(self, run):
+        if run.handler_done and run.pending == 0:
+            ended = run.result_at or time.perf_counter()
+            self._record_run(run.action, ended - run.started)
+
+    def _record_run(self, name, seconds):
+        self._action_seconds.observe(seconds, name)
+        with self._lock:
+            self._actions[name].durations.append(seconds)
+
+    @staticmethod
+    def _merge(stats, profile):
+        """Adds a finished cProfile run to an action's stats. Caller holds the lock."""
+        import pstats
+        profile.create_stats()
+        if not profile.stats:
+            return
+        if stats.stats is None:
+            stats.stats = pstats.Stats(profile)
+        else:
+            stats.stats.add(profile)
+
+    # --- Stall heartbeat (Tk thread) ---
+
+    def watch(self, root, tick_ms=20):
+        tick = tick_ms / 1000.0
+        expected = [time.perf_counter() + tick]
+
+        def beat():
+            now = time.perf_counter()
+            late = now - expected[0]
+            with self._lock:
+                recent, self._tk_recent = self._tk_recent, Counter()
+            if late >= self.stall_seconds:
+                blamed = recent.most_common(1)[0][0] if recent else UNATTRIBUTED
+                self._stall_seconds.observe(late, blamed)
+                with self._lock:
+                    self._stalls.append((round(now - self.started, 3), late, blamed))
+                    self._actions[blamed].stalls.append(late)
+            if not self._stop.is_set():
+                expected[0] = time.perf_counter() + tick
+                try:
+                    root.after(tick_ms, beat)
+                except Exception:
+                    pass  # The window is gone
+        root.after(tick_ms, beat)
+
+    # --- Stack sampler (its own thread) ---
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            samples = []
+            for thread, frame in frames.items():
+                if thread == me:
+                    continue
+                if thread == self._tk_thread:
+                    if _tk_idle(frame):
+                        continue
+                    run = self._current
+                    samples.append((run.action if run else UNATTRIBUTED, 'tk', frame))
+                else:
+                    name = self._workers.get(thread)
+                    if name is not None:
+                        samples.append((name, 'worker', frame))
+            del frames
+            if not samples:
+                continue
+            folded = [(name, where, _fold(frame)) for name, where, frame in samples]
+            del samples
+            with self._lock:
+                for name, where, stack in folded:
+                    self._actions[name].stacks[f"{where};{stack}"] += 1
+                    if where == 'tk':
+                        self._tk_recent[name] += 1
+
+    # --- Results ---
+
+    def finish(self):
+        import json
+        self._stop.set()
+        self._sampler.join(timeout=1.0)
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            actions = dict(self._actions)
+            stalls = list(self._stalls)
+
+        summary = {'seconds': round(time.perf_counter() - self.started, 3),
+                   'stall_threshold_ms': self.stall_seconds * 1000, 'actions': {},
+                   'stalls': [{'at': at, 'ms': round(late * 1000, 1), 'action': name}
+                              for at, late, name in stalls]}
+        combined = []
+        for name, stats in sorted(actions.items()):
+            slug = _slug(name)
+            if stats.stats is not None:
+                stats.stats.dump_stats(os.path.join(self.output_dir, slug + '.prof'))
+            if stats.stacks:
+                with open(os.path.join(self.output_dir, slug + '.folded'), 'w', encoding='utf-8') as f:
+                    for stack, count in stats.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+                combined.extend((f"{name};{stack}", count) for stack, count in stats.stacks.items())
+            summary['actions'][name] = _action_summary(stats)
+        with open(os.path.join(self.output_dir, 'all.folded'), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(combined):
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        text = _summary_table(summary, actions)
+        with open(os.path.join(self.output_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(text)
+        return text
+
+
+def _tk_idle(frame):
+    """True if the Tk thread is waiting for events (mainloop or a modal dialog)."""
+    code = frame.f_code
+    return 'tkinter' in code.co_filename and code.co_name in ('mainloop', 'show', '_show', 'wait_window')
+
+
+def _fold(frame, max_depth=64):
+    """The stack as 'outer;...;inner' with one 'function (file:line)' per frame."""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'action'
+
+
+def _ms(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+def _action_summary(stats):
+    return {'runs': len(stats.durations),
+            'mean_ms': round(sum(stats.durations) / len(stats.durations) * 1000, 1) if stats.durations else 0.0,
+            'p95_ms': _ms(stats.durations, 95),
+            'max_ms': round(max(stats.durations) * 1000, 1) if stats.durations else 0.0,
+            'ui_cpu_ms': round(stats.ui_cpu * 1000, 1),
+            'worker_ms': round(stats.worker * 1000, 1),
+            'stalls': len(stats.stalls),
+            'worst_stall_ms': round(max(stats.stalls) * 1000, 1) if stats.stalls else 0.0,
+            'samples': sum(stats.stacks.values())}
+
+
+def _summary_table(summary, actions):
+    lines = [f"UI profile: {summary['seconds']}s, {len(summary['stalls'])} stall(s) "
+             f"over {summary['stall_threshold_ms']:.0f} ms",
+             f"{'action':<28}{'runs':>6}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"
+             f"{'ui cpu ms':>11}{'worker ms':>11}{'stalls':>8}{'worst ms':>10}"]
+    for name, row in sorted(summary['actions'].items(), key=lambda item: -item[1]['worker_ms'] - item[1]['ui_cpu_ms']):
+        lines.append(f"{name[:27]:<28}{row['runs']:>6}{row['mean_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                     f"{row['max_ms']:>10.1f}{row['ui_cpu_ms']:>11.1f}{row['worker_ms']:>11.1f}"
+                     f"{row['stalls']:>8}{row['worst_stall_ms']:>10.1f}")
+    for name, stats in sorted(actions.items()):
+        if stats.stats is None:
+            continue
+        lines.append(f"\n{name}: top functions by own time")
+        entries = sorted(stats.stats.stats.items(), key=lambda item: -item[1][2])[:TOP_FUNCTIONS]
+        for (filename, line, function), (_, calls, own, total, _) in entries:
+            lines.append(f"  {own * 1000:>9.1f} ms own {total * 1000:>9.1f} ms total {calls:>7} calls  "
+                         f"{function} ({os.path.basename(filename)}:{line})")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,75 @@
+# This is 'ui/startup.py'
+#
+# Fast start-up. The login window only needs tkinter, so main.py shows it
+# first, and this module loads everything else on a background thread
+# while the user types: logging, the backend modules (and with them the
+# database driver), the main window's code, and a warm pooled connection
+# (which, on SQLite, also applies any pending migrations), then the member
+# lookup index.
+#
+# mark() records how many milliseconds after main.py started each step
+# finished; benchmarks/startup.py reads them through --startup-probe.
+
+import threading
+import time
+
+_started = time.perf_counter()  # Imported first thing by main.py
+_marks = {}
+_done = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def mark(name):
+    """Records that step `name` has been reached (the first time only)."""
+    _marks.setdefault(name, round((time.perf_counter() - _started) * 1000, 2))
+
+
+def marks():
+    """Returns {step: milliseconds since start} for the steps reached so far."""
+    return dict(_marks)
+
+
+def begin():
+    """Starts the background warm-up, once."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm_up, name="lms-warmup", daemon=True)
+            _thread.start()
+
+
+def wait(timeout=None):
+    """Blocks until the warm-up has finished; False if `timeout` ran out first."""
+    begin()
+    return _done.wait(timeout)
+
+
+def _warm_up():
+    log = None
+    try:
+        from utils.log import configure_logging, get_logger
+        configure_logging()  # Before any backend module can log
+        log = get_logger(__name__)
+        import modules.login_system  # Pulls in the database layer
+        mark('backend_imported')
+        import ui.main_menu  # The other backend modules and the main window
+        mark('main_window_imported')
+
+        from database.db_connection import warm_pool
+        try:
+            warm_pool()
+            mark('pool_warm')
+        except Exception as e:  # The server may be down; login will report it
+            log.warning("Could not open a database connection in advance", error=str(e))
+            return
+        # The first member search at the desk shouldn't wait for the index
+        from modules.member_management import get_member_index
+        get_member_index()
+        mark('member_index_ready')
+    except Exception as e:
+        if log is not None:
+            log.error("Start-up warm-up failed", error=str(e))
+    finally:
+        mark('warm_up_done')
+        _done.set()
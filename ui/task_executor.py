@@ -0,0 +1,186 @@
+# This is 'ui/task_executor.py'
+#
+# Runs backend calls off the Tk thread. Tkinter is not thread-safe, so
+# workers never touch widgets: they put their outcome on a queue, and the
+# Tk thread drains it with after() and calls the callbacks there.
+
+import queue
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+from ui.profiler import get_profiler
+
+
+class TaskExecutor:
+    """A thread pool whose completion callbacks run on the Tk thread.
+
+    `root` is any widget of the window; `busy_indicator` (optional) is told
+    how many tasks are in flight so it can show a progress bar.
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=16, busy_indicator=None):
+        self.root = root
+        self.poll_ms = poll_ms  # ~60 checks per second while work is in flight
+        self.busy_indicator = busy_indicator
+        self.max_workers = max_workers
+        self._pool = None  # Started by the first submit(), off the start-up path
+        self._events = queue.Queue()
+        self._in_flight = 0
+        self._polling = False
+        self._closed = False
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def submit(self, func, *args, on_success=None, on_error=None, on_progress=None,
+               disable=(), **kwargs):
+        """Runs func(*args, **kwargs) on a worker thread.
+
+        on_success(result) or on_error(exception) is called on the Tk thread
+        when it finishes; without on_error the error is shown in a message
+        box. With on_progress, func also gets a `progress` keyword argument
+        it can call with a number between 0 and 1 (or a short text), and
+        on_progress receives each value on the Tk thread. Widgets listed in
+        `disable` are greyed out until the task is done.
+        """
+        if self._closed:
+            raise RuntimeError("TaskExecutor has been shut down.")
+        for widget in disable:
+            widget.state(['disabled'])
+
+        task = _Task(on_success, on_error, on_progress, disable)
+        profiler = get_profiler()
+        if profiler is not None and profiler.current_run() is not None:
+            # Submitted by a profiled action: its backend call is part of the action
+            task.run = profiler.current_run()
+            profiler.task_submitted(task.run)
+            func = profiler.in_worker(task.run.action, func)
+        if on_progress is not None:
+            kwargs['progress'] = lambda value: self._events.put(('progress', task, value))
+
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor  # Slow to import (it loads logging)
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="lms-task")
+        self._in_flight += 1
+        self._notify_busy()
+        future = self._pool.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: self._events.put(('done', task, f)))
+        self._schedule_poll()
+        return future
+
+    def shutdown(self):
+        """Stops accepting work; running tasks finish but their callbacks are dropped."""
+        self._closed = True
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Tk thread ---
+
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        if self._closed:
+            return
+        try:
+            while True:
+                kind, task, payload = self._events.get_nowait()
+                if kind == 'progress':
+                    task.on_progress(payload)
+                elif task.run is not None:
+                    self._in_flight -= 1
+                    self._finish_profiled(task, payload)
+                else:
+                    self._in_flight -= 1
+                    self._finish(task, payload)
+        except queue.Empty:
+            pass
+        except tk.TclError:
+            return  # The window was closed from a callback
+        if self._closed:
+            return
+        self._notify_busy()
+        if self._in_flight:
+            self._schedule_poll()
+
+    def _finish(self, task, future):
+        for widget in task.disable:
+            try:
+                widget.state(['!disabled'])
+            except tk.TclError:
+                pass  # Widget destroyed meanwhile
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if task.on_error is not None:
+                task.on_error(error)
+            else:
+                messagebox.showerror("Error", f"Operation failed: {error}")
+        elif task.on_success is not None:
+            task.on_success(future.result())
+
+    def _finish_profiled(self, task, future):
+        profiler = get_profiler()
+        if profiler is None:  # Profiling ended while the task ran
+            return self._finish(task, future)
+        profiler.result_arrived(task.run)
+        try:
+            profiler.on_tk_thread(task.run, self._finish, task, future)
+        finally:
+            profiler.task_done(task.run)
+
+    def _notify_busy(self):
+        if self.busy_indicator is not None:
+            self.busy_indicator.set_busy(self._in_flight)
+
+
+class _Task:
+    __slots__ = ('on_success', 'on_error', 'on_progress', 'disable', 'run')
+
+    def __init__(self, on_success, on_error, on_progress, disable):
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.disable = tuple(disable)
+        self.run = None  # The profiled UI action that submitted it (--profile only)
+
+
+class BusyIndicator(ttk.Frame):
+    """A status bar with a progress bar that runs while tasks are in flight."""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self._label = ttk.Label(self, text="Ready")
+        self._label.pack(side=tk.LEFT, padx=5)
+        self._bar = ttk.Progressbar(self, mode='indeterminate', length=150)
+        self._busy = False
+
+    def set_busy(self, count):
+        if count and not self._busy:
+            self._busy = True
+            self._bar.pack(side=tk.RIGHT, padx=5)
+            self._bar.start(15)
+            self.winfo_toplevel().config(cursor='watch')
+        elif not count and self._busy:
+            self._busy = False
+            self._bar.stop()
+            self._bar.pack_forget()
+            self.winfo_toplevel().config(cursor='')
+        self._label.config(text=f"Working... ({count} in progress)" if count else "Ready")
+
+    def set_progress(self, value):
+        """Shows determinate progress (0..1) or a status text from a task."""
+        if isinstance(value, str):
+            self._label.config(text=value)
+            return
+        self._bar.stop()
+        self._bar.config(mode='determinate', maximum=1.0, value=value)
+        if value >= 1.0:
+            self._bar.config(mode='indeterminate', value=0)
+            if self._busy:
+                self._bar.start(15)
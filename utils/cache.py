@@ -0,0 +1,126 @@
+# This is 'utils/cache.py'
+#
+# A bounded in-process LRU cache with time-to-live, used to serve hot book
+# and member lookups without a database round trip.
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import CACHE_CONFIG
+from utils.metrics import registry
+
+
+def estimate_size(value):
+    """Roughly how many bytes a cached row (dict, tuple, str, number) takes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+    elif isinstance(value, (list, tuple)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and total bytes.
+
+    Entries expire `ttl` seconds after they are stored. Every invalidation
+    bumps `generation`; a reader that loaded a value from the database can
+    pass the generation it saw before the query to put(), and the value is
+    dropped if anything was invalidated meanwhile, so a slow read never
+    puts back a row that a concurrent write just changed.
+    """
+
+    def __init__(self, max_entries=100_000, max_bytes=64 * 1024 * 1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size); oldest first
+        self._bytes = 0
+        self.generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default, time.monotonic())
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._get(key, None, now)
+                if value is not None:
+                    found[key] = value
+        return found
+
+    def put(self, key, value, if_generation=None):
+        size = estimate_size(value)
+        with self._lock:
+            if if_generation is not None and if_generation != self.generation:
+                return  # Something was invalidated since the caller read this value
+            if size > self.max_bytes:
+                return
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if self._remove(key):
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._entries)
+            snapshot['bytes'] = self._bytes
+            lookups = snapshot['hits'] + snapshot['misses']
+            snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+    # --- Callers must hold the lock ---
+
+    def _get(self, key, default, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats['misses'] += 1
+            return default
+        value, expires_at, _ = entry
+        if expires_at <= now:
+            self._remove(key)
+            self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            return default
+        self._entries.move_to_end(key)  # Most recently used goes to the back
+        self._stats['hits'] += 1
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+
+# The shared cache for book and member rows. Keys are ('book', book_id),
+# ('isbn', isbn) -> book_id, and ('member', member_id).
+lookup_cache = LRUCache(**CACHE_CONFIG)
+registry.register_collector('lms_cache', lookup_cache.stats)
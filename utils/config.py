@@ -1,12 +1,121 @@
 # This is 'utils/config.py'
 
+import os
+
+# Storage backend: 'mysql' for the real server, 'sqlite' to run locally
+# without any external service. SQLITE_PATH can be a file or ':memory:'.
+DB_BACKEND = os.environ.get('LMS_DB_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('LMS_SQLITE_PATH', 'library.db')
+
 # MySQL Database Configuration
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',  # Or your specific MySQL username
     'password': 'Kranti.$.d.3',  # Change this!
-    'database': 'library_db'
+    'database': 'library_db',
+    # Seconds to wait for the server to accept a connection (with the
+    # pure-Python driver, also to answer each query), so a hung server
+    # fails and the desk can go offline; raise it if long reports time out
+    'connection_timeout': 10
 }
 
 # Fine calculation settings
-FINE_PER_DAY = 10.00  # e.g., 10 (currency units) per day
\ No newline at end of file
+FINE_PER_DAY = 10.00  # e.g., 10 (currency units) per day
+FINE_GRACE_DAYS = 0   # Days after the due date that are not charged
+FINE_CAP = None       # Most a single loan can be fined (None = no limit)
+FINE_RATES_BY_GENRE = {
+    # Per-day rates that replace FINE_PER_DAY for some genres, e.g.
+    # 'Reference': 25.00,
+}
+
+# Holds on titles with no copy left (see modules/holds.py)
+HOLD_CONFIG = {
+    'pickup_days': 3,             # Days a copy set aside for a hold waits to be collected
+    'max_active_per_member': 10,  # Holds one member may have waiting or ready at once
+    'sweep_batch_size': 500       # Expired holds handled per transaction by sweep_holds.py
+}
+
+# Offline circulation (see modules/circulation_journal.py). When the
+# database can't be reached within checkout_timeout seconds, the desk
+# records issues and returns in a local journal file and replays them,
+# replay_batch_size per transaction, once it can connect again (it tries
+# every retry_seconds). fsync makes every recorded operation survive a
+# power cut; appends from several threads share one fsync.
+JOURNAL_CONFIG = {
+    'path': os.environ.get('LMS_JOURNAL_PATH', 'circulation.journal'),
+    'fsync': True,
+    'checkout_timeout': 2.0,
+    'retry_seconds': 15.0,
+    'replay_batch_size': 200
+}
+
+# Rows per page for paginated searches (search_book_page, view_member_details_page)
+PAGE_SIZE = 100
+
+# Book/member lookup cache settings (see utils/cache.py)
+CACHE_CONFIG = {
+    'max_entries': 100_000,          # Rows kept at most
+    'max_bytes': 64 * 1024 * 1024,   # Rough memory limit for cached rows
+    'ttl': 30.0                      # Seconds before a cached row is re-read
+}
+
+# Connection pool settings (see database/connection_pool.py)
+POOL_CONFIG = {
+    'max_size': 5,                 # Most connections open at once
+    'min_size': 1,                 # Idle connections kept even when unused
+    'checkout_timeout': 10.0,      # Seconds to wait for a free connection
+    'max_idle_time': 300.0,        # Close idle connections after this many seconds
+    'health_check_interval': 30.0  # Re-check connections idle longer than this
+}
+
+# The async pool (see database/async_pool.py) serves the async backend
+# functions; it can be much larger, since a waiting query costs a
+# coroutine rather than a thread
+ASYNC_POOL_CONFIG = {
+    'max_size': 100,               # Most connections open at once
+    'min_size': 1,
+    'checkout_timeout': 10.0,
+    'max_idle_time': 300.0,
+    'health_check_interval': 30.0
+}
+
+# Fuzzy member lookup (see modules/member_index.py). With a snapshot path
+# the index is saved there and loaded on the next start instead of being
+# rebuilt from the members table; members registered since are read in
+# either way. A snapshot older than max_snapshot_age seconds is rebuilt,
+# so changes made by other programs (e.g. a bulk import) are picked up.
+MEMBER_INDEX_CONFIG = {
+    'snapshot_path': os.environ.get('LMS_MEMBER_SNAPSHOT'),  # None = don't keep one
+    'max_snapshot_age': 24 * 3600,
+    'min_similarity': 0.45   # 0..1; lower finds worse misspellings (and more noise)
+}
+
+# Passwords and login sessions (see utils/passwords.py and utils/sessions.py).
+# Raising the cost only affects new hashes; older ones are upgraded at the
+# user's next login. Check a new cost with benchmarks/password_hashing.py.
+AUTH_CONFIG = {
+    'algorithm': 'pbkdf2_sha256',  # Or 'scrypt'
+    'iterations': 600_000,         # pbkdf2_sha256 cost
+    'scrypt_n': 2 ** 14,           # scrypt cost (memory: 128 * n * r bytes)
+    'scrypt_r': 8,
+    'scrypt_p': 1,
+    'login_budget_ms': 500,        # Most a password check should take
+    'session_ttl': 8 * 3600,       # Seconds a session lasts at most
+    'session_idle_timeout': 3600,  # Seconds a session lasts unused
+    'max_sessions': 10_000
+}
+
+# Logging (see utils/log.py). Level: DEBUG, INFO, WARNING or ERROR;
+# format: 'text' (readable key=value lines) or 'json' (one object per line).
+LOG_CONFIG = {
+    'level': os.environ.get('LMS_LOG_LEVEL', 'INFO'),
+    'format': os.environ.get('LMS_LOG_FORMAT', 'text')
+}
+
+# Metrics and timing (see utils/metrics.py and database/instrumentation.py)
+METRICS_CONFIG = {
+    'enabled': os.environ.get('LMS_METRICS', '1') != '0',  # Time every call and SQL statement
+    'slow_query_seconds': 0.100,   # Log SQL statements slower than this
+    'slow_call_seconds': 0.500,    # Log backend calls slower than this
+    'dump_path': os.environ.get('LMS_METRICS_DUMP')  # Write metrics here on exit (.prom or .json)
+}
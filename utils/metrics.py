@@ -0,0 +1,268 @@
+# This is 'utils/metrics.py'
+#
+# An in-process metrics registry: counters, latency histograms, and
+# "collectors" that report numbers other parts of the app already keep
+# (pool, cache and transaction counters). Dump it with to_prometheus() for a
+# Prometheus scrape or to_json() for a file; with METRICS_CONFIG['dump_path']
+# set, it is written there when the program exits.
+#
+# @instrumented times a backend function and counts its outcomes; every
+# SQL statement is timed by database/instrumentation.py.
+
+import atexit
+import functools
+import inspect
+import json
+import threading
+import time
+from bisect import bisect_left
+
+from utils.config import METRICS_CONFIG
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Upper bounds in seconds, from half a millisecond to ten seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(zip(self.labels, key)), 'value': value}
+                    for key, value in self._values.items()]
+
+    def prometheus_lines(self):
+        with self._lock:
+            return [f"{self.name}{_label_text(self.labels, key)} {value}"
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Counts observations (seconds) into cumulative buckets, plus sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum, max]
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            series[index] += 1
+            series[-2] += value
+            if value > series[-1]:
+                series[-1] = value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        result = []
+        for key, series in items:
+            count = sum(series[:-2])
+            result.append({'labels': dict(zip(self.labels, key)), 'count': count,
+                           'sum': round(series[-2], 6), 'max': round(series[-1], 6),
+                           'mean': round(series[-2] / count, 6) if count else 0.0,
+                           'p50': self._quantile(series, count, 0.50),
+                           'p95': self._quantile(series, count, 0.95),
+                           'p99': self._quantile(series, count, 0.99)})
+        return result
+
+    def _quantile(self, series, count, q):
+        """Upper bound of the bucket holding the q-quantile (an estimate)."""
+        if not count:
+            return 0.0
+        target, seen = q * count, 0
+        for bound, n in zip(self.buckets, series):
+            seen += n
+            if seen >= target:
+                return bound
+        return round(series[-1], 6)  # In the +Inf bucket: the max is the best we know
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the app's metrics by name; thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = {}
+
+    def counter(self, name, help, labels=()):
+        """Returns the counter `name`, creating it on first use."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help, labels)
+            return self._metrics[name]
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        """Returns the histogram `name`, creating it on first use."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, labels, buckets)
+            return self._metrics[name]
+
+    def register_collector(self, prefix, func):
+        """func() returns {name: number}; each is reported as gauge `prefix_name`."""
+        with self._lock:
+            self._collectors[prefix] = func
+
+    def _collected(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        values = {}
+        for prefix, func in collectors:
+            try:
+                numbers = func() or {}
+            except Exception as e:  # A broken collector must not break the dump
+                log.warning("Metrics collector failed", collector=prefix, error=str(e))
+                continue
+            for key, value in numbers.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[f"{prefix}_{key}"] = value
+        return values
+
+    def snapshot(self):
+        """Everything as plain data: {'metrics': {...}, 'gauges': {...}}."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {'metrics': {m.name: {'type': m.kind, 'help': m.help, 'series': m.snapshot()} for m in metrics},
+                'gauges': self._collected()}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus_lines())
+        for name, value in sorted(self._collected().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Writes the metrics to `path`: JSON if it ends in .json, else Prometheus text."""
+        text = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def reset(self):
+        """Forgets all recorded values (metrics and collectors stay registered)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+_call_seconds = registry.histogram('lms_call_seconds', "Time spent in backend functions.", ('function',))
+_calls = registry.counter('lms_calls_total', "Backend function calls by outcome (ok, false, error).",
+                          ('function', 'outcome'))
+
+
+def instrumented(func):
+    """Times a backend function and counts ok / False / exception outcomes.
+
+    Works on plain functions and on `async def` ones (timed until they finish).
+    """
+    if not METRICS_CONFIG['enabled']:
+        return func
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+    slow = METRICS_CONFIG['slow_call_seconds']
+
+    def record(started, outcome):
+        elapsed = time.perf_counter() - started
+        _call_seconds.observe(elapsed, name)
+        _calls.inc(name, outcome)
+        if elapsed >= slow:
+            log.warning("Slow call", function=name, seconds=round(elapsed, 4), outcome=outcome)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = await func(*args, **kwargs)
+                outcome = 'false' if result is False else 'ok'
+                return result
+            finally:
+                record(started, outcome)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = func(*args, **kwargs)
+            outcome = 'false' if result is False else 'ok'
+            return result
+        finally:
+            record(started, outcome)
+    return wrapper
+
+
+if METRICS_CONFIG['dump_path']:
+    atexit.register(lambda: registry.dump(METRICS_CONFIG['dump_path']))
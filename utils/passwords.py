@@ -0,0 +1,101 @@
+# This is 'utils/passwords.py'
+#
+# Salted, deliberately slow password hashing. A stored hash records the
+# algorithm and its cost next to the salt, so the cost can be raised in
+# AUTH_CONFIG without breaking existing passwords:
+#
+#   pbkdf2_sha256$600000$<salt>$<hash>
+#   scrypt$16384$8$1$<salt>$<hash>
+#
+# Hashes from the original login system (unsalted hex SHA-256) are still
+# accepted; needs_rehash() tells the caller to replace them on login.
+# benchmarks/password_hashing.py measures the cost settings against
+# AUTH_CONFIG['login_budget_ms'].
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+
+from utils.config import AUTH_CONFIG
+
+SALT_BYTES = 16
+_LEGACY_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _derive(algorithm, params, password, salt):
+    """The raw key for `password` under one algorithm and cost."""
+    secret = password.encode('utf-8')
+    if algorithm == 'pbkdf2_sha256':
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, iterations)
+    if algorithm == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, dklen=32,
+                              maxmem=max(64 * 1024 * 1024, 256 * n * r))
+    raise ValueError(f"Unknown password hash algorithm: {algorithm!r}")
+
+
+def _current_params(config):
+    if config['algorithm'] == 'scrypt':
+        return (config['scrypt_n'], config['scrypt_r'], config['scrypt_p'])
+    return (config['iterations'],)
+
+
+def hash_password(password, config=None):
+    """Returns a new salted hash of `password` with the configured algorithm and cost."""
+    config = config or AUTH_CONFIG
+    algorithm, params = config['algorithm'], _current_params(config)
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(algorithm, params, password, salt)
+    return '$'.join([algorithm, *map(str, params), _b64(salt), _b64(key)])
+
+
+def _parse(stored):
+    """Splits a stored hash into (algorithm, params, salt, key); None if unrecognised."""
+    parts = stored.split('$')
+    try:
+        if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            return parts[0], (int(parts[1]),), _unb64(parts[2]), _unb64(parts[3])
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            return parts[0], tuple(int(v) for v in parts[1:4]), _unb64(parts[4]), _unb64(parts[5])
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def verify_password(password, stored):
+    """True if `password` matches the stored hash (new format or legacy SHA-256)."""
+    if not stored:
+        return False
+    if _LEGACY_SHA256.fullmatch(stored):
+        legacy = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    parsed = _parse(stored)
+    if parsed is None:
+        return False
+    algorithm, params, salt, key = parsed
+    return hmac.compare_digest(_derive(algorithm, params, password, salt), key)
+
+
+def needs_rehash(stored, config=None):
+    """True if the hash is legacy or was made with other settings than the current ones."""
+    config = config or AUTH_CONFIG
+    parsed = _parse(stored or '')
+    return parsed is None or parsed[0] != config['algorithm'] or parsed[1] != _current_params(config)
+
+
+def burn_time(password):
+    """Spends one hash's worth of time. Used for logins with an unknown
+    username, so they take as long as a wrong password and don't reveal
+    which users exist."""
+    _derive(AUTH_CONFIG['algorithm'], _current_params(AUTH_CONFIG), password, b'\0' * SALT_BYTES)
@@ -0,0 +1,126 @@
+# This is 'utils/sessions.py'
+#
+# In-memory login sessions. A successful login gets a random token; later
+# requests present the token instead of the password, so they cost a
+# dictionary lookup instead of a password hash and a database query.
+#
+# Sessions end `ttl` seconds after login, or sooner if unused for
+# `idle_timeout` seconds. Only a SHA-256 digest of each token is kept, so
+# the store itself holds nothing that can be replayed.
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import AUTH_CONFIG
+from utils.metrics import registry
+
+
+def _key(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class Session:
+    __slots__ = ('user_id', 'username', 'created', 'expires', 'last_seen')
+
+    def __init__(self, user_id, username, created, expires):
+        self.user_id = user_id
+        self.username = username
+        self.created = created
+        self.expires = expires
+        self.last_seen = created
+
+    def as_dict(self):
+        return {'user_id': self.user_id, 'username': self.username,
+                'created': self.created, 'expires': self.expires}
+
+
+class SessionStore:
+    """Thread-safe token -> Session map with absolute and idle expiry.
+
+    Holds at most `max_sessions`; beyond that the least recently used
+    session is dropped. Times come from time.time() so they can be shown.
+    """
+
+    def __init__(self, ttl=8 * 3600, idle_timeout=3600, max_sessions=10_000):
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # token digest -> Session, least recently used first
+        self._stats = {'created': 0, 'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'revoked': 0}
+
+    def create(self, user_id, username):
+        """Starts a session and returns its token."""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            self._sessions[_key(token)] = Session(user_id, username, now, now + self.ttl)
+            self._stats['created'] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats['evicted'] += 1
+        return token
+
+    def get(self, token):
+        """Returns the live Session for `token` (refreshing its idle timer), or None."""
+        if not token:
+            return None
+        key = _key(token)
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                self._stats['misses'] += 1
+                return None
+            if now >= session.expires or now - session.last_seen >= self.idle_timeout:
+                del self._sessions[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            session.last_seen = now
+            self._sessions.move_to_end(key)
+            self._stats['hits'] += 1
+            return session
+
+    def revoke(self, token):
+        """Ends one session; True if it existed."""
+        with self._lock:
+            if self._sessions.pop(_key(token), None) is None:
+                return False
+            self._stats['revoked'] += 1
+            return True
+
+    def revoke_user(self, user_id):
+        """Ends every session of a user (e.g. after a password change); returns how many."""
+        with self._lock:
+            keys = [key for key, session in self._sessions.items() if session.user_id == user_id]
+            for key in keys:
+                del self._sessions[key]
+            self._stats['revoked'] += len(keys)
+            return len(keys)
+
+    def purge_expired(self):
+        """Drops every expired session; returns how many."""
+        now = time.time()
+        with self._lock:
+            keys = [key for key, session in self._sessions.items()
+                    if now >= session.expires or now - session.last_seen >= self.idle_timeout]
+            for key in keys:
+                del self._sessions[key]
+            self._stats['expired'] += len(keys)
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['active'] = len(self._sessions)
+        return snapshot
+
+
+# The shared store used by modules/login_system.py
+sessions = SessionStore(AUTH_CONFIG['session_ttl'], AUTH_CONFIG['session_idle_timeout'],
+                        AUTH_CONFIG['max_sessions'])
+registry.register_collector('lms_sessions', sessions.stats)